@@ -0,0 +1,58 @@
+"""Eager against lazy recipes for listing style access to a recipe book"""
+import gc
+import sys
+import time
+import tempfile
+import pathlib
+
+from stray_recipe_manager.recipe import recipe_from_dict
+from stray_recipe_manager.units import UnitHandler
+from stray_recipe_manager.storage import DirectoryStorage
+
+from synthetic import recipe_data, write_book
+
+
+def listing(recipe):
+    return (recipe.name, recipe.tags, recipe.makes.item)
+
+
+def full(recipe):
+    return (recipe.name, recipe.tags, recipe.ingredients, recipe.steps)
+
+
+def main(count=5000):
+    # Recipe tables alone, without reading TOML. Parsing consumes them, so
+    # each run gets its own.
+    unit_handler = UnitHandler()
+    for access in [listing, full]:
+        for lazy in [False, True]:
+            tables = [recipe_data(i) for i in range(count)]
+            gc.collect()
+            start = time.perf_counter()
+            for data in tables:
+                access(recipe_from_dict(data, unit_handler, lazy))
+            elapsed = time.perf_counter() - start
+            label = f"{access.__name__} {'lazy' if lazy else 'eager'}"
+            print(f"{label:>13} tables: {count / elapsed:,.0f} recipes/s")
+
+    # Whole book through storage, which also reads and parses the files
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_book(pathlib.Path(tmp) / "book", count)
+        for access in [listing, full]:
+            for lazy in [False, True]:
+                storage = DirectoryStorage(
+                    path / "config.toml",
+                    path / "recipes",
+                    cache_size=None,
+                    lazy=lazy,
+                )
+                start = time.perf_counter()
+                for key in storage.sorted_recipe_keys():
+                    access(storage.get_recipe(key))
+                elapsed = time.perf_counter() - start
+                label = f"{access.__name__} {'lazy' if lazy else 'eager'}"
+                print(f"{label:>13}   book: {count / elapsed:,.0f} recipes/s")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,26 @@
+"""Serial against process pool loading of a whole recipe book"""
+import os
+import sys
+import time
+import tempfile
+import pathlib
+
+from stray_recipe_manager.storage import get_storage
+
+from synthetic import write_book
+
+
+def main(count=5000, jobs=os.cpu_count() or 1):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = pathlib.Path(tmp) / "book"
+        write_book(path, count)
+        for label, n_jobs in [("serial", 1), (f"{jobs} jobs", jobs)]:
+            storage = get_storage(str(path))
+            start = time.perf_counter()
+            loaded = sum(1 for _ in storage.get_recipes(jobs=n_jobs))
+            elapsed = time.perf_counter() - start
+            print(f"{label:>8}: {loaded} recipes in {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
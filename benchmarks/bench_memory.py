@@ -0,0 +1,83 @@
+"""Memory held by a loaded book, as recipe objects and as columns"""
+import sys
+import time
+import tracemalloc
+
+from stray_recipe_manager.recipe import Recipe
+from stray_recipe_manager.units import UnitHandler
+from stray_recipe_manager.interning import Interner
+from stray_recipe_manager.columnar import ColumnarStorage
+
+from synthetic import recipe_data
+
+
+def traced(build):
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        result = build()
+        return result, tracemalloc.get_traced_memory()[0] - start
+    finally:
+        tracemalloc.stop()
+
+
+def main(count=20000):
+    # Fill the parse cache first, so neither layout is charged for it
+    unit_handler = UnitHandler()
+    for i in range(min(count, 1000)):
+        Recipe.from_dict(recipe_data(i), unit_handler)
+
+    recipes, object_bytes = traced(
+        lambda: {
+            f"recipe_{i:06d}": Recipe.from_dict(recipe_data(i), unit_handler)
+            for i in range(count)
+        }
+    )
+    print(f"objects: {object_bytes / 2 ** 20:8.1f} MiB")
+
+    interner = Interner()
+    interned, interned_bytes = traced(
+        lambda: {
+            f"recipe_{i:06d}": interner.recipe(
+                Recipe.from_dict(recipe_data(i), unit_handler)
+            )
+            for i in range(count)
+        }
+    )
+    stats = interner.stats()
+    print(
+        f"interned: {interned_bytes / 2 ** 20:7.1f} MiB "
+        f"({stats.bytes_saved / 2 ** 20:.1f} MiB saved, "
+        f"{stats.table_bytes / 2 ** 20:.1f} MiB tables, "
+        f"{stats.ingredients} ingredients, {stats.steps} steps, "
+        f"{stats.strings} strings)"
+    )
+    del interned
+
+    def build_columnar():
+        columnar = ColumnarStorage(unit_handler)
+        for key, recipe in recipes.items():
+            columnar.add_recipe(key, recipe)
+        return columnar
+
+    columnar, columnar_bytes = traced(build_columnar)
+    print(
+        f"columnar: {columnar_bytes / 2 ** 20:7.1f} MiB "
+        f"({columnar.nbytes() / 2 ** 20:.1f} MiB arrays, "
+        f"{len(columnar.strings)} strings, "
+        f"{object_bytes / columnar_bytes:.1f}x smaller)"
+    )
+
+    for label, get_recipe in [
+        ("objects", recipes.__getitem__),
+        ("columnar", columnar.get_recipe),
+    ]:
+        start = time.perf_counter()
+        for key in recipes:
+            get_recipe(key)
+        elapsed = time.perf_counter() - start
+        print(f"{label:>8} get_recipe: {count / elapsed:,.0f} recipes/s")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
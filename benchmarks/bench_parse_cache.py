@@ -0,0 +1,34 @@
+"""Quantity parse throughput with and without the UnitHandler parse cache"""
+import sys
+import copy
+import time
+
+from stray_recipe_manager.recipe import Recipe
+from stray_recipe_manager.units import UnitHandler
+
+from synthetic import recipe_data
+
+
+def parse_book(unit_handler, book):
+    start = time.perf_counter()
+    for data in book:
+        Recipe.from_dict(copy.deepcopy(data), unit_handler)
+    return time.perf_counter() - start
+
+
+def main(count=10000):
+    book = [recipe_data(i) for i in range(count)]
+    for label, cache_size in [("uncached", 0), ("cached", 4096)]:
+        unit_handler = UnitHandler(parse_cache_size=cache_size)
+        elapsed = parse_book(unit_handler, book)
+        stats = unit_handler.parse_cache_stats()
+        quantities = stats.hits + stats.misses
+        print(
+            f"{label:>9}: {count} recipes in {elapsed:.2f}s "
+            f"({quantities / elapsed:,.0f} quantities/s) "
+            f"{stats}"
+        )
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,42 @@
+"""present_recipe loop against the batched present_recipes"""
+import sys
+import time
+
+from stray_recipe_manager.recipe import (
+    Recipe,
+    present_recipe,
+    present_recipes,
+)
+from stray_recipe_manager.units import UnitHandler, UnitPreferences
+
+from synthetic import recipe_data, DENSITIES
+
+
+def main(count=500):
+    unit_handler = UnitHandler()
+    for k, v in DENSITIES.items():
+        unit_handler.add_density(k, unit_handler.parse_quantity(v))
+    prefs = UnitPreferences(unit_handler)
+    prefs.set_unit_preference("solid_bulk", unit_handler.parse_unit("gram"))
+    prefs.set_unit_preference("liquid_bulk", unit_handler.parse_unit("ml"))
+    prefs.set_unit_preference("seasoning", unit_handler.parse_unit("tsp"))
+    recipes = [
+        Recipe.from_dict(recipe_data(i), unit_handler) for i in range(count)
+    ]
+    pairs = [(r, 0.5 + (i % 8) / 2) for i, r in enumerate(recipes)]
+
+    start = time.perf_counter()
+    for recipe, scale in pairs:
+        present_recipe(recipe, prefs, scale)
+    loop = time.perf_counter() - start
+
+    start = time.perf_counter()
+    present_recipes(pairs, prefs)
+    batch = time.perf_counter() - start
+
+    print(f"present_recipe loop: {count / loop:,.0f} recipes/s")
+    print(f"present_recipes:     {count / batch:,.0f} recipes/s")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,34 @@
+"""Query latency of the recipe index on a large synthetic book"""
+import sys
+import time
+
+from stray_recipe_manager.recipe import Recipe
+from stray_recipe_manager.search import RecipeIndex
+from stray_recipe_manager.units import UnitHandler
+
+from synthetic import recipe_data
+
+
+def main(count=50000):
+    unit_handler = UnitHandler()
+    index = RecipeIndex()
+    start = time.perf_counter()
+    for i in range(count):
+        recipe = Recipe.from_dict(recipe_data(i), unit_handler)
+        index.add(f"recipe_{i:06d}", recipe)
+    print(f"indexed {count} recipes in {time.perf_counter() - start:.2f}s")
+
+    for label, query in [
+        ("find", lambda: index.find(ingredients=["butter"], tags=["vegan"])),
+        ("text", lambda: index.search_text("simmer tender oven", 10)),
+        ("rare text", lambda: index.search_text("recipe 123", 10)),
+    ]:
+        start = time.perf_counter()
+        for _ in range(10):
+            query()
+        elapsed = (time.perf_counter() - start) / 10
+        print(f"{label:>9}: {elapsed * 1000:.1f} ms/query")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,83 @@
+"""CLI startup: import cost and time to first output of print_recipe"""
+import os
+import sys
+import time
+import tempfile
+import subprocess
+
+import toml
+
+from stray_recipe_manager.units import UNIT_DEFINITIONS, build_unit_registry
+
+from synthetic import recipe_data
+
+
+# What the stray_recipe_manager console script runs
+ENTRY_POINT = "from stray_recipe_manager.cli import dispatch; dispatch()"
+
+
+def slowest_imports(module, count):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line[13:]:
+            continue
+        _, cumulative, name = line[12:].split("|")
+        if cumulative.strip().isdigit():
+            rows.append((int(cumulative), name.rstrip()))
+    return sorted(rows, reverse=True)[:count]
+
+
+def first_output(args):
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-c", ENTRY_POINT] + args,
+        stdout=subprocess.PIPE,
+    )
+    process.stdout.readline()
+    elapsed = time.perf_counter() - start
+    process.communicate()
+    return elapsed
+
+
+def registry_times(cache_folder):
+    for name, definitions in [("pint", None), ("recipe", UNIT_DEFINITIONS)]:
+        for label, cache in [
+            ("no cache", None),
+            ("cold cache", cache_folder),
+            ("warm cache", cache_folder),
+        ]:
+            start = time.perf_counter()
+            build_unit_registry(definitions, cache)
+            elapsed = time.perf_counter() - start
+            print(
+                f"{name:>6} {label:>10}: registry built in "
+                f"{elapsed * 1000:.0f} ms"
+            )
+
+
+def main(runs=5):
+    print("slowest imports of stray_recipe_manager.cli:")
+    for cumulative, name in slowest_imports("stray_recipe_manager.cli", 10):
+        print(f"{cumulative / 1000:8.1f} ms {name}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        registry_times(os.path.join(tmp, "cache"))
+        recipe_file = os.path.join(tmp, "recipe.toml")
+        with open(recipe_file, "w") as f:
+            toml.dump(recipe_data(0), f)
+        for label, args in [
+            ("--help", ["--help"]),
+            ("print_recipe", ["print_recipe", recipe_file]),
+        ]:
+            best = min(first_output(args) for _ in range(runs))
+            print(f"{label:>12}: first output after {best * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
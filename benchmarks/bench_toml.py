@@ -0,0 +1,77 @@
+"""TOML load and dump throughput of each installed library"""
+import sys
+import time
+import tempfile
+import pathlib
+import importlib
+
+from stray_recipe_manager.storage import (
+    TOML_READERS,
+    TOML_WRITERS,
+    DirectoryStorage,
+    TOMLCodec,
+    set_toml_codec,
+    strip_none,
+)
+
+from synthetic import recipe_data, write_book
+
+
+def installed(modules):
+    found = []
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            print(f"{name:>8}: not installed")
+        else:
+            found.append(name)
+    return found
+
+
+def main(count=5000):
+    tables = [strip_none(recipe_data(i)) for i in range(count)]
+    reference = TOMLCodec.create("toml", "toml")
+    texts = [reference.dumps(data) for data in tables]
+    size = sum(len(text) for text in texts) / 2 ** 20
+
+    readers = installed(TOML_READERS)
+    writers = installed(TOML_WRITERS)
+    for reader in readers:
+        loads = TOMLCodec.create(reader, "toml").loads
+        start = time.perf_counter()
+        for text in texts:
+            loads(text)
+        elapsed = time.perf_counter() - start
+        print(
+            f"{reader:>8}  load: {count / elapsed:9,.0f} recipes/s "
+            f"{size / elapsed:6.1f} MiB/s"
+        )
+    for writer in writers:
+        dumps = TOMLCodec.create("toml", writer).dumps
+        start = time.perf_counter()
+        for data in tables:
+            dumps(data)
+        elapsed = time.perf_counter() - start
+        print(f"{writer:>8}  dump: {count / elapsed:9,.0f} recipes/s")
+
+    # Whole book, parsing quantities and building recipes as well
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_book(pathlib.Path(tmp) / "book", count)
+        try:
+            for reader in readers:
+                set_toml_codec(TOMLCodec.create(reader, "toml"))
+                storage = DirectoryStorage(
+                    path / "config.toml", path / "recipes", cache_size=0
+                )
+                start = time.perf_counter()
+                for key in storage.sorted_recipe_keys():
+                    storage.get_recipe(key)
+                elapsed = time.perf_counter() - start
+                print(f"{reader:>8}  book: {count / elapsed:9,.0f} recipes/s")
+        finally:
+            set_toml_codec(None)
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
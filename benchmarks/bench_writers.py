@@ -0,0 +1,59 @@
+"""Recipes rendered per second by each writer"""
+import io
+import sys
+import time
+
+from stray_recipe_manager.recipe import Recipe
+from stray_recipe_manager.units import UnitHandler
+from stray_recipe_manager.formatter import (
+    BaseWriter,
+    QuantityFormatter,
+    quantity_formatter,
+)
+
+from synthetic import recipe_data
+
+
+def main(count=2000):
+    unit_handler = UnitHandler()
+    recipes = [
+        Recipe.from_dict(recipe_data(i), unit_handler) for i in range(count)
+    ]
+    quantities = [
+        ingredient.quantity
+        for recipe in recipes
+        for ingredient in recipe.ingredients
+    ]
+    for label, format_quantity in [
+        ("str()", str),
+        ("formatter", quantity_formatter.format),
+        ("cold formatter", lambda q: QuantityFormatter().format(q)),
+    ]:
+        start = time.perf_counter()
+        for quantity in quantities:
+            format_quantity(quantity)
+        elapsed = time.perf_counter() - start
+        print(f"{label:>14}: {len(quantities) / elapsed:,.0f} quantities/s")
+
+    for writer in BaseWriter.__subclasses__():
+        for label, render in [
+            (
+                "write",
+                lambda r: writer.write_recipe(
+                    io.BytesIO() if writer.binary else io.StringIO(), r
+                ),
+            ),
+            ("iter", lambda r: sum(1 for _ in writer.iter_recipe(r))),
+        ]:
+            start = time.perf_counter()
+            for recipe in recipes:
+                render(recipe)
+            elapsed = time.perf_counter() - start
+            print(
+                f"{writer.mimetype:>14} {label}: "
+                f"{count / elapsed:,.0f} recipes/s"
+            )
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,83 @@
+"""Synthetic recipe books shared by the benchmark scripts"""
+import random
+import pathlib
+import typing
+
+import toml
+
+
+INGREDIENTS = [
+    ("Flour", "1 cup", "flour", "solid_bulk"),
+    ("Flour", "2 cup", "flour", "solid_bulk"),
+    ("Sugar", "250 g", "sugar", "solid_bulk"),
+    ("Sugar", "1/2 cup", "sugar", "solid_bulk"),
+    ("White rice", "1 cup", "rice", "solid_bulk"),
+    ("Water", "3/2 cup", "water", "liquid_bulk"),
+    ("Milk", "1 cup", "milk", "liquid_bulk"),
+    ("Chicken stock", "500 ml", "chicken stock", "liquid_bulk"),
+    ("Butter", "2 tbsp", "butter", "solid_bulk"),
+    ("Salt", "1/2 tsp", "salt", "seasoning"),
+    ("Pepper", "1/4 tsp", "pepper", "seasoning"),
+    ("Garlic powder", "1 tsp", "garlic powder", "seasoning"),
+    ("Eggs", "2 count", None, None),
+]
+
+DENSITIES = {
+    "flour": "125 grams/cup",
+    "sugar": "200 grams/cup",
+    "rice": "180 grams/cup",
+    "water": "240 grams/cup",
+    "milk": "245 grams/cup",
+    "chicken stock": "240 grams/cup",
+    "butter": "227 grams/cup",
+    "salt": "290 grams/cup",
+}
+
+TAGS = ["basic", "side", "dessert", "vegan", "quick", "dinner"]
+TOOLS = ["Saucepan", "Dutch oven", "Sieve", "Whisk", "Instant Pot"]
+STEPS = [
+    ("Preheat the oven", None),
+    ("Mix the dry ingredients", None),
+    ("Bring to a boil", "5 min"),
+    ("Simmer until tender", "20 min"),
+    ("Let stand, then serve", "10 min"),
+]
+
+
+def recipe_data(index):
+    # type: (int) -> typing.Dict[str, typing.Any]
+    rng = random.Random(index)
+    ingredients = []
+    for item, quantity, identifier, category in rng.sample(INGREDIENTS, 8):
+        ingredient = {"item": item, "quantity": quantity}
+        if identifier is not None:
+            ingredient["identifier"] = identifier
+        if category is not None:
+            ingredient["category"] = category
+        ingredients.append(ingredient)
+    steps = []
+    for description, time in rng.sample(STEPS, 4):
+        step = {"description": description}
+        if time is not None:
+            step["time"] = time
+        steps.append(step)
+    return {
+        "name": f"Recipe {index}",
+        "makes": {"item": f"Dish {index}", "quantity": "4 count"},
+        "tags": rng.sample(TAGS, 2),
+        "tools": rng.sample(TOOLS, 2),
+        "ingredients": ingredients,
+        "steps": steps,
+    }
+
+
+def write_book(path, count):
+    # type: (pathlib.Path, int) -> pathlib.Path
+    recipe_dir = path / "recipes"
+    recipe_dir.mkdir(parents=True, exist_ok=True)
+    with (path / "config.toml").open("w") as f:
+        toml.dump({"tolerance": 1e-3, "densities": DENSITIES}, f)
+    for i in range(count):
+        with (recipe_dir / f"recipe_{i:06d}.toml").open("w") as f:
+            toml.dump(recipe_data(i), f)
+    return path
@@ -0,0 +1,206 @@
+import io
+import os
+import sys
+import json
+import typing
+import asyncio
+import logging
+import concurrent.futures
+
+from stray_recipe_manager.server import create_app
+
+
+logger = logging.getLogger(__name__)
+
+# Where app_from_environ finds its create_asgi_app arguments, so that
+# multi-worker servers can import the app by name
+CONFIG_ENVIRON = "STRAY_RECIPE_MANAGER_ASGI_CONFIG"
+
+WSGIApp = typing.Callable[..., typing.Iterable[bytes]]
+Message = typing.Dict[str, typing.Any]
+Receive = typing.Callable[[], typing.Awaitable[Message]]
+Send = typing.Callable[[Message], typing.Awaitable[None]]
+WSGIHeaders = typing.List[typing.Tuple[str, str]]
+WSGIResult = typing.Tuple[str, WSGIHeaders, typing.List[bytes]]
+
+
+class ASGIAdapter:
+    """Serve a WSGI app over ASGI with blocking work on a thread pool
+
+    Storage reads, TOML parsing and rendering all happen inside the WSGI app,
+    so each request runs on one of threads pool threads. At most concurrency
+    requests are admitted at once, the rest wait on the event loop without
+    holding a thread.
+    """
+
+    def __init__(self, wsgi_app, threads=8, concurrency=256):
+        # type: (WSGIApp, int, int) -> None
+        if threads < 1 or concurrency < 1:
+            raise ValueError(
+                f"Invalid threads {threads} or concurrency {concurrency}"
+            )
+        self.wsgi_app = wsgi_app
+        self.threads = threads
+        self.concurrency = concurrency
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=threads, thread_name_prefix="recipe-worker"
+        )
+        # Created lazily, it must belong to the loop serving requests
+        self.semaphore = None  # type: typing.Optional[asyncio.Semaphore]
+        self.loop = None  # type: typing.Optional[asyncio.AbstractEventLoop]
+
+    async def __call__(self, scope, receive, send):
+        # type: (Message, Receive, Send) -> None
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self.handle_http(scope, receive, send)
+        else:
+            raise ValueError(f"Unsupported scope type {scope['type']}")
+
+    async def lifespan(self, receive, send):
+        # type: (Receive, Send) -> None
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=True)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def handle_http(self, scope, receive, send):
+        # type: (Message, Receive, Send) -> None
+        body = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body.append(message.get("body", b""))
+            more_body = message.get("more_body", False)
+        environ = self.build_environ(scope, b"".join(body))
+        loop = asyncio.get_running_loop()
+        if self.semaphore is None or self.loop is not loop:
+            self.loop = loop
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+        async with self.semaphore:
+            status, headers, chunks = await loop.run_in_executor(
+                self.executor, self.run_wsgi, environ
+            )
+        await send(
+            {
+                "type": "http.response.start",
+                "status": int(status.split(" ", 1)[0]),
+                "headers": [
+                    (name.lower().encode("latin-1"), value.encode("latin-1"))
+                    for name, value in headers
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": b"".join(chunks)})
+
+    def run_wsgi(self, environ):
+        # type: (typing.Dict[str, typing.Any]) -> WSGIResult
+        response = []  # type: typing.List[typing.Any]
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info is not None and response:
+                raise exc_info[1].with_traceback(exc_info[2])
+            response[:] = [status, headers]
+
+        result = self.wsgi_app(environ, start_response)
+        try:
+            # Streamed templates are rendered here, still off the event loop
+            chunks = [chunk for chunk in result if chunk]
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+        status, headers = response
+        return status, headers, chunks
+
+    @staticmethod
+    def build_environ(scope, body):
+        # type: (Message, bytes) -> typing.Dict[str, typing.Any]
+        server = scope.get("server") or ("localhost", 80)
+        client = scope.get("client") or ("", 0)
+        environ = {
+            "REQUEST_METHOD": scope["method"],
+            "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode(
+                "latin-1"
+            ),
+            "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+            "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+            "SERVER_NAME": server[0],
+            "SERVER_PORT": str(server[1]),
+            "SERVER_PROTOCOL": "HTTP/{}".format(
+                scope.get("http_version", "1.1")
+            ),
+            "REMOTE_ADDR": client[0],
+            "REMOTE_PORT": str(client[1]),
+            "CONTENT_LENGTH": str(len(body)),
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": scope.get("scheme", "http"),
+            "wsgi.input": io.BytesIO(body),
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+        }  # type: typing.Dict[str, typing.Any]
+        for raw_name, raw_value in scope.get("headers", []):
+            name = raw_name.decode("latin-1").upper().replace("-", "_")
+            value = raw_value.decode("latin-1")
+            if name == "CONTENT_TYPE":
+                environ["CONTENT_TYPE"] = value
+                continue
+            if name == "CONTENT_LENGTH":
+                continue
+            key = "HTTP_" + name
+            if key in environ:
+                value = environ[key] + "," + value
+            environ[key] = value
+        return environ
+
+
+def create_asgi_app(
+    storage_path,  # type: str
+    host_base,  # type: str
+    threads=8,  # type: int
+    concurrency=256,  # type: int
+    **kwargs  # type: typing.Any
+):
+    # type: (...) -> ASGIAdapter
+    """ASGI version of create_app, further arguments are passed to it"""
+    return ASGIAdapter(
+        create_app(storage_path, host_base, **kwargs),
+        threads=threads,
+        concurrency=concurrency,
+    )
+
+
+def app_from_environ():
+    # type: () -> ASGIAdapter
+    return create_asgi_app(**json.loads(os.environ[CONFIG_ENVIRON]))
+
+
+def run_asgi(host, port, workers=1, **config):
+    # type: (str, int, int, typing.Any) -> None
+    try:
+        import uvicorn
+    except ImportError:
+        raise RuntimeError(
+            "The asgi server needs uvicorn, install it with "
+            "pip install stray_recipe_manager[asgi]"
+        )
+    if workers > 1:
+        # Worker processes import the app themselves
+        os.environ[CONFIG_ENVIRON] = json.dumps(config)
+        uvicorn.run(
+            f"{__name__}:app_from_environ",
+            host=host,
+            port=port,
+            workers=workers,
+            factory=True,
+        )
+    else:
+        uvicorn.run(create_asgi_app(**config), host=host, port=port)
@@ -0,0 +1,95 @@
+import attr
+import typing
+import threading
+import collections
+
+
+K = typing.TypeVar("K")
+V = typing.TypeVar("V")
+
+
+@attr.attrs(frozen=True, slots=True)
+class CacheStats(object):
+    hits = attr.ib(type=int, kw_only=True)
+    misses = attr.ib(type=int, kw_only=True)
+    size = attr.ib(type=int, kw_only=True)
+    maxsize = attr.ib(type=typing.Optional[int], kw_only=True)
+
+
+class LRUCache(typing.Generic[K, V]):
+    """Thread-safe least-recently-used mapping with hit/miss counters
+
+    A maxsize of None leaves the cache unbounded, while 0 disables it. Entries
+    rejected by the optional ``valid`` check of get() are dropped and counted
+    as misses.
+    """
+
+    def __init__(self, maxsize=128):
+        # type: (typing.Optional[int]) -> None
+        if maxsize is not None and maxsize < 0:
+            raise ValueError(f"Invalid cache size {maxsize}")
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = (
+            collections.OrderedDict()
+        )  # type: collections.OrderedDict[K, V]
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        # type: () -> int
+        return len(self._data)
+
+    def get(
+        self,
+        key,  # type: K
+        default=None,  # type: typing.Optional[V]
+        valid=None,  # type: typing.Optional[typing.Callable[[V], bool]]
+    ):
+        # type: (...) -> typing.Optional[V]
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            if valid is not None and not valid(value):
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        # type: (K, V) -> None
+        if self.maxsize == 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if self.maxsize is not None:
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+
+    def discard(self, key):
+        # type: (K) -> None
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        # type: () -> None
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        # type: () -> CacheStats
+        with self._lock:
+            return CacheStats(
+                hits=self.hits,
+                misses=self.misses,
+                size=len(self._data),
+                maxsize=self.maxsize,
+            )
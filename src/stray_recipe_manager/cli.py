@@ -1,15 +1,29 @@
 import sys
+import typing
+import fnmatch
 import logging
+import pathlib
 import argparse
+import itertools
 from stray_recipe_manager import logger as root_logger
-from stray_recipe_manager.units import UnitHandler, UnitPreferences
-from stray_recipe_manager.storage import get_storage, TOMLCoding
-from stray_recipe_manager.formatter import get_writer
-from stray_recipe_manager.server import create_app
-from stray_recipe_manager.recipe import present_recipe
+
+
+# Subcommands import what they need themselves, so that starting the CLI
+# does not pay for the web stack or the unit registry up front
+if typing.TYPE_CHECKING:
+    from stray_recipe_manager.storage import BaseStorage
+
+
+# Recipes presented together by book print
+PRINT_BATCH_SIZE = 256
 
 
 def print_recipe(args):
+    from stray_recipe_manager.units import UnitHandler, UnitPreferences
+    from stray_recipe_manager.storage import TOMLCoding
+    from stray_recipe_manager.formatter import get_writer
+    from stray_recipe_manager.recipe import present_recipe
+
     unit_handler = UnitHandler()
     prefs = UnitPreferences(unit_handler)
     if args.prefs is not None:
@@ -20,11 +34,45 @@ def print_recipe(args):
 
     p_recipe = present_recipe(recipe, prefs, args.scale)
 
-    get_writer(args.format).write_recipe(sys.stdout, p_recipe)
+    writer = get_writer(args.format)
+    writer.write_recipe(
+        sys.stdout.buffer if writer.binary else sys.stdout, p_recipe
+    )
+
+
+def expand_recipe_keys(storage, patterns):
+    # type: (BaseStorage, typing.Iterable[str]) -> typing.List[str]
+    """Recipe keys for keys and glob patterns, without duplicates"""
+    keys = []  # type: typing.List[str]
+    seen = set()  # type: typing.Set[str]
+    all_keys = None  # type: typing.Optional[typing.Sequence[str]]
+    for pattern in patterns:
+        if any(c in pattern for c in "*?["):
+            if all_keys is None:
+                all_keys = storage.sorted_recipe_keys()
+            matches = fnmatch.filter(all_keys, pattern)
+            if not matches:
+                raise KeyError(f"No recipes match {pattern}")
+        else:
+            matches = [pattern]
+        for key in matches:
+            if key not in seen:
+                seen.add(key)
+                keys.append(key)
+    return keys
 
 
 def book_print(storage, args):
-    recipe = storage.get_recipe(args.recipe_key)
+    from stray_recipe_manager.units import UnitPreferences
+    from stray_recipe_manager.formatter import get_writer
+    from stray_recipe_manager.recipe import present_recipes
+
+    if args.all:
+        keys = list(storage.sorted_recipe_keys())
+    elif args.recipe_keys:
+        keys = expand_recipe_keys(storage, args.recipe_keys)
+    else:
+        sys.exit("book print needs recipe keys or --all")
 
     unit_handler = storage.get_unit_handler()
 
@@ -32,12 +80,138 @@ def book_print(storage, args):
     if args.prefs is not None:
         prefs.load_from_toml_file(args.prefs)
 
-    p_recipe = present_recipe(recipe, prefs, args.scale)
+    writer = get_writer(args.format)
+    if args.output_dir is not None:
+        out_dir = pathlib.Path(args.output_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+
+    output = args.output.buffer if writer.binary else args.output
+    recipes = storage.get_recipes(keys, jobs=args.jobs)
+    first = True
+    while True:
+        # Present in batches, so a whole book is never held in memory
+        batch = list(itertools.islice(recipes, PRINT_BATCH_SIZE))
+        if not batch:
+            break
+        presented = present_recipes(
+            ((recipe, args.scale) for _, recipe in batch), prefs
+        )
+        for (key, _), p_recipe in zip(batch, presented):
+            if args.output_dir is not None:
+                path = out_dir / f"{key}{writer.extension}"
+                with path.open("wb" if writer.binary else "w") as f:
+                    writer.write_recipe(f, p_recipe)
+            else:
+                if not first:
+                    output.write(writer.separator)
+                writer.write_recipe(output, p_recipe)
+            first = False
+    output.flush()
+
+
+def book_compile(storage, args):
+    from stray_recipe_manager.storage import write_snapshot
 
-    get_writer(args.format).write_recipe(sys.stdout, p_recipe)
+    write_snapshot(storage, args.snapshot, args.jobs)
+
+
+def parse_selection(selection):
+    key, sep, scale = selection.rpartition(":")
+    if not sep:
+        return (selection, 1.0)
+    try:
+        return (key, float(scale))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid scale in '{selection}'")
+
+
+def book_shopping_list(storage, args):
+    from stray_recipe_manager.units import UnitPreferences
+    from stray_recipe_manager.shopping import (
+        build_shopping_list,
+        write_shopping_list,
+    )
+
+    selections = list(args.recipes)
+    if args.menu is not None:
+        selections.extend(
+            parse_selection(line.strip())
+            for line in args.menu
+            if line.strip() and not line.startswith("#")
+        )
+
+    prefs = UnitPreferences(storage.get_unit_handler())
+    if args.prefs is not None:
+        prefs.load_from_toml_file(args.prefs)
+
+    items = build_shopping_list(storage, selections, prefs)
+    write_shopping_list(args.output, items)
+
+
+def book_search(storage, args):
+    if args.text is None:
+        for key in storage.find_recipes(args.ingredient, args.tag, args.tool):
+            args.output.write(f"{key}\n")
+        return
+    results = storage.search_text(
+        args.text, args.limit, args.ingredient, args.tag, args.tool
+    )
+    for key, score in results:
+        args.output.write(f"{key}\t{score:.3f}\n")
+
+
+def book_migrate(storage, args):
+    from stray_recipe_manager.storage import (
+        get_storage,
+        create_storage,
+        copy_recipe_book,
+        InvalidPathType,
+    )
+
+    try:
+        dest = get_storage(args.destination)
+    except InvalidPathType:
+        dest = create_storage(args.destination)
+    copy_recipe_book(storage, dest, args.overwrite, args.jobs)
+
+
+def book_export_html(storage, args):
+    from stray_recipe_manager.export import export_html
+
+    stats = export_html(
+        storage,
+        pathlib.Path(args.out_dir),
+        prefs_file=args.prefs,
+        template_dir=args.template_dir,
+        jobs=args.jobs,
+        force=args.force,
+    )
+    args.output.write(
+        f"{stats.rendered} pages rendered, {stats.unchanged} unchanged, "
+        f"{stats.removed} removed, {stats.failed} failed\n"
+    )
+    if stats.failed:
+        sys.exit(1)
+
+
+def book_validate(storage, args):
+    errors = []
+
+    def on_error(key, error):
+        errors.append(key)
+        args.output.write(f"{key}: {error}\n")
+
+    count = sum(
+        1 for _ in storage.get_recipes(jobs=args.jobs, on_error=on_error)
+    )
+    args.output.write(f"{count} recipes loaded, {len(errors)} failed\n")
+    if errors:
+        sys.exit(1)
 
 
 def book_dispatch(args):
+    from stray_recipe_manager.storage import get_storage
+
     storage = get_storage(args.recipe_book)
     args.book_func(storage, args)
 
@@ -45,14 +219,51 @@ def book_dispatch(args):
 def book_serve(args):
     import socket
     from werkzeug.serving import run_simple
-
-    host_ip = socket.gethostbyname(socket.gethostname())
-    host_socket = 5000
-    app = create_app(
-        storage_path=args.recipe_book, host_base=f"{host_ip}:{host_socket}",
+    from stray_recipe_manager.server import create_app
+
+    if args.host is not None:
+        host_ip = args.host
+    else:
+        host_ip = socket.gethostbyname(socket.gethostname())
+    host_socket = args.port
+    config = dict(
+        storage_path=args.recipe_book,
+        host_base=f"{host_ip}:{host_socket}",
+        prefs_file=args.prefs,
+        cache_max_age=args.cache_max_age,
+        stream_templates=args.stream,
+        watch=args.watch,
+        lazy=args.lazy,
     )
 
-    run_simple(host_ip, host_socket, app)
+    if args.server == "asgi":
+        from stray_recipe_manager.asgi import run_asgi
+
+        run_asgi(
+            host_ip,
+            host_socket,
+            workers=args.workers,
+            threads=args.threads,
+            concurrency=args.concurrency,
+            **config,
+        )
+    elif args.server == "prefork":
+        from functools import partial
+        from stray_recipe_manager.prefork import run_prefork
+
+        run_prefork(
+            partial(create_app, **config),
+            host_ip,
+            host_socket,
+            workers=args.workers,
+        )
+    else:
+        run_simple(
+            host_ip,
+            host_socket,
+            create_app(**config),
+            threaded=args.threads > 1,
+        )
 
 
 def parse_args(args):
@@ -121,6 +332,14 @@ def parse_args(args):
         "recipe_book", help="Recipe book to work with"
     )
 
+    recipe_book_parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Processes to load recipes with, for commands reading them all",
+    )
+
     recipe_book_parser.set_defaults(func=book_dispatch)
 
     book_subparsers = recipe_book_parser.add_subparsers()
@@ -154,13 +373,192 @@ def parse_args(args):
         )
 
         print_selected_recipe.add_argument(
-            "recipe_key", help="Recipe to print"
+            "--output-dir",
+            help="Write each recipe to its own file in this directory",
+        )
+
+        print_selected_recipe.add_argument(
+            "--all", action="store_true", help="Print every recipe"
+        )
+
+        print_selected_recipe.add_argument(
+            "recipe_keys",
+            nargs="*",
+            metavar="recipe_key",
+            help="Recipes to print, may be glob patterns",
         )
 
         print_selected_recipe.set_defaults(book_func=book_print)
 
     recipe_book_print(book_subparsers)
 
+    def recipe_book_compile(parser_set):
+        compile_parser = parser_set.add_parser(
+            "compile",
+            description="Compile recipe book to a binary snapshot",
+        )
+
+        compile_parser.add_argument(
+            "snapshot", type=pathlib.Path, help="Snapshot file to write"
+        )
+
+        compile_parser.set_defaults(book_func=book_compile)
+
+    recipe_book_compile(book_subparsers)
+
+    def recipe_book_shopping_list(parser_set):
+        shopping_parser = parser_set.add_parser(
+            "shopping-list",
+            description="Sum up the ingredients of a set of recipes",
+        )
+
+        shopping_parser.add_argument(
+            "--prefs", type=argparse.FileType("r"), help="Unit preferences"
+        )
+
+        shopping_parser.add_argument(
+            "--menu",
+            type=argparse.FileType("r"),
+            help="File with one recipe[:scale] per line",
+        )
+
+        shopping_parser.add_argument(
+            "--output",
+            "-o",
+            default=sys.stdout,
+            type=argparse.FileType("w"),
+            help="Output File",
+        )
+
+        shopping_parser.add_argument(
+            "recipes",
+            nargs="*",
+            type=parse_selection,
+            help="Recipes to include, as recipe_key[:scale]",
+        )
+
+        shopping_parser.set_defaults(book_func=book_shopping_list)
+
+    recipe_book_shopping_list(book_subparsers)
+
+    def recipe_book_search(parser_set):
+        search_parser = parser_set.add_parser(
+            "search",
+            description="List recipes matching all of the given terms",
+        )
+
+        search_parser.add_argument(
+            "--ingredient",
+            "-i",
+            action="append",
+            default=[],
+            help="Ingredient identifier or item name",
+        )
+
+        search_parser.add_argument(
+            "--tag", "-t", action="append", default=[], help="Recipe tag"
+        )
+
+        search_parser.add_argument(
+            "--tool", action="append", default=[], help="Required tool"
+        )
+
+        search_parser.add_argument(
+            "--text", "-q", help="Free text to rank recipes against"
+        )
+
+        search_parser.add_argument(
+            "--limit",
+            type=int,
+            default=10,
+            help="Number of ranked results to show",
+        )
+
+        search_parser.add_argument(
+            "--output",
+            "-o",
+            default=sys.stdout,
+            type=argparse.FileType("w"),
+            help="Output File",
+        )
+
+        search_parser.set_defaults(book_func=book_search)
+
+    recipe_book_search(book_subparsers)
+
+    def recipe_book_migrate(parser_set):
+        migrate_parser = parser_set.add_parser(
+            "migrate",
+            description=(
+                "Copy recipe book to another storage, e.g. a directory or "
+                "an SQLite (.sqlite) file"
+            ),
+        )
+
+        migrate_parser.add_argument(
+            "--overwrite",
+            action="store_true",
+            help="Replace recipes already in the destination",
+        )
+
+        migrate_parser.add_argument(
+            "destination", help="Recipe book to copy to, created if missing"
+        )
+
+        migrate_parser.set_defaults(book_func=book_migrate)
+
+    recipe_book_migrate(book_subparsers)
+
+    def recipe_book_validate(parser_set):
+        validate_parser = parser_set.add_parser(
+            "validate", description="Check that every recipe loads"
+        )
+
+        validate_parser.add_argument(
+            "--output",
+            "-o",
+            default=sys.stdout,
+            type=argparse.FileType("w"),
+            help="Output File",
+        )
+
+        validate_parser.set_defaults(book_func=book_validate)
+
+    recipe_book_validate(book_subparsers)
+
+    def recipe_book_export_html(parser_set):
+        export_parser = parser_set.add_parser(
+            "export-html", description="Render recipe book as a static site"
+        )
+
+        export_parser.add_argument(
+            "out_dir", help="Directory to write the site to"
+        )
+
+        export_parser.add_argument("--prefs", help="Unit preferences file")
+
+        export_parser.add_argument(
+            "--template-dir", help="Templates to use instead of the built in"
+        )
+
+        export_parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Render every page, even if its inputs are unchanged",
+        )
+
+        export_parser.add_argument(
+            "--output",
+            "-o",
+            default=sys.stdout,
+            type=argparse.FileType("w"),
+            help="Output File",
+        )
+
+        export_parser.set_defaults(book_func=book_export_html)
+
+    recipe_book_export_html(book_subparsers)
+
     def create_server_parser(parser_set):
         server_parser = parser_set.add_parser(
             "serve", description="Serve recipe book as web path"
@@ -170,6 +568,71 @@ def parse_args(args):
             "recipe_book", help="Recipe book to work with"
         )
 
+        server_parser.add_argument("--prefs", help="Unit preferences file")
+
+        server_parser.add_argument(
+            "--cache-max-age",
+            type=int,
+            default=0,
+            help="Seconds clients may reuse a recipe page without checking",
+        )
+
+        server_parser.add_argument(
+            "--stream",
+            action="store_true",
+            help="Stream rendered pages instead of building them in memory",
+        )
+
+        server_parser.add_argument(
+            "--watch",
+            action="store_true",
+            help="Keep the book in memory and reload files as they change",
+        )
+
+        server_parser.add_argument(
+            "--lazy",
+            action="store_true",
+            help="Only parse ingredients and steps of recipes when shown, "
+            "watched books are always loaded in full",
+        )
+
+        server_parser.add_argument(
+            "--host", help="Address to listen on, defaults to this host's IP"
+        )
+
+        server_parser.add_argument(
+            "--port", type=int, default=5000, help="Port to listen on"
+        )
+
+        server_parser.add_argument(
+            "--server",
+            choices=["werkzeug", "asgi", "prefork"],
+            default="werkzeug",
+            help="Development server, ASGI server (needs uvicorn) or "
+            "pre-forked worker processes",
+        )
+
+        server_parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Server processes, for the asgi and prefork servers",
+        )
+
+        server_parser.add_argument(
+            "--threads",
+            type=int,
+            default=8,
+            help="Threads reading and rendering recipes in each process",
+        )
+
+        server_parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=256,
+            help="Requests admitted at once in each asgi process",
+        )
+
         server_parser.set_defaults(func=book_serve)
 
     create_server_parser(main_subparsers)
@@ -0,0 +1,355 @@
+import array
+import typing
+import logging
+
+import pint
+
+from stray_recipe_manager.cache import LRUCache
+from stray_recipe_manager.recipe import (
+    Ingredient,
+    RecipeStep,
+    Recipe,
+    CommentedRecipe,
+)
+from stray_recipe_manager.units import UnitHandler
+from stray_recipe_manager.storage import (
+    BaseStorage,
+    InvalidPathType,
+    LoadErrorHandler,
+)
+
+
+logger = logging.getLogger(__name__)
+
+# ID of a missing string, unit or quantity
+NO_ID = -1
+# Kinds of magnitude in QuantityColumns.integral
+FLOAT, INT, LARGE_INT = 0, 1, 2
+
+
+class StringTable:
+    """Each distinct string stored once, referred to by integer ID"""
+
+    def __init__(self):
+        # type: () -> None
+        self.strings = []  # type: typing.List[str]
+        self.ids = {}  # type: typing.Dict[str, int]
+
+    def __len__(self):
+        # type: () -> int
+        return len(self.strings)
+
+    def intern(self, value):
+        # type: (typing.Optional[str]) -> int
+        if value is None:
+            return NO_ID
+        try:
+            return self.ids[value]
+        except KeyError:
+            string_id = self.ids[value] = len(self.strings)
+            self.strings.append(value)
+            return string_id
+
+    def get(self, string_id):
+        # type: (int) -> typing.Optional[str]
+        return None if string_id == NO_ID else self.strings[string_id]
+
+
+class QuantityColumns:
+    """Quantities as parallel arrays of magnitude, integer flag and unit ID
+
+    The flag keeps integer magnitudes integers, so quantities built from
+    the columns print exactly like the parsed ones. Integers a float can
+    not hold exactly are kept aside by row as well. Recently built
+    quantities are shared, like parsed ones, and must not be modified.
+    """
+
+    def __init__(self, unit_registry, cache_size=4096):
+        # type: (pint.UnitRegistry, typing.Optional[int]) -> None
+        self.quantity_cls = unit_registry.Quantity
+        self.cache = LRUCache(
+            cache_size
+        )  # type: LRUCache[typing.Tuple[float, int, int], pint.Quantity]
+        self.magnitudes = array.array("d")
+        self.integral = array.array("b")
+        self.unit_ids = array.array("i")
+        self.large_ints = {}  # type: typing.Dict[int, int]
+        self.units = []  # type: typing.List[typing.Any]
+        self.unit_index = {}  # type: typing.Dict[typing.Hashable, int]
+
+    def __len__(self):
+        # type: () -> int
+        return len(self.magnitudes)
+
+    @staticmethod
+    def check(quantity):
+        # type: (typing.Optional[pint.Quantity]) -> None
+        """Raise TypeError if append would not accept quantity"""
+        if quantity is None:
+            return
+        magnitude = quantity.magnitude
+        if isinstance(magnitude, bool) or not isinstance(
+            magnitude, (int, float)
+        ):
+            raise TypeError(f"Unsupported magnitude in {quantity!r}")
+
+    def append(self, quantity):
+        # type: (typing.Optional[pint.Quantity]) -> None
+        self.check(quantity)
+        if quantity is None:
+            self.magnitudes.append(0.0)
+            self.integral.append(FLOAT)
+            self.unit_ids.append(NO_ID)
+            return
+        magnitude = quantity.magnitude
+        units = quantity.units
+        try:
+            unit_id = self.unit_index[units]
+        except KeyError:
+            unit_id = self.unit_index[units] = len(self.units)
+            self.units.append(units)
+        if not isinstance(magnitude, int):
+            kind = FLOAT
+        elif float(magnitude) == magnitude:
+            kind = INT
+        else:
+            kind = LARGE_INT
+            self.large_ints[len(self.magnitudes)] = magnitude
+        self.magnitudes.append(magnitude)
+        self.integral.append(kind)
+        self.unit_ids.append(unit_id)
+
+    def get(self, row):
+        # type: (int) -> typing.Optional[pint.Quantity]
+        unit_id = self.unit_ids[row]
+        if unit_id == NO_ID:
+            return None
+        integral = self.integral[row]
+        if integral == LARGE_INT:
+            magnitude = self.large_ints[row]  # type: typing.Any
+        elif integral == INT:
+            magnitude = int(self.magnitudes[row])
+        else:
+            magnitude = self.magnitudes[row]
+        key = (magnitude, integral, unit_id)
+        quantity = self.cache.get(key)
+        if quantity is None:
+            quantity = self.quantity_cls(magnitude, self.units[unit_id])
+            self.cache.put(key, quantity)
+        return quantity
+
+    def nbytes(self):
+        # type: () -> int
+        return sum(
+            a.itemsize * len(a)
+            for a in (self.magnitudes, self.integral, self.unit_ids)
+        )
+
+
+class ListColumn:
+    """A list of strings per recipe, as string IDs with offsets"""
+
+    def __init__(self):
+        # type: () -> None
+        self.offsets = array.array("q", [0])
+        self.values = array.array("i")
+
+    def append(self, strings, values):
+        # type: (StringTable, typing.Iterable[str]) -> None
+        self.values.extend(strings.intern(v) for v in values)
+        self.offsets.append(len(self.values))
+
+    def get(self, strings, row):
+        # type: (StringTable, int) -> typing.List[str]
+        return [
+            strings.strings[i]
+            for i in self.values[self.offsets[row] : self.offsets[row + 1]]
+        ]
+
+    def nbytes(self):
+        # type: () -> int
+        return sum(a.itemsize * len(a) for a in (self.offsets, self.values))
+
+
+class ColumnarStorage(BaseStorage):
+    """Read-only book held in flat arrays instead of recipe objects
+
+    Every string is interned in one table and every quantity is stored as
+    a magnitude and unit ID, so a large book costs a few bytes per
+    ingredient instead of several Python objects. Recipe, Ingredient and
+    RecipeStep objects are only built when asked for, and not kept.
+
+    The magnitude columns are array.array("d"), which numpy.frombuffer
+    wraps without copying.
+    """
+
+    def __init__(self, unit_handler, location=""):
+        # type: (UnitHandler, str) -> None
+        self.unit_handler = unit_handler
+        self.source_location = location
+        self.strings = StringTable()
+        self.keys = []  # type: typing.List[str]
+        self.rows = {}  # type: typing.Dict[str, int]
+        # One row per recipe
+        self.names = array.array("i")
+        self.comments = array.array("i")
+        self.commented = array.array("b")
+        self.tools = ListColumn()
+        self.tags = ListColumn()
+        self.references = ListColumn()
+        # Ingredient rows of each recipe, starting with what it makes
+        self.ingredient_offsets = array.array("q", [0])
+        self.items = array.array("i")
+        self.identifiers = array.array("i")
+        self.categories = array.array("i")
+        self.notes = array.array("i")
+        self.quantities = QuantityColumns(unit_handler.unit_registry)
+        # Step rows of each recipe
+        self.step_offsets = array.array("q", [0])
+        self.descriptions = array.array("i")
+        self.groups = array.array("i")
+        self.times = QuantityColumns(unit_handler.unit_registry)
+
+    @classmethod
+    def from_path_str(cls, dirpath_str):
+        # type: (str) -> ColumnarStorage
+        raise InvalidPathType("Columnar storage is loaded from a storage")
+
+    @classmethod
+    def load(
+        cls,
+        storage,  # type: BaseStorage
+        keys=None,  # type: typing.Optional[typing.Iterable[str]]
+        jobs=1,  # type: int
+        on_error=None,  # type: typing.Optional[LoadErrorHandler]
+    ):
+        # type: (...) -> ColumnarStorage
+        """Columnar copy of recipes in storage, all of them by default"""
+        columnar = cls(storage.get_unit_handler(), storage.location())
+        for key, recipe in storage.get_recipes(keys, jobs, on_error):
+            columnar.add_recipe(key, recipe)
+        return columnar
+
+    def location(self):
+        # type: () -> str
+        return self.source_location
+
+    def get_unit_handler(self):
+        # type: () -> UnitHandler
+        return self.unit_handler
+
+    def __len__(self):
+        # type: () -> int
+        return len(self.keys)
+
+    def recipe_keys(self):
+        # type: () -> typing.Iterator[str]
+        return iter(self.keys)
+
+    def add_recipe(self, recipe_key, recipe):
+        # type: (str, Recipe) -> None
+        if recipe_key in self.rows:
+            raise KeyError(f"Recipe {recipe_key} already added")
+        ingredients = [recipe.makes] + list(recipe.ingredients)
+        steps = list(recipe.steps)
+        # Checked before any column grows, so a rejected recipe leaves no
+        # partial row behind
+        for ingredient in ingredients:
+            self.quantities.check(ingredient.quantity)
+        for step in steps:
+            self.times.check(step.time)
+        intern = self.strings.intern
+        self.rows[recipe_key] = len(self.keys)
+        self.keys.append(recipe_key)
+        self.names.append(intern(recipe.name))
+        self.tools.append(self.strings, recipe.tools)
+        self.tags.append(self.strings, recipe.tags)
+        if isinstance(recipe, CommentedRecipe):
+            self.commented.append(1)
+            self.comments.append(intern(recipe.comments))
+            self.references.append(self.strings, recipe.references)
+        else:
+            self.commented.append(0)
+            self.comments.append(NO_ID)
+            self.references.append(self.strings, ())
+        for ingredient in ingredients:
+            self.items.append(intern(ingredient.item))
+            self.identifiers.append(intern(ingredient.identifier))
+            self.categories.append(intern(ingredient.category))
+            self.notes.append(intern(ingredient.notes))
+            self.quantities.append(ingredient.quantity)
+        self.ingredient_offsets.append(len(self.items))
+        for step in steps:
+            self.descriptions.append(intern(step.description))
+            self.groups.append(intern(step.group))
+            self.times.append(step.time)
+        self.step_offsets.append(len(self.descriptions))
+
+    def ingredient(self, row):
+        # type: (int) -> Ingredient
+        strings = self.strings
+        quantity = self.quantities.get(row)
+        assert quantity is not None
+        return Ingredient(
+            item=strings.strings[self.items[row]],
+            quantity=quantity,
+            identifier=strings.get(self.identifiers[row]),
+            category=strings.get(self.categories[row]),
+            notes=strings.get(self.notes[row]),
+        )
+
+    def step(self, row):
+        # type: (int) -> RecipeStep
+        return RecipeStep(
+            description=self.strings.strings[self.descriptions[row]],
+            group=self.strings.get(self.groups[row]),
+            time=self.times.get(row),
+        )
+
+    def get_recipe(self, recipe_key):
+        # type: (str) -> Recipe
+        try:
+            row = self.rows[recipe_key]
+        except KeyError:
+            raise KeyError("No recipe for '{}'".format(recipe_key))
+        start, end = self.ingredient_offsets[row : row + 2]
+        fields = dict(
+            name=self.strings.strings[self.names[row]],
+            makes=self.ingredient(start),
+            ingredients=[self.ingredient(i) for i in range(start + 1, end)],
+            steps=[
+                self.step(i) for i in range(*self.step_offsets[row : row + 2])
+            ],
+            tools=self.tools.get(self.strings, row),
+            tags=self.tags.get(self.strings, row),
+        )  # type: typing.Dict[str, typing.Any]
+        if self.commented[row]:
+            return CommentedRecipe(
+                comments=self.strings.get(self.comments[row]),
+                references=self.references.get(self.strings, row),
+                **fields,
+            )
+        return Recipe(**fields)
+
+    def nbytes(self):
+        # type: () -> int
+        """Size of the arrays, without the string table"""
+        arrays = [
+            self.names,
+            self.comments,
+            self.commented,
+            self.ingredient_offsets,
+            self.items,
+            self.identifiers,
+            self.categories,
+            self.notes,
+            self.step_offsets,
+            self.descriptions,
+            self.groups,
+        ]
+        return (
+            sum(a.itemsize * len(a) for a in arrays)
+            + sum(c.nbytes() for c in (self.tools, self.tags, self.references))
+            + self.quantities.nbytes()
+            + self.times.nbytes()
+        )
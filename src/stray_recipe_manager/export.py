@@ -0,0 +1,268 @@
+import os
+import json
+import attr
+import typing
+import hashlib
+import logging
+import pathlib
+import concurrent.futures
+
+from stray_recipe_manager.storage import (
+    BaseStorage,
+    SnapshotDecoder,
+    SnapshotEncoder,
+)
+from stray_recipe_manager.server import RECIPE_ERRORS, RecipeViewer
+
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = ".manifest.json"
+# Bump to force every page to be rendered again
+MANIFEST_VERSION = 1
+CHUNK_SIZE = 64
+STATIC_DIR = pathlib.Path(__file__).parent / "static"
+
+# (identifier, magnitude, unit ID)
+EncodedDensity = typing.Tuple[str, typing.Any, int]
+
+# Per worker process, set up by _init_worker
+_viewer = None  # type: typing.Optional[RecipeViewer]
+
+
+@attr.attrs(frozen=True, slots=True)
+class ExportStats(object):
+    rendered = attr.ib(type=int, kw_only=True)
+    unchanged = attr.ib(type=int, kw_only=True)
+    removed = attr.ib(type=int, kw_only=True)
+    failed = attr.ib(type=int, kw_only=True)
+
+
+def recipe_output(out_dir, recipe_key):
+    # type: (pathlib.Path, str) -> pathlib.Path
+    return out_dir / "recipe" / f"{recipe_key}.html"
+
+
+def write_if_changed(path, data):
+    # type: (pathlib.Path, bytes) -> bool
+    try:
+        if path.read_bytes() == data:
+            return False
+    except FileNotFoundError:
+        pass
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_bytes(data)
+    os.replace(str(tmp_path), str(path))
+    return True
+
+
+def template_fingerprint(viewer):
+    # type: (RecipeViewer) -> str
+    sha = hashlib.sha1(repr(MANIFEST_VERSION).encode("utf-8"))
+    env = viewer.jinja_env
+    assert env.loader is not None
+    for name in sorted(env.loader.list_templates()):
+        source, _, _ = env.loader.get_source(env, name)
+        sha.update(name.encode("utf-8"))
+        sha.update(source.encode("utf-8"))
+    return sha.hexdigest()
+
+
+def _init_worker(
+    config,  # type: typing.Dict[str, typing.Any]
+    units,  # type: typing.Sequence[str]
+    densities,  # type: typing.Sequence[EncodedDensity]
+):
+    # type: (...) -> None
+    global _viewer
+    _viewer = RecipeViewer(config)
+    unit_handler = _viewer.storage.get_unit_handler()
+    decoder = SnapshotDecoder(unit_handler.unit_registry, units)
+    # Pages use the densities the parent loaded, as in a serial export
+    unit_handler.replace_densities(
+        {
+            identifier: decoder.decode_quantity(magnitude, unit_id)
+            for identifier, magnitude, unit_id in densities
+        }
+    )
+
+
+def _render_chunk(out_dir, keys):
+    # type: (pathlib.Path, typing.Sequence[str]) -> typing.List[str]
+    assert _viewer is not None
+    storage, prefs = _viewer.current_state()
+    failed = []  # type: typing.List[str]
+    for key in keys:
+        try:
+            page = _viewer.build_page(storage, prefs, key)
+        except RECIPE_ERRORS as e:
+            logger.warning("Not exporting recipe %s: %s", key, e)
+            failed.append(key)
+            continue
+        write_if_changed(recipe_output(out_dir, key), page)
+    return failed
+
+
+def load_manifest(path):
+    # type: (pathlib.Path) -> typing.Dict[str, str]
+    try:
+        with path.open("r") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except ValueError as e:
+        logger.warning("Ignoring unreadable manifest %s: %s", path, e)
+        return {}
+    if data.get("version") != MANIFEST_VERSION:
+        return {}
+    return data["recipes"]
+
+
+def save_manifest(path, recipes):
+    # type: (pathlib.Path, typing.Dict[str, str]) -> None
+    data = {"version": MANIFEST_VERSION, "recipes": recipes}
+    write_if_changed(
+        path, json.dumps(data, sort_keys=True, indent=0).encode("utf-8")
+    )
+
+
+def export_html(
+    storage,  # type: BaseStorage
+    out_dir,  # type: pathlib.Path
+    prefs_file=None,  # type: typing.Optional[str]
+    template_dir=None,  # type: typing.Optional[str]
+    jobs=1,  # type: int
+    force=False,  # type: bool
+):
+    # type: (...) -> ExportStats
+    """Render the recipe book to a static site in out_dir
+
+    Pages use the server templates and URL layout. The manifest in out_dir
+    records a hash of each page's inputs, the recipe contents, templates,
+    preferences and densities, so only recipes whose hash changed are
+    rendered again.
+
+    Every changed recipe is loaded before any page is rendered, so pages
+    see the densities of all of them whatever the number of jobs. Recipes
+    that fail to load or present are logged, counted as failed and left
+    out of the site, to be tried again by the next export.
+    """
+    config = {
+        "storage_path": storage.location(),
+        "host_base": "",
+        "template_dir": template_dir,
+        "prefs_file": prefs_file,
+    }
+    viewer = RecipeViewer(dict(config, storage=storage))
+    (out_dir / "recipe").mkdir(parents=True, exist_ok=True)
+    manifest_path = out_dir / MANIFEST_NAME
+    previous = {} if force else load_manifest(manifest_path)
+
+    # All hashes are taken before rendering, which may add densities. They
+    # only depend on content, so copies and checkouts of the book, which
+    # change file times, are not rendered again.
+    inputs = (
+        template_fingerprint(viewer),
+        viewer.prefs.cache_key(),
+        viewer.densities_fingerprint(viewer.prefs.unit_handler),
+    )
+    keys = storage.sorted_recipe_keys()
+    hashes = {}  # type: typing.Dict[str, str]
+    for key in keys:
+        hashes[key] = hashlib.sha1(
+            repr((key, storage.recipe_digest(key)) + inputs).encode("utf-8")
+        ).hexdigest()
+    changed = [
+        key
+        for key in keys
+        if previous.get(key) != hashes[key]
+        or not recipe_output(out_dir, key).exists()
+    ]
+
+    failed = []  # type: typing.List[str]
+
+    def on_error(key, error):
+        # type: (str, Exception) -> None
+        logger.warning("Not exporting recipe %s: %s", key, error)
+        failed.append(key)
+
+    parallel = jobs > 1 and len(changed) > CHUNK_SIZE
+    loaded = list(
+        storage.get_recipes(
+            changed, jobs=jobs if parallel else 1, on_error=on_error
+        )
+    )
+    if parallel:
+        encoder = SnapshotEncoder()
+        unit_handler = storage.get_unit_handler()
+        densities = [
+            (identifier,) + encoder.encode_quantity(density)
+            for identifier, density in unit_handler.densities.items()
+        ]
+        chunks = [
+            [key for key, _ in loaded[start : start + CHUNK_SIZE]]
+            for start in range(0, len(loaded), CHUNK_SIZE)
+        ]
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=jobs,
+            initializer=_init_worker,
+            initargs=(config, encoder.units, densities),
+        ) as executor:
+            futures = [
+                executor.submit(_render_chunk, out_dir, chunk)
+                for chunk in chunks
+            ]
+            for future in futures:
+                failed.extend(future.result())
+    else:
+        for key, recipe in loaded:
+            try:
+                page = viewer.recipe_page(viewer.prefs, recipe)
+            except RECIPE_ERRORS as e:
+                on_error(key, e)
+                continue
+            write_if_changed(recipe_output(out_dir, key), page)
+
+    removed = 0
+    for key in set(previous) - set(hashes):
+        try:
+            recipe_output(out_dir, key).unlink()
+            removed += 1
+        except FileNotFoundError:
+            pass
+    # Failed recipes get no page and no manifest entry
+    for key in failed:
+        del hashes[key]
+        try:
+            recipe_output(out_dir, key).unlink()
+        except FileNotFoundError:
+            pass
+
+    index = viewer.jinja_env.get_template("recipe_index.html")
+    write_if_changed(
+        out_dir / "index.html",
+        index.render(recipes=[key for key in keys if key in hashes]).encode(
+            "utf-8"
+        ),
+    )
+    static_out = out_dir / "static"
+    static_out.mkdir(exist_ok=True)
+    for path in STATIC_DIR.iterdir():
+        if path.is_file():
+            write_if_changed(static_out / path.name, path.read_bytes())
+
+    save_manifest(manifest_path, hashes)
+    stats = ExportStats(
+        rendered=len(changed) - len(failed),
+        unchanged=len(keys) - len(changed),
+        removed=removed,
+        failed=len(failed),
+    )
+    logger.info(
+        "Rendered %d pages, %d unchanged, %d removed, %d failed",
+        stats.rendered,
+        stats.unchanged,
+        stats.removed,
+        stats.failed,
+    )
+    return stats
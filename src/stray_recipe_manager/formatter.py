@@ -1,3 +1,5 @@
+import pint
+import json
 import logging
 import typing
 from stray_recipe_manager.recipe import (
@@ -5,30 +7,85 @@ from stray_recipe_manager.recipe import (
     RecipeStep,
     Recipe,
     CommentedRecipe,
+    recipe_from_dict,
 )
 
+if typing.TYPE_CHECKING:
+    from stray_recipe_manager.units import UnitHandler
+
 
 logger = logging.getLogger(__name__)
 
 
+class QuantityFormatter:
+    """Format quantities exactly like str(), with unit names cached
+
+    Building the unit name is most of the cost of str(quantity), and a
+    recipe book only uses a handful of units.
+    """
+
+    def __init__(self):
+        # type: () -> None
+        self.unit_names = {}  # type: typing.Dict[typing.Hashable, str]
+
+    def format(self, quantity):
+        # type: (pint.Quantity) -> str
+        units = quantity.units
+        try:
+            name = self.unit_names[units]
+        except KeyError:
+            name = self.unit_names[units] = str(units)
+        return f"{quantity.magnitude} {name}"
+
+
+quantity_formatter = QuantityFormatter()
+
+
+def import_msgpack():
+    try:
+        import msgpack
+    except ImportError:
+        raise RuntimeError(
+            "MessagePack needs msgpack, install it with "
+            "pip install stray_recipe_manager[msgpack]"
+        )
+    return msgpack
+
+
 class BaseWriter:
     mimetype = None  # type: typing.Optional[str]
+    # File name extension for output files
+    extension = ""
+    # Binary writers produce bytes and need a binary file
+    binary = False
+    # Written between recipes in one output
+    separator = "\n"  # type: typing.Any
 
-    def write_recipe(self, io, recipe):
-        # type: (typing.TextIO, Recipe) -> None
+    @classmethod
+    def iter_recipe(cls, recipe):
+        # type: (Recipe) -> typing.Iterator[typing.Any]
+        """Output for a recipe in pieces, e.g. for a streamed response"""
         raise NotImplementedError()
 
+    @classmethod
+    def write_recipe(cls, io, recipe):
+        # type: (typing.IO[typing.Any], Recipe) -> None
+        empty = b"" if cls.binary else ""
+        io.write(empty.join(cls.iter_recipe(recipe)))
+
 
 class MarkdownWriter(BaseWriter):
     mimetype = "text/markdown"
+    extension = ".md"
 
     @classmethod
     def format_ingredient(cls, ingredient):
         # type: (Ingredient) -> str
+        quantity = quantity_formatter.format(ingredient.quantity)
         if ingredient.notes is None:
-            return f"{ingredient.quantity!s} {ingredient.item}"
+            return f"{quantity} {ingredient.item}"
         else:
-            return f"{ingredient.quantity!s} {ingredient.item}, {ingredient.notes}"
+            return f"{quantity} {ingredient.item}, {ingredient.notes}"
 
     @classmethod
     def format_step(cls, step):
@@ -36,45 +93,51 @@ class MarkdownWriter(BaseWriter):
         if step.time is None:
             return f"{step.description}"
         else:
-            return f"{step.description} ({step.time!s})"
+            time = quantity_formatter.format(step.time)
+            return f"{step.description} ({time})"
 
     @classmethod
-    def write_recipe(cls, io, recipe):
-        # type: (typing.TextIO, Recipe) -> None
-        io.write(f"### {recipe.name}\n")
-        io.write("\nMakes:\n")
-        io.write("\n{}\n".format(cls.format_ingredient(recipe.makes)))
+    def iter_recipe(cls, recipe):
+        # type: (Recipe) -> typing.Iterator[str]
+        yield f"### {recipe.name}\n\nMakes:\n\n"
+        yield cls.format_ingredient(recipe.makes)
+        yield "\n"
         if isinstance(recipe, CommentedRecipe):
             if recipe.comments is not None:
-                io.write("\n#### Comments\n")
-                io.write(f"\n{recipe.comments}\n")
+                yield f"\n#### Comments\n\n{recipe.comments}\n"
         if len(recipe.tools) > 0:
-            io.write("\n#### Tools\n\n")
-            for tool in recipe.tools:
-                io.write(f"-    {tool}\n")
-        io.write("\n#### Ingredients\n\n")
-        for ingredient in recipe.ingredients:
-            io.write("-    {}\n".format(cls.format_ingredient(ingredient)))
-        io.write("\n#### Procedure\n\n")
-        for i, step in enumerate(recipe.steps):
-            io.write("{:d})   {}\n".format(i + 1, cls.format_step(step)))
+            yield "\n#### Tools\n\n"
+            yield "".join(f"-    {tool}\n" for tool in recipe.tools)
+        yield "\n#### Ingredients\n\n"
+        yield "".join(
+            f"-    {cls.format_ingredient(ingredient)}\n"
+            for ingredient in recipe.ingredients
+        )
+        yield "\n#### Procedure\n\n"
+        yield "".join(
+            f"{i:d})   {cls.format_step(step)}\n"
+            for i, step in enumerate(recipe.steps, 1)
+        )
         if isinstance(recipe, CommentedRecipe):
             if len(recipe.references) > 0:
-                io.write("\n#### References\n\n")
-                for reference in recipe.references:
-                    io.write(f"-    {reference}\n")
+                yield "\n#### References\n\n"
+                yield "".join(
+                    f"-    {reference}\n" for reference in recipe.references
+                )
 
 
 class HTMLWriter(BaseWriter):
     mimetype = "text/html"
+    extension = ".html"
 
     @classmethod
     def format_ingredient(cls, ingredient):
         # type: (Ingredient) -> str
+        quantity = quantity_formatter.format(ingredient.quantity)
         if ingredient.notes is None:
-            return f"{ingredient.quantity!s} {ingredient.item}"
+            return f"{quantity} {ingredient.item}"
         else:
-            return f"{ingredient.quantity!s} {ingredient.item}, {ingredient.notes}"
+            return f"{quantity} {ingredient.item}, {ingredient.notes}"
 
     @classmethod
     def format_step(cls, step):
@@ -82,41 +145,73 @@ class HTMLWriter(BaseWriter):
         if step.time is None:
             return f"{step.description}"
         else:
-            return f"{step.description} ({step.time!s})"
+            time = quantity_formatter.format(step.time)
+            return f"{step.description} ({time})"
 
     @classmethod
-    def write_recipe(cls, io, recipe):
-        # type: (typing.TextIO, Recipe) -> None
-        io.write("<html>")
-        io.write(f"<head><title>{recipe.name}</title></head>")
-        io.write("<body>")
-        io.write(f"<h3>{recipe.name}</h3>")
-        io.write("<p>Makes:</p>")
-        io.write("<p>{}</p>".format(cls.format_ingredient(recipe.makes)))
+    def iter_recipe(cls, recipe):
+        # type: (Recipe) -> typing.Iterator[str]
+        yield (
+            f"<html><head><title>{recipe.name}</title></head><body>"
+            f"<h3>{recipe.name}</h3><p>Makes:</p>"
+            f"<p>{cls.format_ingredient(recipe.makes)}</p>"
+        )
         if isinstance(recipe, CommentedRecipe):
             if recipe.comments is not None:
-                io.write("<h4>Comments</h4>")
-                io.write(f"<p>{recipe.comments}</p>")
+                yield f"<h4>Comments</h4><p>{recipe.comments}</p>"
         if len(recipe.tools) > 0:
-            io.write("<h4>Tools</h4><ul>")
-            for tool in recipe.tools:
-                io.write(f"<li>{tool}</li>")
-            io.write("</ul>")
-        io.write("<h4>Ingredients</h4><ul>")
-        for ingredient in recipe.ingredients:
-            io.write("<li>{}</li>".format(cls.format_ingredient(ingredient)))
-        io.write("</ul>")
-        io.write("<h4>Instructions</h4><ol>")
-        for step in recipe.steps:
-            io.write("<li>{}</li>".format(cls.format_step(step)))
-        io.write("</ol>")
+            yield "<h4>Tools</h4><ul>"
+            yield "".join(f"<li>{tool}</li>" for tool in recipe.tools)
+            yield "</ul>"
+        yield "<h4>Ingredients</h4><ul>"
+        yield "".join(
+            f"<li>{cls.format_ingredient(ingredient)}</li>"
+            for ingredient in recipe.ingredients
+        )
+        yield "</ul><h4>Instructions</h4><ol>"
+        yield "".join(
+            f"<li>{cls.format_step(step)}</li>" for step in recipe.steps
+        )
+        yield "</ol>"
         if isinstance(recipe, CommentedRecipe):
             if len(recipe.references) > 0:
-                io.write("<h4>References</h4><ul>")
-                for reference in recipe.references:
-                    io.write(f"<li>{reference}</li>")
-                io.write("</ul>")
-        io.write("</body></html>")
+                yield "<h4>References</h4><ul>"
+                yield "".join(
+                    f"<li>{reference}</li>" for reference in recipe.references
+                )
+                yield "</ul>"
+        yield "</body></html>"
+
+
+class JSONWriter(BaseWriter):
+    """One JSON document per line, quantities as magnitude and unit"""
+
+    mimetype = "application/json"
+    extension = ".json"
+    separator = ""
+
+    @classmethod
+    def iter_recipe(cls, recipe):
+        # type: (Recipe) -> typing.Iterator[str]
+        yield json.dumps(
+            recipe.to_dict(structured=True), separators=(",", ":")
+        )
+        yield "\n"
+
+
+class MsgpackWriter(BaseWriter):
+    """MessagePack with the same layout as JSONWriter, concatenated"""
+
+    mimetype = "application/msgpack"
+    extension = ".msgpack"
+    binary = True
+    separator = b""
+
+    @classmethod
+    def iter_recipe(cls, recipe):
+        # type: (Recipe) -> typing.Iterator[bytes]
+        msgpack = import_msgpack()
+        yield msgpack.packb(recipe.to_dict(structured=True), use_bin_type=True)
 
 
 def get_writer(mimetype):
@@ -124,3 +219,54 @@ def get_writer(mimetype):
         if mimetype == cls.mimetype:
             return cls
     raise NotImplementedError(f"No writer for mimetype {mimetype}")
+
+
+class BaseReader:
+    """Reads back the recipes written by the writer of the same mimetype"""
+
+    mimetype = None  # type: typing.Optional[str]
+    binary = False
+
+    @classmethod
+    def iter_recipes(cls, io, unit_handler):
+        # type: (typing.IO[typing.Any], UnitHandler) -> typing.Iterator[Recipe]
+        raise NotImplementedError()
+
+    @classmethod
+    def read_recipe(cls, io, unit_handler):
+        # type: (typing.IO[typing.Any], UnitHandler) -> Recipe
+        """The one recipe in io"""
+        recipes = list(cls.iter_recipes(io, unit_handler))
+        if len(recipes) != 1:
+            raise ValueError(f"Expected one recipe, found {len(recipes)}")
+        return recipes[0]
+
+
+class JSONReader(BaseReader):
+    mimetype = "application/json"
+
+    @classmethod
+    def iter_recipes(cls, io, unit_handler):
+        # type: (typing.IO[typing.Any], UnitHandler) -> typing.Iterator[Recipe]
+        for line in io:
+            if line.strip():
+                yield recipe_from_dict(json.loads(line), unit_handler)
+
+
+class MsgpackReader(BaseReader):
+    mimetype = "application/msgpack"
+    binary = True
+
+    @classmethod
+    def iter_recipes(cls, io, unit_handler):
+        # type: (typing.IO[typing.Any], UnitHandler) -> typing.Iterator[Recipe]
+        msgpack = import_msgpack()
+        for data in msgpack.Unpacker(io, raw=False):
+            yield recipe_from_dict(data, unit_handler)
+
+
+def get_reader(mimetype):
+    for cls in BaseReader.__subclasses__():
+        if mimetype == cls.mimetype:
+            return cls
+    raise NotImplementedError(f"No reader for mimetype {mimetype}")
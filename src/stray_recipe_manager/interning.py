@@ -0,0 +1,188 @@
+import sys
+import attr
+import typing
+import weakref
+import threading
+import collections
+
+from stray_recipe_manager.recipe import (
+    Ingredient,
+    RecipeStep,
+    Recipe,
+    CommentedRecipe,
+)
+
+
+@attr.attrs(frozen=True, slots=True)
+class InternStats(object):
+    # Distinct values kept
+    strings = attr.ib(type=int, kw_only=True)
+    ingredients = attr.ib(type=int, kw_only=True)
+    steps = attr.ib(type=int, kw_only=True)
+    # Values replaced by an equal one already kept
+    hits = attr.ib(type=int, kw_only=True)
+    misses = attr.ib(type=int, kw_only=True)
+    # Shallow size of the replaced values, which are freed unless the
+    # caller still refers to them
+    bytes_saved = attr.ib(type=int, kw_only=True)
+    # Size of the tables of kept values themselves
+    table_bytes = attr.ib(type=int, kw_only=True)
+
+
+def quantity_key(quantity):
+    # type: (typing.Any) -> typing.Any
+    if quantity is None:
+        return None
+    # Quantities compare equal across units and int/float magnitudes, but
+    # only identical ones print the same
+    magnitude = quantity.magnitude
+    return (type(magnitude), magnitude, quantity.units)
+
+
+class Interner:
+    """Shares equal strings, ingredients and steps between loaded recipes
+
+    Ingredient items, identifiers, categories and notes, step descriptions
+    and groups, tags, tools and references are kept once per book, as are
+    identical Ingredient and RecipeStep objects. They are all immutable, so
+    recipes can share them freely.
+
+    Ingredients and steps are held weakly, and dropped with the last recipe
+    using them. Strings cannot be, so only the max_strings most recently
+    used are kept. Only intern recipes that are kept around, such as those
+    in a cache, as nothing is saved otherwise.
+    """
+
+    def __init__(self, max_strings=65536):
+        # type: (int) -> None
+        self.max_strings = max_strings
+        self.strings = (
+            collections.OrderedDict()
+        )  # type: collections.OrderedDict[str, str]
+        self.ingredients = (
+            weakref.WeakValueDictionary()
+        )  # type: weakref.WeakValueDictionary[typing.Any, Ingredient]
+        self.steps = (
+            weakref.WeakValueDictionary()
+        )  # type: weakref.WeakValueDictionary[typing.Any, RecipeStep]
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.lock = threading.Lock()
+
+    def clear(self):
+        # type: () -> None
+        with self.lock:
+            self.strings = collections.OrderedDict()
+            self.ingredients = weakref.WeakValueDictionary()
+            self.steps = weakref.WeakValueDictionary()
+
+    def stats(self):
+        # type: () -> InternStats
+        with self.lock:
+            return InternStats(
+                strings=len(self.strings),
+                ingredients=len(self.ingredients),
+                steps=len(self.steps),
+                hits=self.hits,
+                misses=self.misses,
+                bytes_saved=self.bytes_saved,
+                # WeakValueDictionary keeps its entries in a plain dict
+                table_bytes=sum(
+                    sys.getsizeof(table)
+                    for table in (
+                        self.strings,
+                        typing.cast(typing.Any, self.ingredients).data,
+                        typing.cast(typing.Any, self.steps).data,
+                    )
+                ),
+            )
+
+    def _string(self, value):
+        # type: (typing.Optional[str]) -> typing.Optional[str]
+        if value is None:
+            return None
+        kept = self.strings.get(value)
+        if kept is None:
+            self.misses += 1
+            self.strings[value] = value
+            if len(self.strings) > self.max_strings:
+                self.strings.popitem(last=False)
+            return value
+        self.strings.move_to_end(value)
+        if kept is not value:
+            self.hits += 1
+            self.bytes_saved += sys.getsizeof(value)
+        return kept
+
+    def _required_string(self, value):
+        # type: (str) -> str
+        kept = self._string(value)
+        assert kept is not None
+        return kept
+
+    def _replaced(self, duplicate, kept):
+        # type: (typing.Any, typing.Any) -> typing.Any
+        if kept is not duplicate:
+            self.hits += 1
+            self.bytes_saved += sys.getsizeof(duplicate)
+            for field in attr.fields(type(duplicate)):
+                value = getattr(duplicate, field.name)
+                if value is not None and value is not getattr(
+                    kept, field.name
+                ):
+                    self.bytes_saved += sys.getsizeof(value)
+        return kept
+
+    def _ingredient(self, ingredient):
+        # type: (Ingredient) -> Ingredient
+        key = (
+            ingredient.item,
+            ingredient.identifier,
+            ingredient.category,
+            ingredient.notes,
+            quantity_key(ingredient.quantity),
+        )
+        kept = self.ingredients.get(key)
+        if kept is not None:
+            return self._replaced(ingredient, kept)
+        self.misses += 1
+        kept = self.ingredients[key] = Ingredient(
+            item=self._required_string(ingredient.item),
+            quantity=ingredient.quantity,
+            identifier=self._string(ingredient.identifier),
+            category=self._string(ingredient.category),
+            notes=self._string(ingredient.notes),
+        )
+        return kept
+
+    def _step(self, step):
+        # type: (RecipeStep) -> RecipeStep
+        key = (step.description, step.group, quantity_key(step.time))
+        kept = self.steps.get(key)
+        if kept is not None:
+            return self._replaced(step, kept)
+        self.misses += 1
+        kept = self.steps[key] = RecipeStep(
+            description=self._required_string(step.description),
+            group=self._string(step.group),
+            time=step.time,
+        )
+        return kept
+
+    def recipe(self, recipe):
+        # type: (Recipe) -> Recipe
+        """Equal recipe built from shared strings, ingredients and steps"""
+        with self.lock:
+            fields = dict(
+                makes=self._ingredient(recipe.makes),
+                ingredients=[self._ingredient(i) for i in recipe.ingredients],
+                steps=[self._step(s) for s in recipe.steps],
+                tools=[self._string(t) for t in recipe.tools],
+                tags=[self._string(t) for t in recipe.tags],
+            )  # type: typing.Dict[str, typing.Any]
+            if isinstance(recipe, CommentedRecipe):
+                fields["references"] = [
+                    self._string(r) for r in recipe.references
+                ]
+        return attr.evolve(recipe, **fields)
@@ -0,0 +1,119 @@
+import typing
+import logging
+import concurrent.futures
+
+import pint
+
+from stray_recipe_manager.recipe import Recipe
+from stray_recipe_manager.storage import (
+    BaseStorage,
+    LoadErrorHandler,
+    SnapshotDecoder,
+    SnapshotEncoder,
+    get_storage,
+)
+
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64
+
+# (identifier, magnitude, unit ID)
+EncodedDensity = typing.Tuple[str, typing.Any, int]
+# (key, encoded recipe, densities it added, error)
+LoadResult = typing.Tuple[
+    str,
+    typing.Optional[typing.Tuple[typing.Any, ...]],
+    typing.List[EncodedDensity],
+    typing.Optional[Exception],
+]
+ChunkResult = typing.Tuple[typing.List[str], typing.List[LoadResult]]
+
+# Per worker process, set up by _init_worker
+_storage = None  # type: typing.Optional[BaseStorage]
+_base_densities = {}  # type: typing.Dict[str, pint.Quantity]
+
+
+def _init_worker(location):
+    # type: (str) -> None
+    global _storage, _base_densities
+    _storage = get_storage(location)
+    _base_densities = dict(_storage.get_unit_handler().densities)
+
+
+def _load_chunk(keys):
+    # type: (typing.Sequence[str]) -> ChunkResult
+    assert _storage is not None
+    unit_handler = _storage.get_unit_handler()
+    encoder = SnapshotEncoder()
+    results = []  # type: typing.List[LoadResult]
+    for key in keys:
+        # Every recipe starts from the book's own densities, so the parent
+        # can merge what each one added in order, as a serial load would
+        unit_handler.clear_densities()
+        for identifier, density in _base_densities.items():
+            unit_handler.add_density(identifier, density)
+        try:
+            recipe = _storage.get_recipe(key)
+        except Exception as e:
+            results.append((key, None, [], e))
+            continue
+        densities = [
+            (identifier,) + encoder.encode_quantity(density)
+            for identifier, density in unit_handler.densities.items()
+            if identifier not in _base_densities
+        ]
+        results.append((key, encoder.encode_recipe(recipe), densities, None))
+    return encoder.units, results
+
+
+def load_recipes(
+    storage,  # type: BaseStorage
+    keys,  # type: typing.Iterable[str]
+    jobs,  # type: int
+    chunk_size=CHUNK_SIZE,  # type: int
+    on_error=None,  # type: typing.Optional[LoadErrorHandler]
+):
+    # type: (...) -> typing.Iterator[typing.Tuple[str, Recipe]]
+    """Load recipes with a pool of jobs processes, in the order of keys
+
+    Densities defined by the recipes are added to the unit handler of
+    storage in that same order, so conflicting densities raise InvalidData
+    at the same recipe a serial load would.
+    """
+    keys = list(keys)
+    chunks = [
+        keys[start : start + chunk_size]
+        for start in range(0, len(keys), chunk_size)
+    ]
+    unit_handler = storage.get_unit_handler()
+    logger.info(
+        "Loading %d recipes in %d chunks with %d processes",
+        len(keys),
+        len(chunks),
+        jobs,
+    )
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=jobs,
+        initializer=_init_worker,
+        initargs=(storage.location(),),
+    ) as executor:
+        for units, results in executor.map(_load_chunk, chunks):
+            decoder = SnapshotDecoder(unit_handler.unit_registry, units)
+            for key, data, densities, error in results:
+                try:
+                    if error is not None:
+                        raise error
+                    for identifier, magnitude, unit_id in densities:
+                        unit_handler.add_density(
+                            identifier,
+                            decoder.decode_quantity(magnitude, unit_id),
+                        )
+                    assert data is not None
+                    recipe = decoder.decode_recipe(data)
+                except Exception as e:
+                    if on_error is None:
+                        raise
+                    on_error(key, e)
+                    continue
+                yield key, recipe
@@ -0,0 +1,214 @@
+import os
+import sys
+import time
+import errno
+import signal
+import socket
+import typing
+import logging
+
+from werkzeug.serving import make_server
+
+from stray_recipe_manager.server import RecipeViewer
+
+
+logger = logging.getLogger(__name__)
+
+AppFactory = typing.Callable[[], RecipeViewer]
+
+
+def bind_socket(host, port, backlog=128):
+    # type: (str, int, int) -> socket.socket
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class PreforkServer:
+    """Serve one app from several forked worker processes
+
+    The parent binds the listening socket and builds the app, preloading the
+    recipe book, before forking. Workers then share the loaded pages
+    copy-on-write and all accept from the same socket.
+
+    Signals to the parent: SIGTERM or SIGINT stop the workers after their
+    current request, SIGHUP rebuilds the app and replaces the workers one
+    by one. Workers that exit unexpectedly are restarted.
+    """
+
+    # Seconds a worker waits for a connection before checking for shutdown
+    poll_interval = 0.5
+    # Seconds old workers get to finish their request before SIGKILL
+    graceful_timeout = 30.0
+
+    def __init__(self, app_factory, host, port, workers=2):
+        # type: (AppFactory, str, int, int) -> None
+        if workers < 1:
+            raise ValueError(f"Invalid worker count {workers}")
+        self.app_factory = app_factory
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.sock = None  # type: typing.Optional[socket.socket]
+        self.app = None  # type: typing.Optional[RecipeViewer]
+        self.children = set()  # type: typing.Set[int]
+        self.stopping = False
+        self.reload_requested = False
+
+    def load_app(self):
+        # type: () -> RecipeViewer
+        start = time.perf_counter()
+        app = self.app_factory()
+        pages = app.preload()
+        logger.info(
+            "Preloaded %d pages in %.2fs", pages, time.perf_counter() - start
+        )
+        return app
+
+    def bind(self):
+        # type: () -> socket.socket
+        if self.sock is None:
+            self.sock = bind_socket(self.host, self.port)
+            # Port 0 picks a free port
+            self.port = self.sock.getsockname()[1]
+        return self.sock
+
+    def serve_forever(self):
+        # type: () -> None
+        self.bind()
+        self.app = self.load_app()
+        signal.signal(signal.SIGTERM, self.handle_stop)
+        signal.signal(signal.SIGINT, self.handle_stop)
+        signal.signal(signal.SIGHUP, self.handle_reload)
+        logger.info(
+            "Serving on %s:%d with %d workers",
+            self.host,
+            self.port,
+            self.workers,
+        )
+        try:
+            for _ in range(self.workers):
+                self.spawn_worker()
+            while not self.stopping:
+                if self.reload_requested:
+                    self.reload_requested = False
+                    self.reload()
+                self.reap_workers()
+                while not self.stopping and len(self.children) < self.workers:
+                    self.spawn_worker()
+                time.sleep(0.1)
+        finally:
+            self.stop_workers(self.children)
+            self.bind().close()
+
+    def handle_stop(self, signum, frame):
+        self.stopping = True
+
+    def handle_reload(self, signum, frame):
+        self.reload_requested = True
+
+    def spawn_worker(self):
+        # type: () -> int
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                self.run_worker()
+            except BaseException:
+                logger.exception("Worker %d failed", os.getpid())
+                status = 1
+            finally:
+                os._exit(status)
+        self.children.add(pid)
+        logger.debug("Started worker %d", pid)
+        return pid
+
+    def run_worker(self):
+        # type: () -> None
+        assert self.sock is not None and self.app is not None
+        running = [True]
+
+        def stop(signum, frame):
+            running[0] = False
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        server = make_server(
+            self.host, self.port, self.app, fd=self.sock.fileno()
+        )
+        server.timeout = self.poll_interval
+        while running[0]:
+            server.handle_request()
+
+    def reap_workers(self):
+        # type: () -> None
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except OSError as e:
+                if e.errno == errno.ECHILD:
+                    self.children.clear()
+                    return
+                raise
+            if pid == 0:
+                return
+            if pid in self.children:
+                self.children.discard(pid)
+                if not self.stopping:
+                    logger.warning(
+                        "Worker %d exited with status %d, restarting",
+                        pid,
+                        status,
+                    )
+
+    def reload(self):
+        # type: () -> None
+        logger.info("Reloading recipe book")
+        try:
+            app = self.load_app()
+        except Exception:
+            logger.exception("Reload failed, keeping the running workers")
+            return
+        self.app = app
+        for pid in list(self.children):
+            # Start the replacement first so the socket is always served
+            self.spawn_worker()
+            self.children.discard(pid)
+            self.stop_workers({pid})
+
+    def stop_workers(self, pids):
+        # type: (typing.Set[int]) -> None
+        pids = set(pids)
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + self.graceful_timeout
+        while pids:
+            for pid in list(pids):
+                try:
+                    done, _ = os.waitpid(pid, os.WNOHANG)
+                except ChildProcessError:
+                    done = pid
+                if done:
+                    pids.discard(pid)
+                    self.children.discard(pid)
+            if pids and time.monotonic() > deadline:
+                for pid in pids:
+                    logger.warning("Killing worker %d", pid)
+                    os.kill(pid, signal.SIGKILL)
+                deadline = float("inf")
+            time.sleep(0.05)
+
+
+def run_prefork(app_factory, host, port, workers=2):
+    # type: (AppFactory, str, int, int) -> None
+    if not hasattr(os, "fork"):
+        sys.exit("The prefork server needs a platform with os.fork")
+    PreforkServer(app_factory, host, port, workers).serve_forever()
@@ -2,7 +2,40 @@ import pint
 import attr
 import typing
 
-from stray_recipe_manager.units import UnitHandler, UnitPreferences
+from stray_recipe_manager.units import (
+    QuantityUnits,
+    UnitHandler,
+    UnitPreferences,
+)
+
+# numpy is optional and slow to import, so present_recipes imports it on
+# first use, leaving the module here or None if it is not installed
+_NOT_IMPORTED = object()
+numpy = _NOT_IMPORTED  # type: typing.Any
+
+
+def import_numpy():
+    # type: () -> typing.Any
+    global numpy
+    if numpy is _NOT_IMPORTED:
+        try:
+            import numpy as numpy_module
+        except ImportError:  # pragma: no cover
+            numpy = None
+        else:
+            numpy = numpy_module
+    return numpy
+
+
+def dump_quantity(quantity, structured=False):
+    # type: (pint.Quantity, bool) -> typing.Any
+    """Quantity as a string, or a magnitude and unit mapping if structured
+
+    UnitHandler.load_quantity reads either form back.
+    """
+    if structured:
+        return {"magnitude": quantity.magnitude, "unit": str(quantity.units)}
+    return str(quantity)
 
 
 @attr.attrs(frozen=True, slots=True)
@@ -14,14 +47,18 @@ class Ingredient(object):
     notes = attr.ib(default=None, type=typing.Optional[str], kw_only=True)
 
     @classmethod
-    def from_dict(cls, data, unit_handler):
-        # type: (typing.MutableMapping[str, str], UnitHandler) -> Ingredient
-        data["quantity"] = unit_handler.parse_quantity(data["quantity"])
+    def from_dict(
+        cls,
+        data,  # type: typing.MutableMapping[str, typing.Any]
+        unit_handler,  # type: UnitHandler
+    ):
+        # type: (...) -> Ingredient
+        data["quantity"] = unit_handler.load_quantity(data["quantity"])
         return cls(**data)
 
-    def to_dict(self):
+    def to_dict(self, structured=False):
         data = attr.asdict(self)
-        data["quantity"] = str(data["quantity"])
+        data["quantity"] = dump_quantity(self.quantity, structured)
         return data
 
 
@@ -37,13 +74,13 @@ class RecipeStep(object):
     def from_dict(cls, data, unit_handler):
         # type: (typing.MutableMapping[str, str], UnitHandler) -> RecipeStep
         if "time" in data and data["time"] is not None:
-            data["time"] = unit_handler.parse_quantity(data["time"], "[time]")
+            data["time"] = unit_handler.load_quantity(data["time"], "[time]")
         return cls(**data)
 
-    def to_dict(self):
+    def to_dict(self, structured=False):
         data = attr.asdict(self)
         if self.time is not None:
-            data["time"] = str(data["time"])
+            data["time"] = dump_quantity(self.time, structured)
         return data
 
 
@@ -72,11 +109,13 @@ class Recipe(object):
         ]
         return cls(**data)
 
-    def to_dict(self):
+    def to_dict(self, structured=False):
         data = attr.asdict(self, recurse=False)
-        data["makes"] = data["makes"].to_dict()
-        data["ingredients"] = [i.to_dict() for i in data["ingredients"]]
-        data["steps"] = [i.to_dict() for i in data["steps"]]
+        data["makes"] = data["makes"].to_dict(structured)
+        data["ingredients"] = [
+            i.to_dict(structured) for i in data["ingredients"]
+        ]
+        data["steps"] = [i.to_dict(structured) for i in data["steps"]]
         return data
 
 
@@ -100,24 +139,144 @@ class CommentedRecipe(Recipe):
         return cls(**data)
 
 
+# Placeholder for a field that is still a raw table
+_UNPARSED = object()
+
+
+def _parse_makes(data, unit_handler):
+    # type: (typing.Any, UnitHandler) -> Ingredient
+    return Ingredient.from_dict(dict(data), unit_handler)
+
+
+def _parse_ingredients(data, unit_handler):
+    # type: (typing.Any, UnitHandler) -> typing.List[Ingredient]
+    return [Ingredient.from_dict(dict(i), unit_handler) for i in data]
+
+
+def _parse_steps(data, unit_handler):
+    # type: (typing.Any, UnitHandler) -> typing.List[RecipeStep]
+    return [RecipeStep.from_dict(dict(i), unit_handler) for i in data]
+
+
+def _lazy_field(
+    name,  # type: str
+    parse,  # type: typing.Callable[[typing.Any, UnitHandler], typing.Any]
+):
+    # type: (...) -> typing.Any
+    private = "_" + name
+
+    def get(self):
+        # type: (typing.Any) -> typing.Any
+        value = getattr(self, private)
+        if value is _UNPARSED:
+            value = parse(self._raw[name], self._unit_handler)
+            object.__setattr__(self, private, value)
+        return value
+
+    # Only reached from the attrs __init__, assigning to a frozen recipe
+    # still raises FrozenInstanceError
+    def set(self, value):
+        # type: (typing.Any, typing.Any) -> None
+        object.__setattr__(self, private, value)
+
+    return property(get, set)
+
+
+class _LazyFields:
+    """Parses makes, ingredients and steps from their raw tables on first use
+
+    The properties take the place of the attrs slots of the recipe class,
+    so a lazy recipe can also be built like the eager one, as
+    present_recipe and attr.evolve do.
+    """
+
+    __slots__ = ()
+    eager_class = Recipe  # type: typing.Type[Recipe]
+    LAZY_FIELDS = ("makes", "ingredients", "steps")
+
+    makes = _lazy_field("makes", _parse_makes)
+    ingredients = _lazy_field("ingredients", _parse_ingredients)
+    steps = _lazy_field("steps", _parse_steps)
+
+    @classmethod
+    def from_dict(
+        cls,
+        data,  # type: typing.MutableMapping[str, typing.Any]
+        unit_handler,  # type: UnitHandler
+    ):
+        # type: (...) -> typing.Any
+        raw = {k: data[k] for k in cls.LAZY_FIELDS if k in data}
+        fields = dict(data)
+        fields.update((k, _UNPARSED) for k in raw)
+        recipe = cls(**fields)
+        object.__setattr__(recipe, "_raw", raw)
+        object.__setattr__(recipe, "_unit_handler", unit_handler)
+        return recipe
+
+    def parse(self):
+        # type: () -> None
+        """Parse all remaining fields now"""
+        for name in self.LAZY_FIELDS:
+            getattr(self, name)
+
+    # Equal to eager recipes of the class it stands in for
+    def __eq__(self, other):
+        # type: (typing.Any) -> bool
+        if other.__class__ not in (self.__class__, self.eager_class):
+            return NotImplemented
+        return all(
+            getattr(self, f.name) == getattr(other, f.name)
+            for f in attr.fields(self.eager_class)
+        )
+
+    def __ne__(self, other):
+        # type: (typing.Any) -> bool
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+
+class LazyRecipe(_LazyFields, Recipe):
+    __slots__ = ("_raw", "_unit_handler", "_makes", "_ingredients", "_steps")
+
+
+class LazyCommentedRecipe(_LazyFields, CommentedRecipe):
+    __slots__ = ("_raw", "_unit_handler", "_makes", "_ingredients", "_steps")
+    eager_class = CommentedRecipe
+
+
+def recipe_from_dict(
+    data,  # type: typing.MutableMapping[str, typing.Any]
+    unit_handler,  # type: UnitHandler
+    lazy=False,  # type: bool
+):
+    # type: (...) -> Recipe
+    """Recipe from a table, leaving quantities unparsed until used if lazy"""
+    if "comments" in data or "references" in data:
+        if lazy:
+            return LazyCommentedRecipe.from_dict(data, unit_handler)
+        return CommentedRecipe.from_dict(data, unit_handler)
+    else:
+        if lazy:
+            return LazyRecipe.from_dict(data, unit_handler)
+        return Recipe.from_dict(data, unit_handler)
+
+
 def present_recipe(recipe, prefs, scale=1.0):
     # type: (Recipe, UnitPreferences, float) -> Recipe
+    plan = prefs.conversion_plan()
+
     def mutate_ingredient(ingredient):
         # type: (Ingredient) -> Ingredient
-        if ingredient.category is None:
-            n_unit = None
-        else:
-            n_unit = prefs.get_unit_preference(ingredient.category)
-        n_quantity = (
-            ingredient.quantity
-            if n_unit is None
-            else prefs.unit_handler.do_conversion(
-                ingredient.quantity, n_unit, ingredient.identifier
-            )
-        )
         return Ingredient(
             item=ingredient.item,
-            quantity=scale * n_quantity,
+            quantity=plan.convert(
+                ingredient.quantity,
+                ingredient.category,
+                ingredient.identifier,
+                scale,
+            ),
             identifier=ingredient.identifier,
             category=ingredient.category,
             notes=ingredient.notes,
@@ -127,3 +286,105 @@ def present_recipe(recipe, prefs, scale=1.0):
     data["makes"] = mutate_ingredient(data["makes"])
     data["ingredients"] = [mutate_ingredient(i) for i in data["ingredients"]]
     return recipe.__class__(**data)
+
+
+# (unit, multiplier) -> positions, magnitudes and scales of the ingredients
+BatchKey = typing.Tuple[QuantityUnits, float]
+BatchGroup = typing.Tuple[
+    typing.List[int], typing.List[typing.Any], typing.List[float]
+]
+
+
+def present_recipes(
+    recipes,  # type: typing.Iterable[typing.Tuple[Recipe, float]]
+    prefs,  # type: UnitPreferences
+):
+    # type: (...) -> typing.List[Recipe]
+    """Batch version of present_recipe for many (recipe, scale) pairs
+
+    Ingredients sharing a conversion are scaled together, using numpy when
+    it is available, and equal results share a single quantity object.
+    """
+    plan = prefs.conversion_plan()
+    quantity_cls = prefs.unit_handler.unit_registry.Quantity
+    pairs = list(recipes)
+
+    ingredients = []  # type: typing.List[Ingredient]
+    quantities = []  # type: typing.List[typing.Optional[pint.Quantity]]
+    groups = {}  # type: typing.Dict[BatchKey, BatchGroup]
+    for recipe, scale in pairs:
+        for ingredient in [recipe.makes] + list(recipe.ingredients):
+            position = len(ingredients)
+            ingredients.append(ingredient)
+            quantity = ingredient.quantity
+            entry = plan.lookup(
+                quantity.units, ingredient.category, ingredient.identifier
+            )
+            if entry is None:
+                key = (quantity.units, 1.0)
+            elif entry[1] is None:
+                quantities.append(
+                    plan.convert(
+                        quantity,
+                        ingredient.category,
+                        ingredient.identifier,
+                        scale,
+                    )
+                )
+                continue
+            else:
+                key = typing.cast(BatchKey, entry)
+            quantities.append(None)
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = ([], [], [])
+            group[0].append(position)
+            group[1].append(quantity.magnitude)
+            group[2].append(scale)
+
+    # Quantities are immutable, so equal results share one pint object
+    np = import_numpy()
+    for (unit, factor), (positions, magnitudes, scales) in groups.items():
+        if np is not None:
+            values = (
+                np.asarray(magnitudes, dtype=float) * factor
+            ) * np.asarray(scales, dtype=float)
+            unique, inverse = np.unique(values, return_inverse=True)
+            made = [quantity_cls(v, unit) for v in unique.tolist()]
+            for position, i in zip(positions, inverse.tolist()):
+                quantities[position] = made[i]
+        else:
+            memo = {}  # type: typing.Dict[float, pint.Quantity]
+            for position, m, s in zip(positions, magnitudes, scales):
+                value = m * factor * s
+                made_quantity = memo.get(value)
+                if made_quantity is None:
+                    made_quantity = memo[value] = quantity_cls(value, unit)
+                quantities[position] = made_quantity
+
+    # Every position has its quantity by now
+    converted_quantities = typing.cast(typing.List[pint.Quantity], quantities)
+
+    presented = []
+    position = 0
+    for recipe, scale in pairs:
+        count = 1 + len(recipe.ingredients)
+        converted = [
+            Ingredient(
+                item=ingredient.item,
+                quantity=quantity,
+                identifier=ingredient.identifier,
+                category=ingredient.category,
+                notes=ingredient.notes,
+            )
+            for ingredient, quantity in zip(
+                ingredients[position : position + count],
+                converted_quantities[position : position + count],
+            )
+        ]
+        position += count
+        data = attr.asdict(recipe, recurse=False)
+        data["makes"] = converted[0]
+        data["ingredients"] = converted[1:]
+        presented.append(recipe.__class__(**data))
+    return presented
@@ -0,0 +1,344 @@
+import os
+import re
+import json
+import math
+import heapq
+import typing
+import operator
+import pathlib
+import logging
+import threading
+
+from stray_recipe_manager.recipe import Recipe, CommentedRecipe
+
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 2
+TOKEN_RE = re.compile(r"\w+")
+# Too common in recipe text to help ranking
+STOPWORDS = frozenset(
+    "a an and are as at be by for from in into is it of on or the then "
+    "to until with".split()
+)
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# field -> terms of one recipe
+RecipeTerms = typing.Dict[str, typing.List[str]]
+# (recipe key, score)
+SearchResult = typing.Tuple[str, float]
+# term -> recipe key -> term frequency
+Postings = typing.Dict[str, typing.Dict[str, int]]
+# term -> recipe key -> BM25 weight
+Weights = typing.Dict[str, typing.Dict[str, float]]
+
+
+def tokenize(text):
+    # type: (str) -> typing.List[str]
+    return TOKEN_RE.findall(text.lower())
+
+
+def text_terms(text):
+    # type: (str) -> typing.Dict[str, int]
+    counts = {}  # type: typing.Dict[str, int]
+    for token in tokenize(text):
+        if token not in STOPWORDS:
+            counts[token] = counts.get(token, 0) + 1
+    return counts
+
+
+def normalize(term):
+    # type: (str) -> str
+    return " ".join(tokenize(term))
+
+
+class RecipeIndex:
+    """Inverted index from ingredients, tags, tools and text to recipe keys
+
+    Ingredients are indexed by identifier, full item name and each word of
+    the item name, so a search for "butter" finds "Butter or neutral oil".
+    The name, steps, comments and references form the free text, which is
+    ranked with BM25.
+    """
+
+    FIELDS = ("ingredient", "tag", "tool")
+
+    def __init__(self):
+        # type: () -> None
+        self.postings = {
+            field: {} for field in self.FIELDS
+        }  # type: typing.Dict[str, typing.Dict[str, typing.Set[str]]]
+        self.terms = {}  # type: typing.Dict[str, RecipeTerms]
+        self.signatures = {}  # type: typing.Dict[str, typing.Any]
+        self.text_postings = {}  # type: Postings
+        self.text_terms = {}  # type: typing.Dict[str, typing.Dict[str, int]]
+        self.text_lengths = {}  # type: typing.Dict[str, int]
+        self.total_text_length = 0
+        # Depends on collection statistics, so any change invalidates it
+        self.weight_cache = {}  # type: Weights
+        # IDs of the posting sets and dicts not shared with a copy
+        self.owned = set()  # type: typing.Set[int]
+
+    def __contains__(self, recipe_key):
+        # type: (str) -> bool
+        return recipe_key in self.terms
+
+    def __len__(self):
+        # type: () -> int
+        return len(self.terms)
+
+    @staticmethod
+    def recipe_terms(recipe):
+        # type: (Recipe) -> RecipeTerms
+        ingredient_terms = set()
+        for ingredient in recipe.ingredients:
+            ingredient_terms.add(normalize(ingredient.item))
+            ingredient_terms.update(tokenize(ingredient.item))
+            if ingredient.identifier is not None:
+                ingredient_terms.add(normalize(ingredient.identifier))
+        return {
+            "ingredient": sorted(ingredient_terms),
+            "tag": sorted(set(normalize(t) for t in recipe.tags)),
+            "tool": sorted(set(normalize(t) for t in recipe.tools)),
+        }
+
+    @staticmethod
+    def recipe_text(recipe):
+        # type: (Recipe) -> typing.Dict[str, int]
+        parts = [recipe.name]
+        parts.extend(step.description for step in recipe.steps)
+        if isinstance(recipe, CommentedRecipe):
+            if recipe.comments is not None:
+                parts.append(recipe.comments)
+            parts.extend(recipe.references)
+        return text_terms("\n".join(parts))
+
+    def copy(self):
+        # type: () -> RecipeIndex
+        """Copy sharing the posting lists until either index changes them
+
+        Only the top level mappings are copied, so copying is cheap
+        compared to indexing again, and the original index stays valid for
+        concurrent readers as long as only the copy is changed.
+        """
+        index = RecipeIndex()
+        index.postings = {
+            field: dict(postings) for field, postings in self.postings.items()
+        }
+        index.terms = dict(self.terms)
+        index.signatures = dict(self.signatures)
+        index.text_postings = dict(self.text_postings)
+        index.text_terms = dict(self.text_terms)
+        index.text_lengths = dict(self.text_lengths)
+        index.total_text_length = self.total_text_length
+        # Both indices now share every posting list
+        self.owned = set()
+        return index
+
+    def _writable(
+        self,
+        mapping,  # type: typing.Dict[str, typing.Any]
+        term,  # type: str
+        factory,  # type: typing.Callable[[typing.Iterable], typing.Any]
+    ):
+        # type: (...) -> typing.Any
+        """Posting list of term in mapping, copied first if it is shared"""
+        value = mapping.get(term)
+        if value is None or id(value) not in self.owned:
+            value = mapping[term] = factory(value or ())
+            self.owned.add(id(value))
+        return value
+
+    def add(self, recipe_key, recipe, signature=None):
+        # type: (str, Recipe, typing.Any) -> None
+        self.add_terms(
+            recipe_key,
+            self.recipe_terms(recipe),
+            self.recipe_text(recipe),
+            signature,
+        )
+
+    def add_terms(self, recipe_key, terms, text, signature=None):
+        # type: (str, RecipeTerms, typing.Dict[str, int], typing.Any) -> None
+        self.remove(recipe_key)
+        self.weight_cache.clear()
+        self.terms[recipe_key] = terms
+        self.signatures[recipe_key] = signature
+        for field in self.FIELDS:
+            postings = self.postings[field]
+            for term in terms.get(field, []):
+                self._writable(postings, term, set).add(recipe_key)
+        self.text_terms[recipe_key] = text
+        length = sum(text.values())
+        self.text_lengths[recipe_key] = length
+        self.total_text_length += length
+        for term, count in text.items():
+            self._writable(self.text_postings, term, dict)[recipe_key] = count
+
+    def remove(self, recipe_key):
+        # type: (str) -> None
+        terms = self.terms.pop(recipe_key, None)
+        self.signatures.pop(recipe_key, None)
+        if terms is None:
+            return
+        self.weight_cache.clear()
+        for term in self.text_terms.pop(recipe_key, {}):
+            if term in self.text_postings:
+                counts = self._writable(self.text_postings, term, dict)
+                counts.pop(recipe_key, None)
+                if not counts:
+                    self.owned.discard(id(counts))
+                    del self.text_postings[term]
+        self.total_text_length -= self.text_lengths.pop(recipe_key, 0)
+        for field in self.FIELDS:
+            postings = self.postings[field]
+            for term in terms.get(field, []):
+                if term in postings:
+                    keys = self._writable(postings, term, set)
+                    keys.discard(recipe_key)
+                    if not keys:
+                        self.owned.discard(id(keys))
+                        del postings[term]
+
+    def find(
+        self,
+        ingredients=(),  # type: typing.Iterable[str]
+        tags=(),  # type: typing.Iterable[str]
+        tools=(),  # type: typing.Iterable[str]
+    ):
+        # type: (...) -> typing.List[str]
+        """Keys of recipes matching every given term, sorted"""
+        result = None  # type: typing.Optional[typing.Set[str]]
+        for field, queries in [
+            ("ingredient", ingredients),
+            ("tag", tags),
+            ("tool", tools),
+        ]:
+            for query in queries:
+                keys = self.postings[field].get(normalize(query), set())
+                result = keys.copy() if result is None else result & keys
+        if result is None:
+            return sorted(self.terms)
+        return sorted(result)
+
+    def search_text(
+        self,
+        query,  # type: str
+        limit=10,  # type: typing.Optional[int]
+        within=None,  # type: typing.Optional[typing.Container[str]]
+    ):
+        # type: (...) -> typing.List[SearchResult]
+        """Best (recipe key, BM25 score) matches for free text, best first
+
+        Only recipe keys in within are considered, if it is given.
+        """
+        weights = [self.term_weights(t) for t in set(text_terms(query))]
+        weights = [w for w in weights if w]
+        if not weights:
+            return []
+        # Start from the largest posting list, so fewer keys get added
+        weights.sort(key=len, reverse=True)
+        scores = weights[0]
+        if len(weights) > 1:
+            scores = dict(scores)
+            for term_weights in weights[1:]:
+                for key, weight in term_weights.items():
+                    scores[key] = scores.get(key, 0.0) + weight
+        items = scores.items()  # type: typing.Iterable[SearchResult]
+        if within is not None:
+            items = [(k, v) for k, v in items if k in within]
+        if limit is not None:
+            items = heapq.nlargest(limit, items, key=operator.itemgetter(1))
+        return sorted(items, key=lambda i: (-i[1], i[0]))
+
+    def term_weights(self, term):
+        # type: (str) -> typing.Dict[str, float]
+        """BM25 contribution of a term to each recipe containing it"""
+        weights = self.weight_cache.get(term)
+        if weights is not None:
+            return weights
+        postings = self.text_postings.get(term)
+        if not postings:
+            return {}
+        count = len(self.terms)
+        idf = math.log(
+            1.0 + (count - len(postings) + 0.5) / (len(postings) + 0.5)
+        )
+        average_length = max(self.total_text_length / count, 1.0)
+        base = BM25_K1 * (1.0 - BM25_B)
+        per_length = BM25_K1 * BM25_B / average_length
+        lengths = self.text_lengths
+        scale = idf * (BM25_K1 + 1.0)
+        weights = {
+            key: scale * tf / (tf + base + per_length * lengths[key])
+            for key, tf in postings.items()
+        }
+        self.weight_cache[term] = weights
+        return weights
+
+    def to_dict(self):
+        # type: () -> typing.Dict[str, typing.Any]
+        return {
+            "version": INDEX_VERSION,
+            "recipes": {
+                key: {
+                    "signature": self.signatures[key],
+                    "terms": terms,
+                    "text": self.text_terms[key],
+                }
+                for key, terms in self.terms.items()
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        # type: (typing.Mapping[str, typing.Any]) -> RecipeIndex
+        index = cls()
+        if data.get("version") != INDEX_VERSION:
+            logger.info(
+                "Discarding index with version %s", data.get("version")
+            )
+            return index
+        for key, entry in data["recipes"].items():
+            signature = entry["signature"]
+            index.add_terms(
+                key,
+                entry["terms"],
+                entry["text"],
+                tuple(signature) if isinstance(signature, list) else signature,
+            )
+        return index
+
+    @classmethod
+    def load(cls, path):
+        # type: (pathlib.Path) -> RecipeIndex
+        try:
+            with path.open("r") as f:
+                return cls.from_dict(json.load(f))
+        except FileNotFoundError:
+            return cls()
+        except ValueError as e:
+            logger.warning("Ignoring unreadable index %s: %s", path, e)
+            return cls()
+
+    def save(self, path):
+        # type: (pathlib.Path) -> None
+        """Replace path in one step, readers never see a partial index"""
+        # Unique per writer, so concurrent saves do not mix their files
+        tmp_path = path.with_name(
+            f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+        )
+        try:
+            with tmp_path.open("w") as f:
+                json.dump(self.to_dict(), f, separators=(",", ":"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(str(tmp_path), str(path))
+        except BaseException:
+            try:
+                tmp_path.unlink()
+            except FileNotFoundError:
+                pass
+            raise
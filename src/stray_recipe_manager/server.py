@@ -1,22 +1,77 @@
+import json
+import typing
+import hashlib
 import logging
+import datetime
+import pint
 from werkzeug.wrappers import Request, Response
 from werkzeug.routing import Map, Rule
-from werkzeug.exceptions import HTTPException, NotFound
+from werkzeug.exceptions import HTTPException, InternalServerError, NotFound
+from werkzeug.http import is_resource_modified
 from werkzeug.middleware.shared_data import SharedDataMiddleware
-from stray_recipe_manager.storage import get_storage
-from stray_recipe_manager.units import UnitPreferences
-from stray_recipe_manager.recipe import present_recipe
+from stray_recipe_manager.cache import LRUCache
+from stray_recipe_manager.storage import (
+    BaseStorage,
+    RecipeVersion,
+    get_storage,
+)
+from stray_recipe_manager.units import (
+    InvalidConversion,
+    InvalidData,
+    UnitHandler,
+    UnitPreferences,
+)
+from stray_recipe_manager.recipe import Recipe, present_recipe
+from stray_recipe_manager.formatter import JSONWriter
 from jinja2 import BaseLoader, FileSystemLoader, PackageLoader, Environment
 
 
 logger = logging.getLogger(__name__)
 
+# Raised by loading a recipe with invalid data, or presenting it without the
+# densities its conversions need
+RECIPE_ERRORS = (
+    KeyError,
+    InvalidData,
+    InvalidConversion,
+    pint.errors.PintError,
+)
+
 
 class RecipeViewer:
+    # Recipe page formats, by URL extension
+    page_mimetypes = {"html": "text/html", "json": "application/json"}
+
     def __init__(self, config):
-        self.storage = get_storage(config["storage_path"])
-        self.unit_handler = self.storage.get_unit_handler()
+        self.config = config
+        if config.get("storage") is not None:
+            self.storage = config["storage"]
+        else:
+            self.storage = get_storage(
+                config["storage_path"], lazy=config.get("lazy", False)
+            )
+        if config.get("watch", False):
+            from stray_recipe_manager.watcher import watch_storage
+
+            self.storage = watch_storage(self.storage)
+        self.prefs = UnitPreferences(self.storage.get_unit_handler())
+        if config.get("prefs_file") is not None:
+            with open(config["prefs_file"], "r") as f:
+                self.prefs.load_from_toml_file(f)
+        # Preferences for the unit handler of the latest request
+        self.current_prefs = self.prefs
         self.host_base = config["host_base"]
+        # Rendered recipe pages by ETag
+        self.page_cache = LRUCache(
+            config.get("page_cache_size", 256)
+        )  # type: LRUCache[str, bytes]
+        self.cache_max_age = config.get("cache_max_age", 0)
+        self.stream_templates = config.get("stream_templates", False)
+        self.densities_key = (
+            None,
+            -1,
+            "",
+        )  # type: typing.Tuple[typing.Optional[UnitHandler], int, str]
         if config["template_dir"] is None:
             loader = PackageLoader(
                 "stray_recipe_manager", "templates"
@@ -28,11 +83,16 @@ class RecipeViewer:
             [
                 Rule("/", endpoint="view_index"),
                 Rule("/recipe/<recipe_name>.html", endpoint="view_recipe"),
+                Rule("/search", endpoint="search"),
+                Rule("/api/recipes.json", endpoint="api_index"),
+                Rule("/api/recipe/<recipe_name>.json", endpoint="api_recipe"),
             ]
         )
 
     def render_template(self, template_name, **context):
         t = self.jinja_env.get_template(template_name)
+        if self.stream_templates:
+            return Response(t.generate(context), mimetype="text/html")
         return Response(t.render(context), mimetype="text/html")
 
     def dispatch_request(self, request):
@@ -44,19 +104,214 @@ class RecipeViewer:
             return e
 
     def on_view_index(self, request):
+        per_page = min(
+            max(request.args.get("per_page", 100, type=int), 1), 1000
+        )
+        keys = self.storage.sorted_recipe_keys()
+        pages = max((len(keys) + per_page - 1) // per_page, 1)
+        page = min(max(request.args.get("page", 1, type=int), 1), pages)
+        descending = request.args.get("order") == "desc"
+        if descending:
+            end = len(keys) - (page - 1) * per_page
+            recipes = keys[max(end - per_page, 0) : end][::-1]
+        else:
+            recipes = keys[(page - 1) * per_page : page * per_page]
+        return self.render_template(
+            "recipe_index.html",
+            recipes=recipes,
+            page=page,
+            pages=pages,
+            per_page=per_page,
+            order="desc" if descending else "asc",
+        )
+
+    def on_search(self, request):
+        query = {
+            field: [v for v in request.args.getlist(field) if v.strip()]
+            for field in ("ingredient", "tag", "tool")
+        }
+        text = request.args.get("q", "").strip()
+        if text:
+            results = self.storage.search_text(
+                text,
+                request.args.get("limit", 20, type=int),
+                query["ingredient"],
+                query["tag"],
+                query["tool"],
+            )
+            recipes = [key for key, score in results]
+        elif any(query.values()):
+            recipes = self.storage.find_recipes(
+                query["ingredient"], query["tag"], query["tool"]
+            )
+        else:
+            recipes = []
         return self.render_template(
-            "recipe_index.html", recipes=self.storage.recipe_keys()
+            "search.html", recipes=recipes, query=query, text=text
+        )
+
+    def on_api_index(self, request):
+        return Response(
+            json.dumps({"recipes": list(self.storage.sorted_recipe_keys())}),
+            mimetype="application/json",
+        )
+
+    def current_state(self):
+        # type: () -> typing.Tuple[BaseStorage, UnitPreferences]
+        """Storage snapshot and preferences to serve one request from
+
+        A watched book publishes every change with a new unit handler, for
+        which the preferences are copied.
+        """
+        storage = self.storage.snapshot()
+        unit_handler = storage.get_unit_handler()
+        prefs = self.current_prefs
+        if prefs.unit_handler is not unit_handler:
+            prefs = UnitPreferences(unit_handler)
+            prefs.preferences = dict(self.prefs.preferences)
+            self.current_prefs = prefs
+        return storage, prefs
+
+    def densities_fingerprint(self, unit_handler):
+        # type: (UnitHandler) -> str
+        cached_handler, revision, densities = self.densities_key
+        if (
+            cached_handler is not unit_handler
+            or revision != unit_handler.revision
+        ):
+            densities = repr(
+                sorted((k, str(v)) for k, v in unit_handler.densities.items())
+            )
+            self.densities_key = (
+                unit_handler,
+                unit_handler.revision,
+                densities,
+            )
+        return densities
+
+    def recipe_etag(self, prefs, recipe_name, version, page_format="html"):
+        # type: (UnitPreferences, str, RecipeVersion, str) -> str
+        return hashlib.sha1(
+            repr(
+                (
+                    recipe_name,
+                    page_format,
+                    version.tag,
+                    prefs.cache_key(),
+                    self.densities_fingerprint(prefs.unit_handler),
+                )
+            ).encode("utf-8")
+        ).hexdigest()
+
+    def build_page(self, storage, prefs, recipe_name, page_format="html"):
+        # type: (BaseStorage, UnitPreferences, str, str) -> bytes
+        """Recipe page, raising whatever loading the recipe raises"""
+        return self.recipe_page(
+            prefs, storage.get_recipe(recipe_name), page_format
         )
 
+    def recipe_page(self, prefs, recipe, page_format="html"):
+        # type: (UnitPreferences, Recipe, str) -> bytes
+        # Lazy recipes only parse their quantities here
+        p_recipe = present_recipe(recipe, prefs, 1.0)
+        if page_format == "json":
+            return "".join(JSONWriter.iter_recipe(p_recipe)).encode("utf-8")
+        t = self.jinja_env.get_template("recipe.html")
+        return t.render(recipe=p_recipe).encode("utf-8")
+
+    def render_recipe(self, storage, prefs, recipe_name, page_format="html"):
+        # type: (BaseStorage, UnitPreferences, str, str) -> bytes
+        try:
+            return self.build_page(storage, prefs, recipe_name, page_format)
+        except RECIPE_ERRORS as e:
+            # Recipe data missing a required key raises KeyError as well
+            if isinstance(e, KeyError) and (
+                recipe_name not in storage.sorted_recipe_keys()
+            ):
+                raise NotFound(str(e))
+            logger.warning("Unable to load recipe %s: %s", recipe_name, e)
+            raise InternalServerError(f"Recipe {recipe_name} is invalid")
+
+    def cached_page(
+        self,
+        storage,  # type: BaseStorage
+        prefs,  # type: UnitPreferences
+        recipe_name,  # type: str
+        version,  # type: RecipeVersion
+        etag=None,  # type: typing.Optional[str]
+        page_format="html",  # type: str
+    ):
+        # type: (...) -> typing.Tuple[str, bytes]
+        if etag is None:
+            etag = self.recipe_etag(prefs, recipe_name, version, page_format)
+        body = self.page_cache.get(etag)
+        if body is None:
+            body = self.render_recipe(storage, prefs, recipe_name, page_format)
+            # Loading the recipe may have added densities
+            etag = self.recipe_etag(prefs, recipe_name, version, page_format)
+            self.page_cache.put(etag, body)
+        return etag, body
+
+    def preload(self):
+        # type: () -> int
+        """Load the search index and render recipe pages ahead of requests
+
+        Returns the number of pages rendered, at most the page cache size.
+        """
+        storage, prefs = self.current_state()
+        storage.get_index()
+        count = 0
+        for recipe_name in storage.sorted_recipe_keys():
+            if (
+                self.page_cache.maxsize is not None
+                and count >= self.page_cache.maxsize
+            ):
+                break
+            version = storage.recipe_version(recipe_name)
+            if version is None:
+                break
+            self.cached_page(storage, prefs, recipe_name, version)
+            count += 1
+        return count
+
     def on_view_recipe(self, request, recipe_name):
+        return self.recipe_response(request, recipe_name, "html")
+
+    def on_api_recipe(self, request, recipe_name):
+        return self.recipe_response(request, recipe_name, "json")
+
+    def recipe_response(self, request, recipe_name, page_format):
+        mimetype = self.page_mimetypes[page_format]
+        # Every read of this request comes from the same snapshot
+        storage, prefs = self.current_state()
         try:
-            prefs = UnitPreferences(self.unit_handler)
+            version = storage.recipe_version(recipe_name)
         except KeyError as e:
-
             raise NotFound(str(e))
-        recipe = self.storage.get_recipe(recipe_name)
-        p_recipe = present_recipe(recipe, prefs, 1.0)
-        return self.render_template("recipe.html", recipe=p_recipe)
+        if version is None:
+            return Response(
+                self.render_recipe(storage, prefs, recipe_name, page_format),
+                mimetype=mimetype,
+            )
+        etag = self.recipe_etag(prefs, recipe_name, version, page_format)
+        last_modified = datetime.datetime.fromtimestamp(
+            version.modified, tz=datetime.timezone.utc
+        )
+        if not is_resource_modified(
+            request.environ, etag=etag, last_modified=last_modified
+        ):
+            response = Response(status=304)
+        else:
+            etag, body = self.cached_page(
+                storage, prefs, recipe_name, version, etag, page_format
+            )
+            response = Response(body, mimetype=mimetype)
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        response.cache_control.public = True
+        response.cache_control.max_age = self.cache_max_age
+        response.cache_control.must_revalidate = True
+        return response
 
     def wsgi_app(self, environ, start_response):
         request = Request(environ)
@@ -67,12 +322,27 @@ class RecipeViewer:
         return self.wsgi_app(environ, start_response)
 
 
-def create_app(storage_path, host_base, template_dir=None, static_dir=None):
+def create_app(
+    storage_path,
+    host_base,
+    template_dir=None,
+    static_dir=None,
+    prefs_file=None,
+    cache_max_age=0,
+    stream_templates=False,
+    watch=False,
+    lazy=False,
+):
     app = RecipeViewer(
         {
             "storage_path": storage_path,
             "host_base": host_base,
             "template_dir": template_dir,
+            "prefs_file": prefs_file,
+            "cache_max_age": cache_max_age,
+            "stream_templates": stream_templates,
+            "watch": watch,
+            "lazy": lazy,
         }
     )
     if static_dir is None:
@@ -0,0 +1,143 @@
+import attr
+import pint
+import typing
+import logging
+import collections
+
+from stray_recipe_manager.recipe import Recipe
+from stray_recipe_manager.storage import BaseStorage
+from stray_recipe_manager.units import (
+    InvalidConversion,
+    QuantityUnits,
+    UnitPreferences,
+)
+
+
+logger = logging.getLogger(__name__)
+
+# (identifier or item, category, unit)
+ShoppingKey = typing.Tuple[str, typing.Optional[str], QuantityUnits]
+
+
+@attr.attrs(frozen=True, slots=True)
+class ShoppingItem(object):
+    item = attr.ib(type=str, kw_only=True)
+    quantity = attr.ib(type=pint.Quantity, kw_only=True)
+    identifier = attr.ib(default=None, type=typing.Optional[str], kw_only=True)
+    category = attr.ib(default=None, type=typing.Optional[str], kw_only=True)
+
+
+class ShoppingListBuilder:
+    """Sum ingredients of many recipes, one canonical unit per category
+
+    The canonical unit of a category is the preferred unit if one is set,
+    otherwise the unit it was first seen with. Ingredients that can not be
+    converted to it (e.g. no density known) are summed in their own unit.
+    """
+
+    def __init__(self, prefs):
+        # type: (UnitPreferences) -> None
+        self.unit_handler = prefs.unit_handler
+        # Private copy, canonical units get added as categories show up
+        self.prefs = UnitPreferences(self.unit_handler)
+        for category, unit in prefs.preferences.items():
+            self.prefs.set_unit_preference(category, unit)
+        self.totals = (
+            collections.OrderedDict()
+        )  # type: typing.Dict[ShoppingKey, float]
+        self.labels = {}  # type: typing.Dict[str, str]
+        self.identifiers = {}  # type: typing.Dict[str, typing.Optional[str]]
+
+    def add_recipe(self, recipe, scale=1.0):
+        # type: (Recipe, float) -> None
+        plan = None
+        for ingredient in recipe.ingredients:
+            quantity = ingredient.quantity
+            category = ingredient.category
+            if (
+                category is not None
+                and self.prefs.get_unit_preference(category) is None
+            ):
+                # Units of registry quantities are that registry's Unit
+                self.prefs.set_unit_preference(
+                    category, typing.cast(pint.Unit, quantity.units)
+                )
+                plan = None
+            if plan is None:
+                plan = self.prefs.conversion_plan()
+            try:
+                entry = plan.lookup(
+                    quantity.units, category, ingredient.identifier
+                )
+            except InvalidConversion:
+                entry = None
+            if entry is None or entry[1] is None:
+                unit, factor = quantity.units, 1.0
+            else:
+                unit, factor = typing.cast(
+                    typing.Tuple[pint.Unit, float], entry
+                )
+            name = (
+                ingredient.identifier
+                if ingredient.identifier is not None
+                else ingredient.item
+            )
+            key = (name, category, unit)
+            self.totals[key] = (
+                self.totals.get(key, 0.0) + quantity.magnitude * factor * scale
+            )
+            if name not in self.labels:
+                self.labels[name] = ingredient.item
+                self.identifiers[name] = ingredient.identifier
+
+    def items(self):
+        # type: () -> typing.List[ShoppingItem]
+        quantity_cls = self.unit_handler.unit_registry.Quantity
+        items = [
+            ShoppingItem(
+                item=self.labels[name],
+                quantity=quantity_cls(magnitude, unit),
+                identifier=self.identifiers[name],
+                category=category,
+            )
+            for (name, category, unit), magnitude in self.totals.items()
+        ]
+        items.sort(key=lambda i: (i.category or "", i.item.lower()))
+        return items
+
+
+def build_shopping_list(
+    storage,  # type: BaseStorage
+    selections,  # type: typing.Iterable[typing.Tuple[str, float]]
+    prefs=None,  # type: typing.Optional[UnitPreferences]
+):
+    # type: (...) -> typing.List[ShoppingItem]
+    if prefs is None:
+        prefs = UnitPreferences(storage.get_unit_handler())
+    # Ingredient amounts are linear in scale, so each recipe is summed once
+    scales = collections.OrderedDict()  # type: typing.Dict[str, float]
+    for key, scale in selections:
+        scales[key] = scales.get(key, 0.0) + scale
+    builder = ShoppingListBuilder(prefs)
+    for key, scale in scales.items():
+        builder.add_recipe(storage.get_recipe(key), scale)
+    logger.info(
+        "Summed %d distinct recipes into %d items",
+        len(scales),
+        len(builder.totals),
+    )
+    return builder.items()
+
+
+def write_shopping_list(io, items):
+    # type: (typing.TextIO, typing.Iterable[ShoppingItem]) -> None
+    category = None  # type: typing.Optional[str]
+    first = True
+    for item in items:
+        if first or item.category != category:
+            category = item.category
+            if not first:
+                io.write("\n")
+            io.write("#### {}\n\n".format(category or "Other"))
+            first = False
+        io.write("-    {:.2f} {}\n".format(item.quantity, item.item))
@@ -1,27 +1,137 @@
-import toml
+import os
+import mmap
+import stat
+import time
+import struct
 import typing
+import hashlib
+import marshal
 import pathlib
+import sqlite3
 import logging
+import importlib
+import threading
 
-from stray_recipe_manager.recipe import Recipe, CommentedRecipe
-from stray_recipe_manager.units import UnitHandler, default_unit_registry
+import attr
+import pint
+
+from stray_recipe_manager.cache import LRUCache, CacheStats
+from stray_recipe_manager.search import RecipeIndex, SearchResult, normalize
+from stray_recipe_manager.recipe import (
+    Ingredient,
+    RecipeStep,
+    Recipe,
+    CommentedRecipe,
+    recipe_from_dict,
+)
+from stray_recipe_manager.units import QuantityUnits, UnitHandler
+from stray_recipe_manager.interning import Interner, InternStats
 
 
 logger = logging.getLogger(__name__)
 
 
+# TOML libraries by preference, fastest first. Each module has loads or
+# dumps taking and returning a str. toml is a dependency, so it is always
+# there to fall back on. tomli_w writes slower than toml, so it is only
+# used when asked for.
+TOML_READERS = ("rtoml", "tomllib", "tomli", "toml")
+TOML_WRITERS = ("rtoml", "toml", "tomli_w")
+
+
+def import_toml_function(
+    modules,  # type: typing.Sequence[str]
+    function,  # type: str
+    name=None,  # type: typing.Optional[str]
+):
+    # type: (...) -> typing.Tuple[str, typing.Any]
+    """Function of the named module, or of the first one installed"""
+    for module_name in modules if name is None else [name]:
+        try:
+            module = importlib.import_module(module_name)
+        except ImportError:
+            if name is not None:
+                raise
+            continue
+        return module_name, getattr(module, function)
+    raise ImportError(f"None of {', '.join(modules)} is installed")
+
+
+def strip_none(data):
+    # type: (typing.Any) -> typing.Any
+    """Data without None values, which TOML has no way to write"""
+    if isinstance(data, dict):
+        return {k: strip_none(v) for k, v in data.items() if v is not None}
+    if isinstance(data, list):
+        return [strip_none(v) for v in data]
+    return data
+
+
+@attr.attrs(frozen=True, slots=True)
+class TOMLCodec(object):
+    reader = attr.ib(type=str, kw_only=True)
+    writer = attr.ib(type=str, kw_only=True)
+    loads = attr.ib(
+        type=typing.Callable[[str], typing.Dict[str, typing.Any]],
+        kw_only=True,
+        repr=False,
+    )
+    dumps = attr.ib(
+        type=typing.Callable[[typing.Dict[str, typing.Any]], str],
+        kw_only=True,
+        repr=False,
+    )
+
+    @classmethod
+    def create(cls, reader=None, writer=None):
+        # type: (typing.Optional[str], typing.Optional[str]) -> TOMLCodec
+        """Codec using the named libraries, the fastest installed if None"""
+        reader, loads = import_toml_function(TOML_READERS, "loads", reader)
+        writer, dumps = import_toml_function(TOML_WRITERS, "dumps", writer)
+        return cls(reader=reader, writer=writer, loads=loads, dumps=dumps)
+
+    def load(self, toml_file):
+        # type: (typing.TextIO) -> typing.Dict[str, typing.Any]
+        return self.loads(toml_file.read())
+
+    def dump(self, data, toml_file):
+        # type: (typing.Dict[str, typing.Any], typing.TextIO) -> None
+        toml_file.write(self.dumps(strip_none(data)))
+
+
+# Picked on first use, so only the library in use is imported
+_toml_codec = None  # type: typing.Optional[TOMLCodec]
+
+
+def get_toml_codec():
+    # type: () -> TOMLCodec
+    global _toml_codec
+    if _toml_codec is None:
+        _toml_codec = TOMLCodec.create()
+        logger.info("Using TOML codec %r", _toml_codec)
+    return _toml_codec
+
+
+def set_toml_codec(codec):
+    # type: (typing.Optional[TOMLCodec]) -> None
+    """Use codec for all TOML files, or pick again on next use if None"""
+    global _toml_codec
+    _toml_codec = codec
+
+
 class TOMLCoding:
-    def __init__(self, unit_handler):
-        # type: (UnitHandler) -> None
+    def __init__(self, unit_handler, codec=None):
+        # type: (UnitHandler, typing.Optional[TOMLCodec]) -> None
         self.unit_handler = unit_handler
+        self.codec = codec if codec is not None else get_toml_codec()
 
     @staticmethod
-    def load_unit_handler_toml(toml_file):
-        # type: (typing.TextIO) -> UnitHandler
-        data = toml.load(toml_file)
-        unit_handler = UnitHandler(
-            default_unit_registry, data.get("tolerance", 1e-3)
-        )
+    def load_unit_handler_toml(toml_file, codec=None):
+        # type: (typing.TextIO, typing.Optional[TOMLCodec]) -> UnitHandler
+        if codec is None:
+            codec = get_toml_codec()
+        data = codec.load(toml_file)
+        unit_handler = UnitHandler(tolerance=data.get("tolerance", 1e-3))
         if "densities" in data:
             for k, v in data["densities"].items():
                 unit_handler.add_density(
@@ -29,9 +139,9 @@ class TOMLCoding:
                 )
         return unit_handler
 
-    def load_recipe_from_toml_file(self, toml_file):
-        # type: (typing.TextIO) -> Recipe
-        data = toml.load(toml_file)
+    def load_recipe_from_toml_file(self, toml_file, lazy=False):
+        # type: (typing.TextIO, bool) -> Recipe
+        data = self.codec.load(toml_file)
         if "densities" in data:
             for k, v in data["densities"].items():
                 self.unit_handler.add_density(
@@ -39,27 +149,32 @@ class TOMLCoding:
                     self.unit_handler.parse_quantity(v, "[mass]/[length]**3"),
                 )
             del data["densities"]
-        if "comments" in data or "references" in data:
-            return CommentedRecipe.from_dict(data, self.unit_handler)
-        else:
-            return Recipe.from_dict(data, self.unit_handler)
+        return recipe_from_dict(data, self.unit_handler, lazy)
 
     def load_densities_from_toml_file(self, toml_file):
         # type: (typing.TextIO) -> None
-        data = toml.load(toml_file)
+        data = self.codec.load(toml_file)
         for k, v in data["densities"].items():
             self.unit_handler.add_density(
                 k, self.unit_handler.parse_quantity(v, "[mass]/[length]**3")
             )
 
     @staticmethod
-    def write_unit_handler_to_file(self, toml_file, unit_handler):
-        # type: (typing.TextIO, UnitHandler) -> None
+    def write_unit_handler_to_file(
+        toml_file,  # type: typing.TextIO
+        unit_handler,  # type: UnitHandler
+        codec=None,  # type: typing.Optional[TOMLCodec]
+    ):
+        # type: (...) -> None
+        if codec is None:
+            codec = get_toml_codec()
         data = {
             "tolerance": unit_handler.tolerance,
-            "densities": unit_handler.densities,
+            "densities": {
+                k: str(v) for k, v in unit_handler.densities.items()
+            },
         }
-        toml.dump(data, toml_file)
+        codec.dump(data, toml_file)
 
     def write_recipe_to_toml_file(
         self, toml_file, recipe, include_densities=False
@@ -75,20 +190,43 @@ class TOMLCoding:
                 if identifier is not None:
                     density = self.unit_handler.get_density(identifier)
                     if density is not None:
-                        data["densities"][identifier] = density
-        toml.dump(data, toml_file)
+                        data["densities"][identifier] = str(density)
+        self.codec.dump(data, toml_file)
 
     def write_densities_to_toml_file(self, toml_file):
         # type: (typing.TextIO) -> None
-        data = {"densities": self.unit_handler.densities}
-        toml.dump(data, toml_file)
+        data = {
+            "densities": {
+                k: str(v) for k, v in self.unit_handler.densities.items()
+            }
+        }
+        self.codec.dump(data, toml_file)
 
 
 class InvalidPathType(Exception):
     pass
 
 
+@attr.attrs(frozen=True, slots=True)
+class RecipeVersion(object):
+    # Opaque, changes whenever the stored recipe does
+    tag = attr.ib(type=str, kw_only=True)
+    # Seconds since the epoch
+    modified = attr.ib(type=float, kw_only=True)
+
+
+# Called with the recipe key and the error raised loading it
+LoadErrorHandler = typing.Callable[[str, Exception], None]
+
+
 class BaseStorage:
+    # Shares equal strings, ingredients and steps of the recipes a storage
+    # keeps, if set
+    interner = None  # type: typing.Optional[Interner]
+    # Whether get_recipe returns lazy recipes, which parse ingredients and
+    # steps on first use, for storages that read recipe tables
+    lazy = False
+
     @classmethod
     def from_path_str(cls, dirpath_str):
         raise NotImplementedError(
@@ -96,6 +234,11 @@ class BaseStorage:
             f"{cls.__module__}.{cls.__name__} from path string"
         )
 
+    def location(self):
+        # type: () -> str
+        """Path string that get_storage opens this storage from"""
+        raise NotImplementedError()
+
     def get_unit_handler(self):
         # type: () -> UnitHandler
         raise NotImplementedError()
@@ -104,28 +247,176 @@ class BaseStorage:
         # type: () -> typing.Iterator[str]
         raise NotImplementedError()
 
+    def sorted_recipe_keys(self):
+        # type: () -> typing.Sequence[str]
+        return sorted(self.recipe_keys())
+
     def recipes(self):
         # type: () -> typing.Iterator[typing.Tuple[str, Recipe]]
         for key in self.recipe_keys():
             yield (key, self.get_recipe(key))
 
+    def get_recipes(
+        self,
+        keys=None,  # type: typing.Optional[typing.Iterable[str]]
+        jobs=1,  # type: int
+        on_error=None,  # type: typing.Optional[LoadErrorHandler]
+    ):
+        # type: (...) -> typing.Iterator[typing.Tuple[str, Recipe]]
+        """Load recipes in the order of keys, all sorted keys by default
+
+        With more than one job the recipes are loaded by that many
+        processes, and are never lazy. Errors are raised when their recipe
+        is reached, unless on_error is given, which is then called and the
+        recipe skipped.
+        """
+        if keys is None:
+            keys = self.sorted_recipe_keys()
+        if jobs > 1:
+            from stray_recipe_manager.parallel import load_recipes
+
+            return load_recipes(self, keys, jobs, on_error=on_error)
+        return self._get_recipes_serial(keys, on_error)
+
+    def _get_recipes_serial(
+        self,
+        keys,  # type: typing.Iterable[str]
+        on_error,  # type: typing.Optional[LoadErrorHandler]
+    ):
+        # type: (...) -> typing.Iterator[typing.Tuple[str, Recipe]]
+        for key in keys:
+            try:
+                recipe = self.get_recipe(key)
+            except Exception as e:
+                if on_error is None:
+                    raise
+                on_error(key, e)
+                continue
+            yield (key, recipe)
+
     def get_recipe(self, recipe_key):
         # type: (str) -> Recipe
         raise NotImplementedError()
 
+    def snapshot(self):
+        # type: () -> BaseStorage
+        """Storage whose reads all see the book at one point in time
+
+        That is the storage itself, unless it changes under its readers.
+        """
+        return self
+
+    def intern_stats(self):
+        # type: () -> typing.Optional[InternStats]
+        """Sharing between loaded recipes, None if this storage has none"""
+        return None if self.interner is None else self.interner.stats()
+
     def write_recipe(self, recipe_key, recipe, overwrite=False):
         # type: (str, Recipe, bool) -> None
         raise NotImplementedError()
 
+    def write_recipes(self, recipes, overwrite=False):
+        # type: (typing.Iterable[typing.Tuple[str, Recipe]], bool) -> None
+        for key, recipe in recipes:
+            self.write_recipe(key, recipe, overwrite)
+
+    def recipe_version(self, recipe_key):
+        # type: (str) -> typing.Optional[RecipeVersion]
+        """Cheap validator for the stored recipe, None if unsupported"""
+        return None
+
+    def recipe_digest(self, recipe_key):
+        # type: (str) -> str
+        """Hash of the stored recipe contents, the same for any copy"""
+        content = repr(self.get_recipe(recipe_key).to_dict())
+        return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+    def write_unit_handler(self, unit_handler):
+        # type: (UnitHandler) -> None
+        raise NotImplementedError()
+
+    def get_index(self):
+        # type: () -> RecipeIndex
+        index = RecipeIndex()
+        for key, recipe in self.recipes():
+            index.add(key, recipe)
+        return index
+
+    def find_recipes(
+        self,
+        ingredients=(),  # type: typing.Iterable[str]
+        tags=(),  # type: typing.Iterable[str]
+        tools=(),  # type: typing.Iterable[str]
+    ):
+        # type: (...) -> typing.List[str]
+        return self.get_index().find(ingredients, tags, tools)
+
+    def search_text(
+        self,
+        query,  # type: str
+        limit=10,  # type: typing.Optional[int]
+        ingredients=(),  # type: typing.Iterable[str]
+        tags=(),  # type: typing.Iterable[str]
+        tools=(),  # type: typing.Iterable[str]
+    ):
+        # type: (...) -> typing.List[SearchResult]
+        index = self.get_index()
+        ingredients, tags, tools = list(ingredients), list(tags), list(tools)
+        within = None  # type: typing.Optional[typing.Set[str]]
+        if ingredients or tags or tools:
+            within = set(index.find(ingredients, tags, tools))
+        return index.search_text(query, limit, within)
+
+
+FileSignature = typing.Tuple[int, int, int]
+
+
+def file_signature(path):
+    # type: (pathlib.Path) -> FileSignature
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        raise KeyError(f"No file at {path}")
+    if stat.S_ISDIR(st.st_mode):
+        raise KeyError(f"Path {path} is a directory")
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
 
 class DirectoryStorage(BaseStorage):
-    def __init__(self, config_file, recipe_dir):
-        # type: (pathlib.Path, pathlib.Path) -> None
+    index_refresh_interval = 2.0
+
+    def __init__(
+        self,
+        config_file,  # type: pathlib.Path
+        recipe_dir,  # type: pathlib.Path
+        cache_size=128,  # type: typing.Optional[int]
+        lazy=False,  # type: bool
+    ):
+        # type: (...) -> None
         self.unit_handler_config = config_file
         self.recipe_dir = recipe_dir
+        # Lazy recipes only parse ingredients and steps when first used, so
+        # errors in their quantities are raised there instead of on loading.
+        # refresh_index skips such recipes, the server answers with a 500.
+        self.lazy = lazy
         with self.unit_handler_config.open("r") as f:
             self.unit_handler = TOMLCoding.load_unit_handler_toml(f)
         self.toml_coding = TOMLCoding(self.unit_handler)
+        self.interner = Interner()  # type: Interner
+        # Parsed recipes, validated against the stat() of their source file
+        self.recipe_cache = (
+            LRUCache(cache_size)
+        )  # type: LRUCache[str, typing.Tuple[FileSignature, Recipe]]
+        # Search index kept next to the config file
+        self.index_path = config_file.parent / "index.json"
+        self.search_index = None  # type: typing.Optional[RecipeIndex]
+        self.index_refreshed = None  # type: typing.Optional[float]
+        self.index_lock = threading.RLock()
+        # Adding or removing recipe files changes the directory mtime
+        self.sorted_keys = (
+            -1,
+            (),
+        )  # type: typing.Tuple[int, typing.Sequence[str]]
 
     @classmethod
     def from_path_str(cls, dirpath_str):
@@ -144,6 +435,36 @@ class DirectoryStorage(BaseStorage):
         else:
             raise InvalidPathType(f"Path {dirpath_str} is not a directory")
 
+    def location(self):
+        # type: () -> str
+        return str(self.unit_handler_config.parent)
+
+    @classmethod
+    def create(
+        cls,
+        path,  # type: pathlib.Path
+        unit_handler=None,  # type: typing.Optional[UnitHandler]
+    ):
+        # type: (...) -> DirectoryStorage
+        path.mkdir(parents=True, exist_ok=True)
+        (path / "recipes").mkdir(exist_ok=True)
+        config_file = path / "config.toml"
+        if config_file.exists():
+            raise InvalidPathType(f"Recipe book already exists at {path}")
+        with config_file.open("w") as f:
+            TOMLCoding.write_unit_handler_to_file(
+                f, unit_handler if unit_handler is not None else UnitHandler()
+            )
+        return cls(config_file, path / "recipes")
+
+    def write_unit_handler(self, unit_handler):
+        # type: (UnitHandler) -> None
+        for k, v in unit_handler.densities.items():
+            self.unit_handler.add_density(k, v)
+        self.unit_handler.tolerance = unit_handler.tolerance
+        with self.unit_handler_config.open("w") as f:
+            TOMLCoding.write_unit_handler_to_file(f, self.unit_handler)
+
     def get_unit_handler(self):
         # type: () -> UnitHandler
         return self.unit_handler
@@ -153,28 +474,831 @@ class DirectoryStorage(BaseStorage):
         for fpath in self.recipe_dir.glob("*.toml"):
             yield fpath.stem
 
+    def sorted_recipe_keys(self):
+        # type: () -> typing.Sequence[str]
+        mtime = self.recipe_dir.stat().st_mtime_ns
+        cached_mtime, keys = self.sorted_keys
+        if cached_mtime != mtime:
+            keys = tuple(sorted(self.recipe_keys()))
+            self.sorted_keys = (mtime, keys)
+        return keys
+
+    def recipe_path(self, recipe_key):
+        # type: (str) -> pathlib.Path
+        return self.recipe_dir / (recipe_key + ".toml")
+
     def get_recipe(self, recipe_key):
         # type: (str) -> Recipe
-        path = self.recipe_dir / (recipe_key + ".toml")
-        if not path.exists() or path.is_dir():
+        path = self.recipe_path(recipe_key)
+        try:
+            signature = file_signature(path)
+        except KeyError:
             raise KeyError("No recipe for '{}'".format(recipe_key))
+        cached = self.recipe_cache.get(
+            recipe_key, valid=lambda entry: entry[0] == signature
+        )
+        if cached is not None:
+            return cached[1]
         with path.open("r") as f:
-            return self.toml_coding.load_recipe_from_toml_file(f)
+            recipe = self.toml_coding.load_recipe_from_toml_file(f, self.lazy)
+        # Only trust the file contents if nothing changed while reading
+        if (
+            self.recipe_cache.maxsize != 0
+            and file_signature(path) == signature
+        ):
+            # Only cached recipes are interned, and interning would parse the
+            # lazy fields straight away
+            if not self.lazy:
+                recipe = self.interner.recipe(recipe)
+            self.recipe_cache.put(recipe_key, (signature, recipe))
+        return recipe
+
+    def cache_stats(self):
+        # type: () -> CacheStats
+        return self.recipe_cache.stats()
+
+    def recipe_version(self, recipe_key):
+        # type: (str) -> RecipeVersion
+        try:
+            signature = file_signature(self.recipe_path(recipe_key))
+        except KeyError:
+            raise KeyError("No recipe for '{}'".format(recipe_key))
+        return RecipeVersion(
+            tag="{:x}-{:x}-{:x}".format(*signature),
+            modified=signature[0] / 1e9,
+        )
+
+    def recipe_digest(self, recipe_key):
+        # type: (str) -> str
+        try:
+            content = self.recipe_path(recipe_key).read_bytes()
+        except (FileNotFoundError, IsADirectoryError):
+            raise KeyError("No recipe for '{}'".format(recipe_key))
+        return hashlib.sha1(content).hexdigest()
 
     def write_recipe(self, recipe_key, recipe, overwrite=False):
         # type: (str, Recipe, bool) -> None
-        path = self.recipe_dir / (recipe_key + ".toml")
-        if path.exists() and not overwrite:
+        self.write_recipes([(recipe_key, recipe)], overwrite)
+
+    def write_recipes(self, recipes, overwrite=False):
+        # type: (typing.Iterable[typing.Tuple[str, Recipe]], bool) -> None
+        """Write recipe files, then update the search index once"""
+        written = []  # type: typing.List[typing.Tuple[str, Recipe]]
+        try:
+            for recipe_key, recipe in recipes:
+                path = self.recipe_path(recipe_key)
+                if path.exists() and not overwrite:
+                    raise KeyError("Recipe already exists, not overwriting")
+                self.recipe_cache.discard(recipe_key)
+                with path.open("w") as f:
+                    self.toml_coding.write_recipe_to_toml_file(f, recipe)
+                written.append((recipe_key, recipe))
+        finally:
+            # Files written before a failure are indexed all the same
+            self.index_recipes(written)
+
+    def index_recipes(self, recipes):
+        # type: (typing.Sequence[typing.Tuple[str, Recipe]]) -> None
+        with self.index_lock:
+            if not recipes or (
+                self.search_index is None and not self.index_path.exists()
+            ):
+                return
+            index = self.load_index()
+            for recipe_key, recipe in recipes:
+                try:
+                    signature = file_signature(self.recipe_path(recipe_key))
+                except KeyError:
+                    # Removed since, the next refresh drops it
+                    continue
+                index.add(recipe_key, recipe, signature)
+            self.save_index(index)
+
+    def load_index(self):
+        # type: () -> RecipeIndex
+        with self.index_lock:
+            if self.search_index is None:
+                self.search_index = RecipeIndex.load(self.index_path)
+            return self.search_index
+
+    def save_index(self, index):
+        # type: (RecipeIndex) -> None
+        try:
+            index.save(self.index_path)
+        except OSError as e:
+            logger.warning("Unable to save index %s: %s", self.index_path, e)
+
+    def refresh_index(self, index):
+        # type: (RecipeIndex) -> bool
+        """Re-index recipes whose files changed since they were indexed"""
+        changed = False
+        seen = set()
+        for path in self.recipe_dir.glob("*.toml"):
+            key = path.stem
+            try:
+                signature = file_signature(path)
+            except KeyError:
+                continue
+            seen.add(key)
+            if key in index and index.signatures[key] == signature:
+                continue
+            try:
+                # Also parses the ingredients and steps of lazy recipes
+                index.add(key, self.get_recipe(key), signature)
+            except Exception as e:
+                logger.warning("Unable to index recipe %s: %s", key, e)
+                index.remove(key)
+            changed = True
+        for key in set(index.terms) - seen:
+            index.remove(key)
+            changed = True
+        return changed
+
+    def get_index(self):
+        # type: () -> RecipeIndex
+        with self.index_lock:
+            index = self.load_index()
+            now = time.monotonic()
+            if (
+                self.index_refreshed is None
+                or now - self.index_refreshed >= self.index_refresh_interval
+            ):
+                if self.refresh_index(index):
+                    self.save_index(index)
+                self.index_refreshed = now
+            return index
+
+
+SNAPSHOT_MAGIC = b"SRMSNAP\x00"
+SNAPSHOT_VERSION = 1
+# Magic, snapshot format version, marshal format version, table length
+SNAPSHOT_HEADER = struct.Struct("<8sIIQ")
+MARSHAL_VERSION = 4
+
+
+class SnapshotEncoder:
+    """Flatten recipes to marshal-able tuples with interned unit IDs"""
+
+    def __init__(self):
+        # type: () -> None
+        self.unit_ids = {}  # type: typing.Dict[str, int]
+        # Formatting units is slow, so remember the ID of each unit seen
+        self.seen_units = {}  # type: typing.Dict[QuantityUnits, int]
+        self.units = []  # type: typing.List[str]
+
+    def unit_id(self, unit):
+        # type: (QuantityUnits) -> int
+        try:
+            return self.seen_units[unit]
+        except KeyError:
+            pass
+        unit_str = str(unit)
+        if unit_str not in self.unit_ids:
+            self.unit_ids[unit_str] = len(self.units)
+            self.units.append(unit_str)
+        self.seen_units[unit] = self.unit_ids[unit_str]
+        return self.unit_ids[unit_str]
+
+    def encode_quantity(self, quantity):
+        # type: (pint.Quantity) -> typing.Tuple[typing.Any, int]
+        magnitude = quantity.magnitude
+        if not isinstance(magnitude, (int, float)):
+            magnitude = float(magnitude)
+        return (magnitude, self.unit_id(quantity.units))
+
+    def encode_ingredient(self, ingredient):
+        # type: (Ingredient) -> typing.Tuple[typing.Any, ...]
+        magnitude, unit_id = self.encode_quantity(ingredient.quantity)
+        return (
+            ingredient.item,
+            magnitude,
+            unit_id,
+            ingredient.identifier,
+            ingredient.category,
+            ingredient.notes,
+        )
+
+    def encode_step(self, step):
+        # type: (RecipeStep) -> typing.Tuple[typing.Any, ...]
+        time = None if step.time is None else self.encode_quantity(step.time)
+        return (step.description, step.group, time)
+
+    def encode_recipe(self, recipe):
+        # type: (Recipe) -> typing.Tuple[typing.Any, ...]
+        if isinstance(recipe, CommentedRecipe):
+            extra = (recipe.comments, list(recipe.references))
+        else:
+            extra = None
+        return (
+            recipe.name,
+            self.encode_ingredient(recipe.makes),
+            [self.encode_ingredient(i) for i in recipe.ingredients],
+            [self.encode_step(i) for i in recipe.steps],
+            list(recipe.tools),
+            list(recipe.tags),
+            extra,
+        )
+
+
+class SnapshotDecoder:
+    def __init__(self, unit_registry, units):
+        # type: (pint.UnitRegistry, typing.Sequence[str]) -> None
+        self.quantity_cls = unit_registry.Quantity
+        self.units = [unit_registry.parse_units(u) for u in units]
+
+    def decode_quantity(self, magnitude, unit_id):
+        # type: (typing.Any, int) -> pint.Quantity
+        return self.quantity_cls(magnitude, self.units[unit_id])
+
+    def decode_ingredient(self, data):
+        # type: (typing.Sequence[typing.Any]) -> Ingredient
+        item, magnitude, unit_id, identifier, category, notes = data
+        return Ingredient(
+            item=item,
+            quantity=self.decode_quantity(magnitude, unit_id),
+            identifier=identifier,
+            category=category,
+            notes=notes,
+        )
+
+    def decode_step(self, data):
+        # type: (typing.Sequence[typing.Any]) -> RecipeStep
+        description, group, time = data
+        return RecipeStep(
+            description=description,
+            group=group,
+            time=None if time is None else self.decode_quantity(*time),
+        )
+
+    def decode_recipe(self, data):
+        # type: (typing.Sequence[typing.Any]) -> Recipe
+        name, makes, ingredients, steps, tools, tags, extra = data
+        fields = dict(
+            name=name,
+            makes=self.decode_ingredient(makes),
+            ingredients=[self.decode_ingredient(i) for i in ingredients],
+            steps=[self.decode_step(i) for i in steps],
+            tools=tools,
+            tags=tags,
+        )  # type: typing.Dict[str, typing.Any]
+        if extra is None:
+            return Recipe(**fields)
+        comments, references = extra
+        return CommentedRecipe(
+            comments=comments, references=references, **fields
+        )
+
+
+def write_snapshot(storage, snapshot_path, jobs=1):
+    # type: (BaseStorage, pathlib.Path, int) -> None
+    encoder = SnapshotEncoder()
+    index = []
+    blobs = []
+    offset = 0
+    for key, recipe in storage.get_recipes(jobs=jobs):
+        blob = marshal.dumps(encoder.encode_recipe(recipe), MARSHAL_VERSION)
+        index.append((key, offset, len(blob)))
+        blobs.append(blob)
+        offset += len(blob)
+    # Densities are collected last, as recipes may define their own
+    unit_handler = storage.get_unit_handler()
+    densities = [
+        (k,) + encoder.encode_quantity(v)
+        for k, v in unit_handler.densities.items()
+    ]
+    table = marshal.dumps(
+        (unit_handler.tolerance, encoder.units, densities, index),
+        MARSHAL_VERSION,
+    )
+    tmp_path = snapshot_path.with_name(snapshot_path.name + ".tmp")
+    with tmp_path.open("wb") as f:
+        f.write(
+            SNAPSHOT_HEADER.pack(
+                SNAPSHOT_MAGIC, SNAPSHOT_VERSION, MARSHAL_VERSION, len(table)
+            )
+        )
+        f.write(table)
+        for blob in blobs:
+            f.write(blob)
+    os.replace(str(tmp_path), str(snapshot_path))
+    logger.info("Wrote %d recipes to snapshot %s", len(index), snapshot_path)
+
+
+class SnapshotStorage(BaseStorage):
+    def __init__(self, snapshot_path, unit_registry=None):
+        # type: (pathlib.Path, typing.Optional[pint.UnitRegistry]) -> None
+        self.snapshot_path = snapshot_path
+        with snapshot_path.open("rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, marshal_version, table_len = SNAPSHOT_HEADER.unpack(
+            self.data[: SNAPSHOT_HEADER.size]
+        )
+        if magic != SNAPSHOT_MAGIC:
+            raise InvalidPathType(f"File {snapshot_path} is not a snapshot")
+        if version != SNAPSHOT_VERSION or marshal_version != MARSHAL_VERSION:
+            raise InvalidPathType(
+                f"Snapshot {snapshot_path} has unsupported version "
+                f"{version}.{marshal_version}, recompile the recipe book"
+            )
+        table_end = SNAPSHOT_HEADER.size + table_len
+        tolerance, units, densities, index = marshal.loads(
+            memoryview(self.data)[SNAPSHOT_HEADER.size : table_end]
+        )
+        self.unit_handler = UnitHandler(unit_registry, tolerance)
+        self.decoder = SnapshotDecoder(self.unit_handler.unit_registry, units)
+        for identifier, magnitude, unit_id in densities:
+            self.unit_handler.add_density(
+                identifier, self.decoder.decode_quantity(magnitude, unit_id)
+            )
+        self.index = {
+            key: (table_end + offset, table_end + offset + length)
+            for key, offset, length in index
+        }  # type: typing.Dict[str, typing.Tuple[int, int]]
+        self.search_index = None  # type: typing.Optional[RecipeIndex]
+        self.signature = file_signature(snapshot_path)
+        self.sorted_keys = None  # type: typing.Optional[typing.Sequence[str]]
+
+    @classmethod
+    def from_path_str(cls, path_str):
+        # type: (str) -> SnapshotStorage
+        path = pathlib.Path(path_str)
+        if not path.is_file():
+            raise InvalidPathType(f"Path {path_str} is not a file")
+        with path.open("rb") as f:
+            if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+                raise InvalidPathType(f"File {path_str} is not a snapshot")
+        return cls(path)
+
+    def location(self):
+        # type: () -> str
+        return str(self.snapshot_path)
+
+    def close(self):
+        # type: () -> None
+        self.data.close()
+
+    def get_unit_handler(self):
+        # type: () -> UnitHandler
+        return self.unit_handler
+
+    def recipe_keys(self):
+        # type: () -> typing.Iterator[str]
+        return iter(self.index)
+
+    def get_index(self):
+        # type: () -> RecipeIndex
+        if self.search_index is None:
+            self.search_index = BaseStorage.get_index(self)
+        return self.search_index
+
+    def sorted_recipe_keys(self):
+        # type: () -> typing.Sequence[str]
+        if self.sorted_keys is None:
+            self.sorted_keys = tuple(sorted(self.index))
+        return self.sorted_keys
+
+    def recipe_version(self, recipe_key):
+        # type: (str) -> RecipeVersion
+        if recipe_key not in self.index:
+            raise KeyError("No recipe for '{}'".format(recipe_key))
+        return RecipeVersion(
+            tag="{:x}-{:x}-{:x}".format(*self.signature),
+            modified=self.signature[0] / 1e9,
+        )
+
+    def get_recipe(self, recipe_key):
+        # type: (str) -> Recipe
+        try:
+            start, end = self.index[recipe_key]
+        except KeyError:
+            raise KeyError("No recipe for '{}'".format(recipe_key))
+        return self.decoder.decode_recipe(
+            marshal.loads(memoryview(self.data)[start:end])
+        )
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS settings (
+    name TEXT PRIMARY KEY,
+    value NOT NULL
+);
+CREATE TABLE IF NOT EXISTS densities (
+    identifier TEXT PRIMARY KEY,
+    magnitude NOT NULL,
+    unit TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS recipes (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL,
+    commented INTEGER NOT NULL,
+    comments TEXT,
+    modified REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ingredients (
+    recipe_id INTEGER NOT NULL REFERENCES recipes(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    item TEXT NOT NULL,
+    magnitude NOT NULL,
+    unit TEXT NOT NULL,
+    identifier TEXT,
+    category TEXT,
+    notes TEXT,
+    PRIMARY KEY (recipe_id, position)
+);
+CREATE TABLE IF NOT EXISTS steps (
+    recipe_id INTEGER NOT NULL REFERENCES recipes(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    description TEXT NOT NULL,
+    step_group TEXT,
+    time_magnitude,
+    time_unit TEXT,
+    PRIMARY KEY (recipe_id, position)
+);
+CREATE TABLE IF NOT EXISTS recipe_lists (
+    recipe_id INTEGER NOT NULL REFERENCES recipes(id) ON DELETE CASCADE,
+    kind TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (recipe_id, kind, position)
+);
+CREATE TABLE IF NOT EXISTS terms (
+    recipe_id INTEGER NOT NULL REFERENCES recipes(id) ON DELETE CASCADE,
+    field TEXT NOT NULL,
+    term TEXT NOT NULL,
+    PRIMARY KEY (field, term, recipe_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ingredients_identifier ON ingredients(identifier);
+CREATE INDEX IF NOT EXISTS terms_recipe ON terms(recipe_id);
+"""
+SQLITE_MAGIC = b"SQLite format 3\x00"
+SQLITE_SUFFIXES = (".sqlite", ".sqlite3", ".db")
+
+
+class SqliteStorage(BaseStorage):
+    """Recipe book kept in normalized tables of a single SQLite database
+
+    Ingredients, steps, tags, tools and references each get their own rows.
+    Index terms are stored alongside, so find_recipes runs as indexed SQL.
+    Each thread uses its own connection.
+    """
+
+    def __init__(self, db_path):
+        # type: (pathlib.Path) -> None
+        self.db_path = db_path
+        self.local = threading.local()
+        conn = self.connection()
+        with conn:
+            conn.executescript(SQLITE_SCHEMA)
+        tolerance = self.get_setting("tolerance", 1e-3)
+        self.unit_handler = UnitHandler(tolerance=tolerance)
+        for identifier, magnitude, unit in conn.execute(
+            "SELECT identifier, magnitude, unit FROM densities"
+        ):
+            self.unit_handler.add_density(
+                identifier, self.make_quantity(magnitude, unit)
+            )
+        self.search_index = None  # type: typing.Optional[RecipeIndex]
+        self.index_lock = threading.Lock()
+
+    @classmethod
+    def from_path_str(cls, path_str):
+        # type: (str) -> SqliteStorage
+        path = pathlib.Path(path_str)
+        if path.suffix not in SQLITE_SUFFIXES or not path.is_file():
+            raise InvalidPathType(f"Path {path_str} is not an SQLite file")
+        with path.open("rb") as f:
+            if f.read(len(SQLITE_MAGIC)) != SQLITE_MAGIC:
+                raise InvalidPathType(f"File {path_str} is not an SQLite file")
+        return cls(path)
+
+    @classmethod
+    def create(cls, path, unit_handler=None):
+        # type: (pathlib.Path, typing.Optional[UnitHandler]) -> SqliteStorage
+        if path.exists():
+            raise InvalidPathType(f"Recipe book already exists at {path}")
+        storage = cls(path)
+        if unit_handler is not None:
+            storage.write_unit_handler(unit_handler)
+        return storage
+
+    def connection(self):
+        # type: () -> sqlite3.Connection
+        conn = getattr(self.local, "connection", None)
+        # Connections must not be shared with forked server workers
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(str(self.db_path))
+            conn.execute("PRAGMA foreign_keys = ON")
+            self.local.connection = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    def location(self):
+        # type: () -> str
+        return str(self.db_path)
+
+    def close(self):
+        # type: () -> None
+        conn = getattr(self.local, "connection", None)
+        if conn is not None:
+            conn.close()
+            self.local.connection = None
+
+    def get_setting(self, name, default=None):
+        # type: (str, typing.Any) -> typing.Any
+        row = (
+            self.connection()
+            .execute("SELECT value FROM settings WHERE name = ?", (name,))
+            .fetchone()
+        )
+        return default if row is None else row[0]
+
+    def make_quantity(self, magnitude, unit):
+        # type: (typing.Any, str) -> pint.Quantity
+        return self.unit_handler.unit_registry.Quantity(
+            magnitude, self.unit_handler.parse_unit(unit)
+        )
+
+    def get_unit_handler(self):
+        # type: () -> UnitHandler
+        return self.unit_handler
+
+    def write_unit_handler(self, unit_handler):
+        # type: (UnitHandler) -> None
+        for k, v in unit_handler.densities.items():
+            self.unit_handler.add_density(k, v)
+        self.unit_handler.tolerance = unit_handler.tolerance
+        with self.connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO settings VALUES ('tolerance', ?)",
+                (self.unit_handler.tolerance,),
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO densities VALUES (?, ?, ?)",
+                [
+                    (k, v.magnitude, str(v.units))
+                    for k, v in self.unit_handler.densities.items()
+                ],
+            )
+
+    def recipe_keys(self):
+        # type: () -> typing.Iterator[str]
+        rows = self.connection().execute(
+            "SELECT key FROM recipes ORDER BY key"
+        )
+        return (key for key, in rows.fetchall())
+
+    def sorted_recipe_keys(self):
+        # type: () -> typing.Sequence[str]
+        return list(self.recipe_keys())
+
+    def get_recipe(self, recipe_key):
+        # type: (str) -> Recipe
+        conn = self.connection()
+        row = conn.execute(
+            "SELECT id, name, commented, comments FROM recipes WHERE key = ?",
+            (recipe_key,),
+        ).fetchone()
+        if row is None:
+            raise KeyError("No recipe for '{}'".format(recipe_key))
+        recipe_id, name, commented, comments = row
+        ingredients = [
+            Ingredient(
+                item=item,
+                quantity=self.make_quantity(magnitude, unit),
+                identifier=identifier,
+                category=category,
+                notes=notes,
+            )
+            for item, magnitude, unit, identifier, category, notes in (
+                conn.execute(
+                    "SELECT item, magnitude, unit, identifier, category, "
+                    "notes FROM ingredients WHERE recipe_id = ? "
+                    "ORDER BY position",
+                    (recipe_id,),
+                )
+            )
+        ]
+        steps = [
+            RecipeStep(
+                description=description,
+                group=group,
+                time=(
+                    None
+                    if time_unit is None
+                    else self.make_quantity(time_magnitude, time_unit)
+                ),
+            )
+            for description, group, time_magnitude, time_unit in (
+                conn.execute(
+                    "SELECT description, step_group, time_magnitude, "
+                    "time_unit FROM steps WHERE recipe_id = ? "
+                    "ORDER BY position",
+                    (recipe_id,),
+                )
+            )
+        ]
+        lists = {
+            "tool": [],
+            "tag": [],
+            "reference": [],
+        }  # type: typing.Dict[str, typing.List[str]]
+        for kind, value in conn.execute(
+            "SELECT kind, value FROM recipe_lists WHERE recipe_id = ? "
+            "ORDER BY kind, position",
+            (recipe_id,),
+        ):
+            lists[kind].append(value)
+        fields = dict(
+            name=name,
+            makes=ingredients[0],
+            ingredients=ingredients[1:],
+            steps=steps,
+            tools=lists["tool"],
+            tags=lists["tag"],
+        )  # type: typing.Dict[str, typing.Any]
+        if not commented:
+            return Recipe(**fields)
+        return CommentedRecipe(
+            comments=comments, references=lists["reference"], **fields
+        )
+
+    def recipe_version(self, recipe_key):
+        # type: (str) -> RecipeVersion
+        row = (
+            self.connection()
+            .execute(
+                "SELECT id, modified FROM recipes WHERE key = ?", (recipe_key,)
+            )
+            .fetchone()
+        )
+        if row is None:
+            raise KeyError("No recipe for '{}'".format(recipe_key))
+        return RecipeVersion(tag="{:x}-{!r}".format(*row), modified=row[1])
+
+    def write_recipe(self, recipe_key, recipe, overwrite=False):
+        # type: (str, Recipe, bool) -> None
+        self.write_recipes([(recipe_key, recipe)], overwrite)
+
+    def write_recipes(self, recipes, overwrite=False):
+        # type: (typing.Iterable[typing.Tuple[str, Recipe]], bool) -> None
+        """Write all recipes in one transaction, or none if any fails"""
+        conn = self.connection()
+        with conn:
+            for key, recipe in recipes:
+                self.insert_recipe(conn, key, recipe, overwrite)
+
+    def insert_recipe(self, conn, recipe_key, recipe, overwrite):
+        # type: (sqlite3.Connection, str, Recipe, bool) -> None
+        if overwrite:
+            conn.execute("DELETE FROM recipes WHERE key = ?", (recipe_key,))
+        commented = isinstance(recipe, CommentedRecipe)
+        try:
+            cursor = conn.execute(
+                "INSERT INTO recipes (key, name, commented, comments, "
+                "modified) VALUES (?, ?, ?, ?, ?)",
+                (
+                    recipe_key,
+                    recipe.name,
+                    commented,
+                    getattr(recipe, "comments", None),
+                    time.time(),
+                ),
+            )
+        except sqlite3.IntegrityError:
             raise KeyError("Recipe already exists, not overwriting")
-        with path.open("w") as f:
-            self.toml_coding.write_recipe_to_toml_file(f, recipe)
+        recipe_id = cursor.lastrowid
+        conn.executemany(
+            "INSERT INTO ingredients VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    recipe_id,
+                    position,
+                    i.item,
+                    i.quantity.magnitude,
+                    str(i.quantity.units),
+                    i.identifier,
+                    i.category,
+                    i.notes,
+                )
+                for position, i in enumerate(
+                    [recipe.makes] + list(recipe.ingredients)
+                )
+            ],
+        )
+        conn.executemany(
+            "INSERT INTO steps VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    recipe_id,
+                    position,
+                    step.description,
+                    step.group,
+                    None if step.time is None else step.time.magnitude,
+                    None if step.time is None else str(step.time.units),
+                )
+                for position, step in enumerate(recipe.steps)
+            ],
+        )
+        lists = [("tool", recipe.tools), ("tag", recipe.tags)]
+        if commented:
+            lists.append(("reference", getattr(recipe, "references")))
+        conn.executemany(
+            "INSERT INTO recipe_lists VALUES (?, ?, ?, ?)",
+            [
+                (recipe_id, kind, position, value)
+                for kind, values in lists
+                for position, value in enumerate(values)
+            ],
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO terms VALUES (?, ?, ?)",
+            [
+                (recipe_id, field, term)
+                for field, terms in RecipeIndex.recipe_terms(recipe).items()
+                for term in terms
+            ],
+        )
 
+    def delete_recipe(self, recipe_key):
+        # type: (str) -> None
+        with self.connection() as conn:
+            cursor = conn.execute(
+                "DELETE FROM recipes WHERE key = ?", (recipe_key,)
+            )
+        if cursor.rowcount == 0:
+            raise KeyError("No recipe for '{}'".format(recipe_key))
+
+    def find_recipes(
+        self,
+        ingredients=(),  # type: typing.Iterable[str]
+        tags=(),  # type: typing.Iterable[str]
+        tools=(),  # type: typing.Iterable[str]
+    ):
+        # type: (...) -> typing.List[str]
+        conditions = []
+        params = []
+        for field, queries in [
+            ("ingredient", ingredients),
+            ("tag", tags),
+            ("tool", tools),
+        ]:
+            for query in queries:
+                conditions.append(
+                    "id IN (SELECT recipe_id FROM terms "
+                    "WHERE field = ? AND term = ?)"
+                )
+                params.extend([field, normalize(query)])
+        sql = "SELECT key FROM recipes"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        rows = self.connection().execute(sql + " ORDER BY key", params)
+        return [key for key, in rows]
+
+    def get_index(self):
+        # type: () -> RecipeIndex
+        with self.index_lock:
+            if self.search_index is None:
+                self.search_index = RecipeIndex()
+            index = self.search_index
+            rows = self.connection().execute(
+                "SELECT key, modified FROM recipes"
+            )
+            seen = set()
+            for key, modified in rows.fetchall():
+                seen.add(key)
+                if key in index and index.signatures[key] == modified:
+                    continue
+                index.add(key, self.get_recipe(key), modified)
+            for key in set(index.terms) - seen:
+                index.remove(key)
+            return index
 
-def get_storage(init_path):
-    # type: (str) -> BaseStorage
+
+def create_storage(path_str, unit_handler=None):
+    # type: (str, typing.Optional[UnitHandler]) -> BaseStorage
+    """Create an empty recipe book, the kind depending on the path"""
+    path = pathlib.Path(path_str)
+    if path.suffix in SQLITE_SUFFIXES:
+        return SqliteStorage.create(path, unit_handler)
+    return DirectoryStorage.create(path, unit_handler)
+
+
+def copy_recipe_book(source, dest, overwrite=False, jobs=1):
+    # type: (BaseStorage, BaseStorage, bool, int) -> int
+    recipes = list(source.get_recipes(jobs=jobs))
+    # Loading recipes may have added densities, so copy these afterwards
+    dest.write_unit_handler(source.get_unit_handler())
+    dest.write_recipes(recipes, overwrite)
+    logger.info("Copied %d recipes", len(recipes))
+    return len(recipes)
+
+
+def get_storage(init_path, lazy=False):
+    # type: (str, bool) -> BaseStorage
     for cls in BaseStorage.__subclasses__():
         try:
-            return cls.from_path_str(init_path)
+            storage = cls.from_path_str(init_path)
         except InvalidPathType as e:
             logger.info(
                 "Class %s.%s invalid: %s",
@@ -182,4 +1306,7 @@ def get_storage(init_path):
                 cls.__name__,
                 repr(e),
             )
+        else:
+            storage.lazy = lazy
+            return storage
     raise InvalidPathType(f"No valid storage type found for {init_path}")
@@ -1,8 +1,83 @@
+import os
 import pint
-import toml
 import typing
+import logging
+import threading
 
-default_unit_registry = pint.UnitRegistry()
+from stray_recipe_manager.cache import LRUCache, CacheStats
+
+
+logger = logging.getLogger(__name__)
+
+# Recipe units only, much faster to load than pint's full definitions but
+# without units recipes rarely use. Opt in with UNIT_DEFINITIONS_ENVIRON.
+UNIT_DEFINITIONS = os.path.join(os.path.dirname(__file__), "units.txt")
+# Definitions file for the default registry, "recipe" for UNIT_DEFINITIONS,
+# pint's own when unset or "full"
+UNIT_DEFINITIONS_ENVIRON = "STRAY_RECIPE_MANAGER_UNITS"
+
+# Building a registry takes a large part of startup, so the default one is
+# only built on first use, see get_default_unit_registry
+_default_unit_registry = None  # type: typing.Optional[pint.UnitRegistry]
+_default_unit_registry_lock = threading.Lock()
+
+
+def build_unit_registry(definitions=None, cache_folder=":auto:"):
+    # type: (typing.Optional[str], typing.Optional[str]) -> pint.UnitRegistry
+    """Unit registry from a definitions file, pint's own if None
+
+    Parsed definitions are cached in cache_folder between runs, ":auto:"
+    being pint's user cache directory and None disabling the cache.
+    """
+    if definitions is None:
+        # An empty name is pint's own, None would leave the registry empty
+        definitions = ""
+    if cache_folder is not None:
+        try:
+            return pint.UnitRegistry(definitions, cache_folder=cache_folder)
+        except TypeError:
+            # pint before 0.18 can not cache definitions
+            pass
+        except OSError as e:
+            logger.warning("Not caching unit definitions: %s", e)
+    return pint.UnitRegistry(definitions)
+
+
+def get_default_unit_registry():
+    # type: () -> pint.UnitRegistry
+    global _default_unit_registry
+    if _default_unit_registry is None:
+        with _default_unit_registry_lock:
+            if _default_unit_registry is None:
+                definitions = os.environ.get(
+                    UNIT_DEFINITIONS_ENVIRON
+                )  # type: typing.Optional[str]
+                if definitions == "full":
+                    definitions = None
+                elif definitions == "recipe":
+                    definitions = UNIT_DEFINITIONS
+                _default_unit_registry = build_unit_registry(definitions)
+    return _default_unit_registry
+
+
+def __getattr__(name):
+    # type: (str) -> typing.Any
+    if name == "default_unit_registry":
+        return get_default_unit_registry()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+if typing.TYPE_CHECKING:
+    # Quantity.units is typed as this base class of pint.Unit
+    from pint.facets.plain import PlainUnit as QuantityUnits
+else:
+    QuantityUnits = pint.Unit
+
+# (kind, string, required dimensionality)
+ParseKey = typing.Tuple[str, str, typing.Optional[str]]
+# (category, identifier, source unit) -> (preferred unit, multiplier)
+PlanKey = typing.Tuple[str, typing.Optional[str], QuantityUnits]
+PlanEntry = typing.Tuple[pint.Unit, typing.Optional[float]]
 
 
 class InvalidData(Exception):
@@ -14,16 +89,40 @@ class InvalidConversion(Exception):
 
 
 class UnitHandler:
-    __slots__ = ["densities", "unit_registry", "tolerance"]
+    __slots__ = [
+        "densities",
+        "unit_registry",
+        "tolerance",
+        "parse_cache",
+        "revision",
+    ]
 
-    def __init__(self, unit_registry=default_unit_registry, tolerance=1e-3):
-        # type: (pint.UnitRegistry, float) -> None
+    def __init__(
+        self,
+        unit_registry=None,  # type: typing.Optional[pint.UnitRegistry]
+        tolerance=1e-3,  # type: float
+        parse_cache_size=4096,  # type: typing.Optional[int]
+    ):
+        # type: (...) -> None
         self.densities = {}  # type: typing.Dict["str", pint.Quantity]
+        if unit_registry is None:
+            unit_registry = get_default_unit_registry()
         self.unit_registry = unit_registry
         self.tolerance = tolerance
+        # Bumped whenever densities change, to invalidate conversion plans
+        self.revision = 0
+        # Parsed quantities and units are shared between all callers, so
+        # they must never be modified in place (e.g. with Quantity.ito)
+        self.parse_cache = LRUCache(
+            parse_cache_size
+        )  # type: LRUCache[ParseKey, typing.Any]
 
     def parse_quantity(self, quantity, dimensionality=None):
         # type: (str, typing.Optional[str]) -> pint.Quantity
+        key = ("quantity", quantity, dimensionality)
+        q = self.parse_cache.get(key)
+        if q is not None:
+            return q
         q = self.unit_registry.parse_expression(quantity)
         if dimensionality is not None and not q.check(dimensionality):
             raise InvalidData(
@@ -31,10 +130,15 @@ class UnitHandler:
                 f"dimensionality {dimensionality} "
                 f"(actually {q.dimensionality})"
             )
+        self.parse_cache.put(key, q)
         return q
 
     def parse_unit(self, unit, dimensionality=None):
-        # type: (str, typing.Optional[str]) -> pint.Quantity
+        # type: (str, typing.Optional[str]) -> pint.Unit
+        key = ("unit", unit, dimensionality)
+        u = self.parse_cache.get(key)
+        if u is not None:
+            return u
         u = self.unit_registry.parse_units(unit)
         if (dimensionality is not None) and (
             not u.dimensionality
@@ -45,12 +149,35 @@ class UnitHandler:
                 f"dimensionality {dimensionality} "
                 f"(actually {u.dimensionality})"
             )
+        self.parse_cache.put(key, u)
         return u
 
+    def load_quantity(self, value, dimensionality=None):
+        # type: (typing.Any, typing.Optional[str]) -> pint.Quantity
+        """Quantity from a string or a magnitude and unit mapping"""
+        if isinstance(value, str):
+            return self.parse_quantity(value, dimensionality)
+        try:
+            magnitude, unit = value["magnitude"], value["unit"]
+        except (TypeError, KeyError):
+            raise InvalidData(f"Invalid quantity {value!r}")
+        if not isinstance(magnitude, (int, float)) or isinstance(
+            magnitude, bool
+        ):
+            raise InvalidData(f"Invalid magnitude in quantity {value!r}")
+        return self.unit_registry.Quantity(
+            magnitude, self.parse_unit(unit, dimensionality)
+        )
+
+    def parse_cache_stats(self):
+        # type: () -> CacheStats
+        return self.parse_cache.stats()
+
     def add_density(self, item, density):
         # type: (str, pint.Quantity) -> None
         if item not in self.densities:
             self.densities[item] = density
+            self.revision += 1
         else:
             curr_density = self.densities[item]
             if abs(curr_density - density) > self.tolerance * curr_density:
@@ -66,6 +193,16 @@ class UnitHandler:
     def clear_densities(self):
         # type: () -> None
         self.densities = {}
+        self.revision += 1
+
+    def replace_densities(self, densities):
+        # type: (typing.Dict[str, pint.Quantity]) -> None
+        """Swap in a complete set of densities in one step
+
+        Readers see either the old or the new densities, never a mixture.
+        """
+        self.densities = densities
+        self.revision += 1
 
     def do_conversion(
         self,
@@ -96,11 +233,84 @@ class UnitHandler:
             raise InvalidConversion("Unable to convert")
 
 
+class ConversionPlan:
+    """Constant conversion factors for a fixed set of unit preferences
+
+    Factors are worked out on first use for each (category, identifier,
+    source unit) and remain valid until the densities of the unit handler or
+    the preferences change, at which point UnitPreferences builds a new plan.
+    """
+
+    def __init__(self, prefs):
+        # type: (UnitPreferences) -> None
+        self.prefs = prefs
+        self.unit_handler = prefs.unit_handler
+        self.quantity_cls = self.unit_handler.unit_registry.Quantity
+        self.handler_revision = self.unit_handler.revision
+        self.prefs_revision = prefs.revision
+        self.factors = {}  # type: typing.Dict[PlanKey, PlanEntry]
+
+    def is_current(self):
+        # type: () -> bool
+        return (
+            self.handler_revision == self.unit_handler.revision
+            and self.prefs_revision == self.prefs.revision
+        )
+
+    def lookup(
+        self,
+        unit,  # type: QuantityUnits
+        category,  # type: typing.Optional[str]
+        identifier,  # type: typing.Optional[str]
+    ):
+        # type: (...) -> typing.Optional[PlanEntry]
+        if category is None:
+            return None
+        key = (category, identifier, unit)
+        try:
+            return self.factors[key]
+        except KeyError:
+            pass
+        out_unit = self.prefs.get_unit_preference(category)
+        if out_unit is None:
+            return None
+        factor = self.unit_handler.do_conversion(
+            self.quantity_cls(1.0, unit), out_unit, identifier
+        ).magnitude
+        zero = self.unit_handler.do_conversion(
+            self.quantity_cls(0.0, unit), out_unit, identifier
+        ).magnitude
+        # Offset units (e.g. temperatures) can not use a plain multiplier
+        entry = (out_unit, float(factor) if zero == 0 else None)
+        self.factors[key] = entry
+        return entry
+
+    def convert(
+        self,
+        quantity,  # type: pint.Quantity
+        category,  # type: typing.Optional[str]
+        identifier,  # type: typing.Optional[str]
+        scale=1.0,  # type: float
+    ):
+        # type: (...) -> pint.Quantity
+        entry = self.lookup(quantity.units, category, identifier)
+        if entry is None:
+            return scale * quantity
+        out_unit, factor = entry
+        if factor is None:
+            return scale * self.unit_handler.do_conversion(
+                quantity, out_unit, identifier
+            )
+        return self.quantity_cls(quantity.magnitude * factor * scale, out_unit)
+
+
 class UnitPreferences:
     def __init__(self, unit_handler):
         # type: (UnitHandler) -> None
         self.unit_handler = unit_handler
         self.preferences = {}  # type: typing.Dict[str, pint.Unit]
+        self.revision = 0
+        self.plan = None  # type: typing.Optional[ConversionPlan]
 
     def set_unit_preference(self, category, unit):
         # type: (str, typing.Optional[pint.Unit]) -> None
@@ -109,6 +319,7 @@ class UnitPreferences:
         else:
             if category in self.preferences:
                 del self.preferences[category]
+        self.revision += 1
 
     def get_unit_preference(self, category):
         # type: (str) -> typing.Optional[pint.Unit]
@@ -117,9 +328,23 @@ class UnitPreferences:
     def clear_unit_preferences(self):
         # type: () -> None
         self.preferences = {}
+        self.revision += 1
+
+    def cache_key(self):
+        # type: () -> typing.Tuple[typing.Tuple[str, str], ...]
+        return tuple(sorted((k, str(v)) for k, v in self.preferences.items()))
+
+    def conversion_plan(self):
+        # type: () -> ConversionPlan
+        plan = self.plan
+        if plan is None or not plan.is_current():
+            plan = self.plan = ConversionPlan(self)
+        return plan
 
     def load_from_toml_file(self, io):
         # type: (typing.TextIO) -> None
-        data = toml.load(io)
+        from stray_recipe_manager.storage import get_toml_codec
+
+        data = get_toml_codec().load(io)
         for k, v in data["units"].items():
             self.set_unit_preference(k, self.unit_handler.parse_unit(v))
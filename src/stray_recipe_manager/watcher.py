@@ -0,0 +1,592 @@
+import os
+import time
+import errno
+import select
+import struct
+import typing
+import weakref
+import logging
+import pathlib
+import threading
+
+import attr
+import pint
+
+from stray_recipe_manager.recipe import Recipe
+from stray_recipe_manager.search import RecipeIndex
+from stray_recipe_manager.interning import Interner
+from stray_recipe_manager.units import UnitHandler, InvalidData
+from stray_recipe_manager.storage import (
+    BaseStorage,
+    DirectoryStorage,
+    FileSignature,
+    InvalidPathType,
+    RecipeVersion,
+    TOMLCoding,
+    file_signature,
+)
+
+
+logger = logging.getLogger(__name__)
+
+# From <sys/inotify.h>
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+# Not IN_MODIFY, files are read once they are closed
+WATCH_MASK = (
+    IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+)
+# Everything but the contents of the recipe directory is rescanned
+RESCAN_MASK = IN_DELETE_SELF | IN_MOVE_SELF | IN_Q_OVERFLOW | IN_IGNORED
+# wd, mask, cookie, name length
+INOTIFY_EVENT = struct.Struct("iIII")
+
+Densities = typing.Dict[str, pint.Quantity]
+
+
+@attr.attrs(frozen=True, slots=True)
+class Changes(object):
+    # The config file may have changed
+    config = attr.ib(default=False, type=bool, kw_only=True)
+    # Keys of recipes that may have changed
+    recipes = attr.ib(
+        default=frozenset(), type=typing.FrozenSet[str], kw_only=True
+    )
+    # Anything may have changed, compare every file
+    rescan = attr.ib(default=False, type=bool, kw_only=True)
+
+    def __bool__(self):
+        # type: () -> bool
+        return self.config or self.rescan or bool(self.recipes)
+
+    def merge(self, other):
+        # type: (Changes) -> Changes
+        return Changes(
+            config=self.config or other.config,
+            recipes=self.recipes | other.recipes,
+            rescan=self.rescan or other.rescan,
+        )
+
+
+class PollingWatcher:
+    """Asks for a full rescan every interval seconds"""
+
+    def __init__(self, interval=1.0):
+        # type: (float) -> None
+        self.interval = interval
+        self.next_scan = time.monotonic() + interval
+
+    def poll(self, timeout):
+        # type: (float) -> Changes
+        wait = self.next_scan - time.monotonic()
+        if wait > timeout:
+            time.sleep(timeout)
+            return Changes()
+        time.sleep(max(wait, 0.0))
+        self.next_scan = time.monotonic() + self.interval
+        return Changes(rescan=True)
+
+    def close(self):
+        # type: () -> None
+        pass
+
+
+class InotifyWatcher:
+    """Changes to the config file and recipe files, from Linux inotify"""
+
+    def __init__(self, config_file, recipe_dir):
+        # type: (pathlib.Path, pathlib.Path) -> None
+        import ctypes
+        import ctypes.util
+
+        libc = ctypes.CDLL(
+            ctypes.util.find_library("c") or "libc.so.6", use_errno=True
+        )
+        # Raises AttributeError without inotify support
+        init, add_watch = libc.inotify_init1, libc.inotify_add_watch
+        add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.config_name = os.fsencode(config_file.name)
+        self.fd = init(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = {}  # type: typing.Dict[int, str]
+        try:
+            for kind, path in [
+                ("config", config_file.parent),
+                ("recipes", recipe_dir),
+            ]:
+                wd = add_watch(self.fd, os.fsencode(str(path)), WATCH_MASK)
+                if wd < 0:
+                    err = ctypes.get_errno()
+                    raise OSError(err, os.strerror(err), str(path))
+                self.watches[wd] = kind
+        except OSError:
+            os.close(self.fd)
+            raise
+
+    def poll(self, timeout):
+        # type: (float) -> Changes
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return Changes()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return Changes()
+            raise
+        return self.parse_events(data)
+
+    def parse_events(self, data):
+        # type: (bytes) -> Changes
+        config = rescan = False
+        recipes = set()
+        offset = 0
+        while offset + INOTIFY_EVENT.size <= len(data):
+            wd, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+            if mask & RESCAN_MASK:
+                rescan = True
+            elif self.watches.get(wd) == "config":
+                if name == self.config_name:
+                    config = True
+            elif self.watches.get(wd) == "recipes":
+                if name.endswith(b".toml"):
+                    recipes.add(os.fsdecode(name[: -len(b".toml")]))
+        return Changes(
+            config=config, recipes=frozenset(recipes), rescan=rescan
+        )
+
+    def close(self):
+        # type: () -> None
+        if self.fd >= 0:
+            fd, self.fd = self.fd, -1
+            os.close(fd)
+
+
+def create_watcher(config_file, recipe_dir, interval=1.0):
+    # type: (pathlib.Path, pathlib.Path, float) -> typing.Any
+    try:
+        return InotifyWatcher(config_file, recipe_dir)
+    except (OSError, AttributeError) as e:
+        logger.info("No inotify (%s), polling every %.1fs", e, interval)
+        return PollingWatcher(interval)
+
+
+@attr.attrs(frozen=True, slots=True)
+class BookView(object):
+    """Everything requests read from a watched book, at one point in time
+
+    Views are never changed once published. Updates build a new view that
+    shares everything unchanged with the old one.
+    """
+
+    keys = attr.ib(type=typing.Tuple[str, ...], kw_only=True)
+    recipes = attr.ib(
+        type=typing.Dict[str, typing.Tuple[FileSignature, Recipe]],
+        kw_only=True,
+    )
+    # Densities each recipe defines, only for recipes defining any
+    recipe_densities = attr.ib(type=typing.Dict[str, Densities], kw_only=True)
+    # Recipes that failed to load, with the error message
+    errors = attr.ib(
+        type=typing.Dict[str, typing.Tuple[FileSignature, str]], kw_only=True
+    )
+    config_signature = attr.ib(
+        type=typing.Optional[FileSignature], kw_only=True
+    )
+    config_densities = attr.ib(type=Densities, kw_only=True)
+    tolerance = attr.ib(type=float, kw_only=True)
+    # Config densities and recipe densities merged, with the tolerance. Each
+    # view has its own, so conversions only see densities of their view.
+    unit_handler = attr.ib(type=UnitHandler, kw_only=True)
+    index = attr.ib(type=RecipeIndex, kw_only=True)
+
+
+def empty_view(unit_registry):
+    # type: (pint.UnitRegistry) -> BookView
+    return BookView(
+        keys=(),
+        recipes={},
+        recipe_densities={},
+        errors={},
+        config_signature=None,
+        config_densities={},
+        tolerance=1e-3,
+        unit_handler=UnitHandler(unit_registry),
+        index=RecipeIndex(),
+    )
+
+
+class BookSnapshot(BaseStorage):
+    """Read-only storage over one view of a watched book"""
+
+    def __init__(self, storage, view):
+        # type: (WatchedStorage, BookView) -> None
+        self.storage = storage
+        self.view = view
+
+    @classmethod
+    def from_path_str(cls, dirpath_str):
+        # type: (str) -> BookSnapshot
+        raise InvalidPathType("Book snapshots come from a WatchedStorage")
+
+    def location(self):
+        # type: () -> str
+        return self.storage.location()
+
+    def snapshot(self):
+        # type: () -> BookSnapshot
+        return self
+
+    def load_errors(self):
+        # type: () -> typing.Dict[str, str]
+        return {key: error for key, (_, error) in self.view.errors.items()}
+
+    def get_unit_handler(self):
+        # type: () -> UnitHandler
+        return self.view.unit_handler
+
+    def recipe_keys(self):
+        # type: () -> typing.Iterator[str]
+        return iter(self.view.keys)
+
+    def sorted_recipe_keys(self):
+        # type: () -> typing.Sequence[str]
+        return self.view.keys
+
+    def get_recipe(self, recipe_key):
+        # type: (str) -> Recipe
+        try:
+            return self.view.recipes[recipe_key][1]
+        except KeyError:
+            raise KeyError("No recipe for '{}'".format(recipe_key))
+
+    def recipe_version(self, recipe_key):
+        # type: (str) -> RecipeVersion
+        try:
+            signature = self.view.recipes[recipe_key][0]
+        except KeyError:
+            raise KeyError("No recipe for '{}'".format(recipe_key))
+        return RecipeVersion(
+            tag="{:x}-{:x}-{:x}".format(*signature),
+            modified=signature[0] / 1e9,
+        )
+
+    def get_index(self):
+        # type: () -> RecipeIndex
+        return self.view.index
+
+
+class WatchedStorage(BaseStorage):
+    """Directory storage kept in memory and refreshed as files change
+
+    Every recipe is loaded up front. A background thread then watches the
+    book and reloads only the recipes, index entries and densities affected
+    by each change, publishing the result as a new BookView. Reads use
+    whichever view is current without taking any lock, and snapshot() gives
+    readers that need several reads to agree a single view.
+
+    The thread is started on first use in each process, so that forked
+    server workers each watch the book themselves.
+    """
+
+    # Seconds to wait for more changes before reloading
+    settle_time = 0.05
+    # Seconds the watcher thread blocks at most, and so takes to stop
+    poll_timeout = 0.5
+
+    def __init__(self, storage, poll_interval=1.0):
+        # type: (DirectoryStorage, float) -> None
+        self.storage = storage
+        self.poll_interval = poll_interval
+        unit_registry = storage.get_unit_handler().unit_registry
+        # Densities of one recipe at a time are loaded here
+        self.loader = UnitHandler(unit_registry)
+        self.toml_coding = TOMLCoding(self.loader)
+        self.interner = Interner()  # type: Interner
+        self.view = empty_view(unit_registry)
+        self.closed = False
+        self.reset_watch()
+        self.refresh()
+        _watched.add(self)
+
+    @classmethod
+    def from_path_str(cls, dirpath_str):
+        # type: (str) -> WatchedStorage
+        raise InvalidPathType("Watched storage wraps a DirectoryStorage")
+
+    def location(self):
+        # type: () -> str
+        return self.storage.location()
+
+    def reset_watch(self):
+        # type: () -> None
+        """Forget the watcher thread, which a forked child does not have"""
+        # Locks held by other threads at fork time are never released
+        self.start_lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.thread = None  # type: typing.Optional[threading.Thread]
+        watcher = getattr(self, "watcher", None)
+        if watcher is not None:
+            watcher.close()
+        self.watcher = None  # type: typing.Any
+
+    def current_view(self):
+        # type: () -> BookView
+        if self.thread is None and not self.closed:
+            self.start()
+        return self.view
+
+    def snapshot(self):
+        # type: () -> BookSnapshot
+        return BookSnapshot(self, self.current_view())
+
+    def start(self):
+        # type: () -> None
+        with self.start_lock:
+            if self.thread is not None:
+                return
+            self.watcher = create_watcher(
+                self.storage.unit_handler_config,
+                self.storage.recipe_dir,
+                self.poll_interval,
+            )
+            thread = threading.Thread(
+                target=self.run, name="recipe-watcher", daemon=True
+            )
+            thread.start()
+            self.thread = thread
+
+    def close(self):
+        # type: () -> None
+        with self.start_lock:
+            self.closed = True
+            if self.thread is None:
+                return
+            self.stopping.set()
+            self.thread.join()
+            self.thread = None
+            self.watcher.close()
+            self.watcher = None
+
+    def run(self):
+        # type: () -> None
+        # Catch up with changes made before the watch was set up
+        changes = Changes(rescan=True)
+        while not self.stopping.is_set():
+            if changes:
+                # Editors and version control change several files at once
+                time.sleep(self.settle_time)
+                changes = changes.merge(self.watcher.poll(0.0))
+                try:
+                    self.refresh(changes)
+                except Exception:
+                    logger.exception("Unable to refresh recipe book")
+            changes = self.watcher.poll(self.poll_timeout)
+
+    def load_recipe(self, key):
+        # type: (str) -> typing.Tuple[Recipe, Densities]
+        self.loader.clear_densities()
+        with self.storage.recipe_path(key).open("r") as f:
+            recipe = self.toml_coding.load_recipe_from_toml_file(f)
+        return self.interner.recipe(recipe), self.loader.densities
+
+    def refresh(self, changes=None):
+        # type: (typing.Optional[Changes]) -> bool
+        """Publish a new view with the changed files, rescan all if None
+
+        Returns whether anything changed.
+        """
+        if changes is None:
+            changes = Changes(rescan=True)
+        with self.refresh_lock:
+            view = self.view
+            update = {}  # type: typing.Dict[str, typing.Any]
+            if changes.config or changes.rescan:
+                update.update(self.refresh_config(view))
+            if changes.rescan:
+                keys = set(self.storage.recipe_keys())
+                keys.update(view.recipes, view.errors)
+            else:
+                keys = set(changes.recipes)
+            update.update(self.refresh_recipes(view, sorted(keys)))
+            if not update:
+                return False
+            view = attr.evolve(view, **update)
+            view = attr.evolve(
+                view, unit_handler=self.merged_unit_handler(view)
+            )
+            # Publishing is a single assignment, readers get the old view
+            # or the new one, densities included
+            self.view = view
+            logger.info("Recipe book refreshed, %d recipes", len(view.keys))
+            return True
+
+    def refresh_config(self, view):
+        # type: (BookView) -> typing.Dict[str, typing.Any]
+        path = self.storage.unit_handler_config
+        try:
+            signature = file_signature(path)
+        except KeyError:
+            logger.warning("Config file %s is missing", path)
+            return {}
+        if signature == view.config_signature:
+            return {}
+        try:
+            with path.open("r") as f:
+                unit_handler = TOMLCoding.load_unit_handler_toml(f)
+        except Exception as e:
+            logger.warning("Keeping config, unable to load %s: %s", path, e)
+            return {}
+        return {
+            "config_signature": signature,
+            "config_densities": dict(unit_handler.densities),
+            "tolerance": unit_handler.tolerance,
+        }
+
+    def refresh_recipes(
+        self,
+        view,  # type: BookView
+        keys,  # type: typing.Iterable[str]
+    ):
+        # type: (...) -> typing.Dict[str, typing.Any]
+        recipes = None  # type: typing.Optional[typing.Dict[str, typing.Any]]
+        recipe_densities = dict(view.recipe_densities)
+        errors = dict(view.errors)
+        index = None  # type: typing.Optional[RecipeIndex]
+        for key in keys:
+            try:
+                signature = file_signature(
+                    self.storage.recipe_path(key)
+                )  # type: typing.Optional[FileSignature]
+            except KeyError:
+                signature = None
+            current = view.recipes.get(key, view.errors.get(key))
+            if current is not None and current[0] == signature:
+                continue
+            if recipes is None:
+                # Copied on the first change only
+                recipes = dict(view.recipes)
+                index = view.index.copy()
+            assert index is not None
+            recipes.pop(key, None)
+            recipe_densities.pop(key, None)
+            errors.pop(key, None)
+            index.remove(key)
+            if signature is None:
+                continue
+            try:
+                recipe, densities = self.load_recipe(key)
+            except Exception as e:
+                logger.warning("Unable to load recipe %s: %s", key, e)
+                errors[key] = (signature, str(e))
+                continue
+            recipes[key] = (signature, recipe)
+            if densities:
+                recipe_densities[key] = densities
+            index.add(key, recipe, signature)
+        if recipes is None:
+            return {}
+        return {
+            "keys": tuple(sorted(recipes)),
+            "recipes": recipes,
+            "recipe_densities": recipe_densities,
+            "errors": errors,
+            "index": index,
+        }
+
+    def merged_unit_handler(self, view):
+        # type: (BookView) -> UnitHandler
+        merged = UnitHandler(
+            self.loader.unit_registry, tolerance=view.tolerance
+        )
+        for identifier, density in view.config_densities.items():
+            merged.add_density(identifier, density)
+        for key in sorted(view.recipe_densities):
+            for identifier, density in view.recipe_densities[key].items():
+                try:
+                    merged.add_density(identifier, density)
+                except InvalidData as e:
+                    logger.warning("Ignoring density in %s: %s", key, e)
+        return merged
+
+    def load_errors(self):
+        # type: () -> typing.Dict[str, str]
+        return self.snapshot().load_errors()
+
+    def get_unit_handler(self):
+        # type: () -> UnitHandler
+        return self.current_view().unit_handler
+
+    def recipe_keys(self):
+        # type: () -> typing.Iterator[str]
+        return iter(self.current_view().keys)
+
+    def sorted_recipe_keys(self):
+        # type: () -> typing.Sequence[str]
+        return self.current_view().keys
+
+    def get_recipe(self, recipe_key):
+        # type: (str) -> Recipe
+        return self.snapshot().get_recipe(recipe_key)
+
+    def recipe_version(self, recipe_key):
+        # type: (str) -> RecipeVersion
+        return self.snapshot().recipe_version(recipe_key)
+
+    def get_index(self):
+        # type: () -> RecipeIndex
+        return self.current_view().index
+
+    def write_recipe(self, recipe_key, recipe, overwrite=False):
+        # type: (str, Recipe, bool) -> None
+        self.storage.write_recipe(recipe_key, recipe, overwrite)
+        # Readers should see their own writes without waiting on the watcher
+        self.refresh(Changes(recipes=frozenset([recipe_key])))
+
+    def write_unit_handler(self, unit_handler):
+        # type: (UnitHandler) -> None
+        self.storage.write_unit_handler(unit_handler)
+        self.refresh(Changes(config=True))
+
+
+# Every WatchedStorage, to reset after a fork
+_watched = weakref.WeakSet()  # type: weakref.WeakSet[WatchedStorage]
+
+
+def _reset_after_fork():
+    # type: () -> None
+    for storage in list(_watched):
+        storage.reset_watch()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def watch_storage(storage, poll_interval=1.0):
+    # type: (BaseStorage, float) -> WatchedStorage
+    if not isinstance(storage, DirectoryStorage):
+        raise ValueError(
+            f"Only recipe directories can be watched, not {storage.location()}"
+        )
+    return WatchedStorage(storage, poll_interval)
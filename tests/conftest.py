@@ -0,0 +1,76 @@
+import pathlib
+import pytest
+
+
+BOILING_WATER = """\
+name = "Boiling Water"
+tools = ["Saucepan"]
+tags = ["basic"]
+
+[makes]
+item = "Boiling water"
+quantity = "1 cup"
+
+[[ingredients]]
+item = "Water"
+quantity = "1 cup"
+identifier = "water"
+category = "liquid_bulk"
+
+[[steps]]
+description = "Place water on stove until boiling"
+time = "10 min"
+"""
+
+PLAIN_RICE = """\
+name = "Plain Rice"
+comments = "Rinse the rice well"
+references = ["Rice cooker manual"]
+tools = ["Saucepan", "Sieve"]
+tags = ["basic", "side"]
+
+[makes]
+item = "Cooked rice"
+quantity = "3 cup"
+
+[[ingredients]]
+item = "White rice, rinsed"
+quantity = "1 cup"
+identifier = "rice"
+category = "solid_bulk"
+
+[[ingredients]]
+item = "Water"
+quantity = "3/2 cup"
+identifier = "water"
+category = "liquid_bulk"
+
+[[ingredients]]
+item = "Salt"
+quantity = "1/2 tsp"
+identifier = "salt"
+category = "seasoning"
+
+[[steps]]
+description = "Bring water and salt to a boil"
+
+[[steps]]
+description = "Add rice, cover and simmer"
+time = "18 min"
+
+[densities]
+rice = "180 grams/cup"
+"""
+
+
+@pytest.fixture
+def recipe_book(tmp_path):
+    # type: (pathlib.Path) -> pathlib.Path
+    book = tmp_path / "book"
+    (book / "recipes").mkdir(parents=True)
+    (book / "config.toml").write_text(
+        'tolerance = 0.001\n\n[densities]\nwater = "240 grams/cup"\n'
+    )
+    (book / "recipes" / "boiling_water.toml").write_text(BOILING_WATER)
+    (book / "recipes" / "plain_rice.toml").write_text(PLAIN_RICE)
+    return book
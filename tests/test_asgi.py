@@ -0,0 +1,87 @@
+import asyncio
+
+from stray_recipe_manager.asgi import create_asgi_app
+
+
+def call(app, path, query_string=b"", headers=()):
+    sent = []
+    requests = [{"type": "http.request", "body": b"", "more_body": False}]
+
+    async def receive():
+        return requests.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": path,
+        "query_string": query_string,
+        "headers": list(headers),
+        "http_version": "1.1",
+        "scheme": "http",
+        "server": ("localhost", 5000),
+        "client": ("127.0.0.1", 1234),
+    }
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(app(scope, receive, send))
+    finally:
+        loop.close()
+    start, body = sent
+    return start["status"], dict(start["headers"]), body["body"]
+
+
+def test_asgi_routes(recipe_book):
+    app = create_asgi_app(str(recipe_book), "localhost", threads=2)
+    status, headers, body = call(app, "/recipe/plain_rice.html")
+    assert status == 200
+    assert headers[b"content-type"].startswith(b"text/html")
+    assert b"Plain Rice" in body
+
+    status, _, _ = call(
+        app,
+        "/recipe/plain_rice.html",
+        headers=[(b"if-none-match", headers[b"etag"])],
+    )
+    assert status == 304
+
+    status, _, body = call(app, "/search", b"tag=side")
+    assert status == 200 and b"plain_rice.html" in body
+
+    status, _, _ = call(app, "/recipe/missing.html")
+    assert status == 404
+
+
+def test_asgi_concurrent_requests(recipe_book):
+    app = create_asgi_app(
+        str(recipe_book), "localhost", threads=4, concurrency=2
+    )
+
+    async def one(path):
+        sent = []
+
+        async def receive():
+            return {"type": "http.request", "body": b""}
+
+        async def send(message):
+            sent.append(message)
+
+        await app(
+            {"type": "http", "method": "GET", "path": path, "headers": []},
+            receive,
+            send,
+        )
+        return sent[0]["status"]
+
+    async def many():
+        paths = ["/recipe/boiling_water.html", "/recipe/plain_rice.html", "/"]
+        return await asyncio.gather(*(one(p) for p in paths * 10))
+
+    loop = asyncio.new_event_loop()
+    try:
+        statuses = loop.run_until_complete(many())
+    finally:
+        loop.close()
+    assert statuses == [200] * 30
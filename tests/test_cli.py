@@ -0,0 +1,45 @@
+import pytest
+
+from stray_recipe_manager.cli import parse_args
+
+
+def run(*args):
+    parsed = parse_args([str(arg) for arg in args])
+    parsed.func(parsed)
+
+
+def test_book_print_single(recipe_book, tmp_path):
+    output = tmp_path / "out.md"
+    run("book", recipe_book, "print", "plain_rice", "-o", output)
+    text = output.read_text()
+    assert text.startswith("### Plain Rice\n")
+    assert "Boiling Water" not in text
+
+
+def test_book_print_patterns(recipe_book, tmp_path):
+    output = tmp_path / "out.md"
+    run("book", recipe_book, "print", "plain_*", "boil*", "-o", output)
+    text = output.read_text()
+    assert text.index("### Plain Rice") < text.index("### Boiling Water")
+
+    with pytest.raises(KeyError):
+        run("book", recipe_book, "print", "missing_*", "-o", output)
+
+
+def test_book_print_all_to_dir(recipe_book, tmp_path):
+    out_dir = tmp_path / "printed"
+    run(
+        "book",
+        recipe_book,
+        "print",
+        "--all",
+        "--format",
+        "text/html",
+        "--output-dir",
+        out_dir,
+    )
+    assert sorted(p.name for p in out_dir.iterdir()) == [
+        "boiling_water.html",
+        "plain_rice.html",
+    ]
+    assert "<h3>Plain Rice</h3>" in (out_dir / "plain_rice.html").read_text()
@@ -0,0 +1,87 @@
+import attr
+import pytest
+from decimal import Decimal
+
+import stray_recipe_manager.units
+import stray_recipe_manager.storage
+from stray_recipe_manager.columnar import ColumnarStorage
+from stray_recipe_manager.recipe import Recipe, Ingredient, RecipeStep
+
+
+ureg = stray_recipe_manager.units.default_unit_registry
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_columnar_storage(recipe_book, jobs):
+    storage = stray_recipe_manager.storage.get_storage(str(recipe_book))
+    columnar = ColumnarStorage.load(storage, jobs=jobs)
+    assert len(columnar) == 2
+    assert columnar.sorted_recipe_keys() == ["boiling_water", "plain_rice"]
+    for key in columnar.recipe_keys():
+        recipe = columnar.get_recipe(key)
+        assert recipe == storage.get_recipe(key)
+        assert type(recipe) is type(storage.get_recipe(key))
+    rice = columnar.get_recipe("plain_rice")
+    assert str(rice.makes.quantity) == "3 cup"
+    assert columnar.get_unit_handler().get_density("rice") is not None
+    assert columnar.find_recipes(tools=["sieve"]) == ["plain_rice"]
+    with pytest.raises(KeyError):
+        columnar.get_recipe("missing")
+
+
+def test_columnar_interning():
+    columnar = ColumnarStorage(stray_recipe_manager.units.UnitHandler())
+    for i in range(10):
+        columnar.add_recipe(
+            f"water_{i}",
+            Recipe(
+                name="Boiling Water",
+                makes=Ingredient(item="Boiling water", quantity=i * ureg.cup),
+                tags=["basic"],
+                ingredients=[
+                    Ingredient(
+                        item="Water",
+                        quantity=0.5 * ureg.cup,
+                        identifier="water",
+                    )
+                ],
+                steps=[RecipeStep(description="Boil", time=10 * ureg.min)],
+            ),
+        )
+    assert len(columnar.strings) == 6
+    assert columnar.quantities.units == [ureg.cup]
+    assert str(columnar.get_recipe("water_3").makes.quantity) == "3 cup"
+    assert columnar.get_recipe("water_3").steps[0].time == 10 * ureg.min
+    with pytest.raises(KeyError):
+        columnar.add_recipe("water_1", columnar.get_recipe("water_1"))
+
+
+def test_columnar_rejected_recipe():
+    columnar = ColumnarStorage(stray_recipe_manager.units.UnitHandler())
+    water = Recipe(
+        name="Boiling Water",
+        makes=Ingredient(item="Boiling water", quantity=2 ** 60 * ureg.cup),
+        ingredients=[Ingredient(item="Water", quantity=1 * ureg.cup)],
+        steps=[RecipeStep(description="Boil", time=10 * ureg.min)],
+    )
+    columnar.add_recipe("water", water)
+    # Integers beyond what a float holds exactly come back unchanged
+    assert columnar.get_recipe("water") == water
+    big = (2 ** 60 + 1) * ureg.cup
+    columnar.add_recipe(
+        "big", attr.evolve(water, makes=Ingredient(item="Big", quantity=big))
+    )
+    assert columnar.get_recipe("big").makes.quantity.magnitude == 2 ** 60 + 1
+
+    sizes = [len(columnar), len(columnar.strings), columnar.nbytes()]
+    broken = attr.evolve(
+        water,
+        name="Broken",
+        steps=[RecipeStep(description="Wait", time=Decimal(2) * ureg.min)],
+    )
+    with pytest.raises(TypeError):
+        columnar.add_recipe("broken", broken)
+    assert [len(columnar), len(columnar.strings), columnar.nbytes()] == sizes
+    assert "broken" not in columnar.sorted_recipe_keys()
+    columnar.add_recipe("water_2", water)
+    assert columnar.get_recipe("water_2") == water
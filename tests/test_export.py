@@ -0,0 +1,81 @@
+import os
+import pytest
+
+from stray_recipe_manager.storage import get_storage
+from stray_recipe_manager.export import export_html, MANIFEST_NAME
+import stray_recipe_manager.export
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_export_html(recipe_book, tmp_path, monkeypatch, jobs):
+    # Small chunks so two jobs really use the process pool
+    monkeypatch.setattr(stray_recipe_manager.export, "CHUNK_SIZE", 1)
+    out_dir = tmp_path / "site"
+    stats = export_html(get_storage(str(recipe_book)), out_dir, jobs=jobs)
+    assert (stats.rendered, stats.unchanged, stats.removed) == (2, 0, 0)
+    page = (out_dir / "recipe" / "plain_rice.html").read_text()
+    assert "Plain Rice" in page and "Rinse the rice well" in page
+    assert "boiling_water.html" in (out_dir / "index.html").read_text()
+    assert (out_dir / "static" / "style.css").exists()
+    assert (out_dir / MANIFEST_NAME).exists()
+
+    stats = export_html(get_storage(str(recipe_book)), out_dir, jobs=jobs)
+    assert (stats.rendered, stats.unchanged, stats.removed) == (0, 2, 0)
+
+    # A fresh checkout changes file times, but not contents
+    for path in (recipe_book / "recipes").iterdir():
+        os.utime(path, (1e9, 1e9))
+    stats = export_html(get_storage(str(recipe_book)), out_dir, jobs=jobs)
+    assert (stats.rendered, stats.unchanged, stats.removed) == (0, 2, 0)
+
+    path = recipe_book / "recipes" / "plain_rice.toml"
+    path.write_text(path.read_text().replace("Plain Rice", "Better Rice"))
+    (recipe_book / "recipes" / "boiling_water.toml").unlink()
+    stats = export_html(get_storage(str(recipe_book)), out_dir, jobs=jobs)
+    assert (stats.rendered, stats.unchanged, stats.removed) == (1, 0, 1)
+    page = (out_dir / "recipe" / "plain_rice.html").read_text()
+    assert "Better Rice" in page
+    assert not (out_dir / "recipe" / "boiling_water.html").exists()
+    assert "boiling_water" not in (out_dir / "index.html").read_text()
+
+
+def test_export_html_prefs_change(recipe_book, tmp_path):
+    out_dir = tmp_path / "site"
+    export_html(get_storage(str(recipe_book)), out_dir)
+    prefs = tmp_path / "prefs.toml"
+    prefs.write_text('[units]\nliquid_bulk = "milliliter"\n')
+    stats = export_html(
+        get_storage(str(recipe_book)), out_dir, prefs_file=str(prefs)
+    )
+    assert stats.rendered == 2
+    assert "milliliter" in (out_dir / "recipe" / "plain_rice.html").read_text()
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_export_html_failures(recipe_book, tmp_path, monkeypatch, jobs):
+    monkeypatch.setattr(stray_recipe_manager.export, "CHUNK_SIZE", 1)
+    recipes = recipe_book / "recipes"
+    # Sorted before plain_rice, which defines the density of rice
+    (recipes / "bowl.toml").write_text(
+        (recipes / "plain_rice.toml").read_text().split("[densities]")[0]
+    )
+    (recipes / "no_makes.toml").write_text(
+        (recipes / "boiling_water.toml")
+        .read_text()
+        .replace('[makes]\nitem = "Boiling water"\nquantity = "1 cup"\n', "")
+    )
+    prefs = tmp_path / "prefs.toml"
+    prefs.write_text('[units]\nsolid_bulk = "gram"\n')
+    out_dir = tmp_path / "site"
+    for rendered in [3, 0]:
+        stats = export_html(
+            get_storage(str(recipe_book)),
+            out_dir,
+            prefs_file=str(prefs),
+            jobs=jobs,
+        )
+        assert (stats.rendered, stats.failed) == (rendered, 1)
+        assert "180.00 gram" in (out_dir / "recipe" / "bowl.html").read_text()
+        assert not (out_dir / "recipe" / "no_makes.html").exists()
+        assert "no_makes" not in (out_dir / "index.html").read_text()
+        assert "no_makes" not in (out_dir / MANIFEST_NAME).read_text()
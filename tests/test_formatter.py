@@ -1,4 +1,5 @@
 import io
+import json
 import pytest
 import stray_recipe_manager.units
 from stray_recipe_manager.recipe import (
@@ -100,3 +101,120 @@ def test_recipe_format_md(recipe, formatted_str):
     fstream = io.StringIO()
     stray_recipe_manager.formatter.MarkdownWriter.write_recipe(fstream, recipe)
     assert fstream.getvalue() == formatted_str
+
+
+@pytest.mark.parametrize(
+    "quantity",
+    [
+        1 * ureg.cup,
+        0.5 * ureg.teaspoon,
+        (1 / 3) * ureg.gram / ureg.cup,
+        12.5 * ureg.minute,
+        1e-7 * ureg.kilogram,
+    ],
+)
+def test_quantity_formatter(quantity):
+    formatter = stray_recipe_manager.formatter.QuantityFormatter()
+    assert formatter.format(quantity) == str(quantity)
+    assert formatter.format(quantity) == str(quantity)
+
+
+@pytest.mark.parametrize(
+    "writer",
+    [
+        stray_recipe_manager.formatter.MarkdownWriter,
+        stray_recipe_manager.formatter.HTMLWriter,
+    ],
+)
+def test_iter_recipe(writer):
+    recipe = CommentedRecipe(
+        name="Boiling Water",
+        comments="Utterly basic",
+        references=["Common sense"],
+        makes=Ingredient(item="Boiling water", quantity=1.0 * ureg.cup),
+        tools=["Saucepan"],
+        ingredients=[
+            Ingredient(item="Water", quantity=1.0 * ureg.cup, notes="cold")
+        ],
+        steps=[
+            RecipeStep(
+                description="Place water on stove until boiling",
+                time=10 * ureg.minute,
+            )
+        ],
+    )
+    fstream = io.StringIO()
+    writer.write_recipe(fstream, recipe)
+    assert "".join(writer.iter_recipe(recipe)) == fstream.getvalue()
+    assert "1.0 cup Water, cold" in fstream.getvalue()
+    assert "(10 minute)" in fstream.getvalue()
+    assert "Common sense" in fstream.getvalue()
+
+
+@pytest.mark.parametrize(
+    "mimetype", ["application/json", "application/msgpack"]
+)
+def test_recipe_round_trip(mimetype):
+    if mimetype == "application/msgpack":
+        pytest.importorskip("msgpack")
+    unit_handler = stray_recipe_manager.units.UnitHandler()
+    recipes = [
+        Recipe(
+            name="Boiling Water",
+            makes=Ingredient(item="Boiling water", quantity=1.0 * ureg.cup),
+            tools=["Saucepan"],
+            ingredients=[Ingredient(item="Water", quantity=1.0 * ureg.cup)],
+            steps=[
+                RecipeStep(
+                    description="Place water on stove until boiling",
+                    time=10 * ureg.minute,
+                )
+            ],
+        ),
+        CommentedRecipe(
+            name="Salted Water",
+            comments="Utterly basic",
+            references=["Common sense"],
+            makes=Ingredient(item="Salted water", quantity=1.0 * ureg.cup),
+            ingredients=[
+                Ingredient(item="Water", quantity=1.0 * ureg.cup),
+                Ingredient(
+                    item="Salt",
+                    quantity=0.25 * ureg.teaspoon,
+                    notes="kosher",
+                ),
+            ],
+            steps=[RecipeStep(description="Stir")],
+        ),
+    ]
+    writer = stray_recipe_manager.formatter.get_writer(mimetype)
+    reader = stray_recipe_manager.formatter.get_reader(mimetype)
+    fstream = io.BytesIO() if writer.binary else io.StringIO()
+    for i, recipe in enumerate(recipes):
+        if i > 0:
+            fstream.write(writer.separator)
+        writer.write_recipe(fstream, recipe)
+    fstream.seek(0)
+    assert list(reader.iter_recipes(fstream, unit_handler)) == recipes
+
+
+def test_json_writer_structured_quantities():
+    recipe = Recipe(
+        name="Boiling Water",
+        makes=Ingredient(item="Boiling water", quantity=1.5 * ureg.cup),
+        ingredients=[],
+        steps=[],
+    )
+    fstream = io.StringIO()
+    stray_recipe_manager.formatter.JSONWriter.write_recipe(fstream, recipe)
+    data = json.loads(fstream.getvalue())
+    assert data["makes"]["quantity"] == {"magnitude": 1.5, "unit": "cup"}
+
+
+@pytest.mark.parametrize(
+    "value", [{"magnitude": "1", "unit": "cup"}, {"unit": "cup"}, [1, "cup"]]
+)
+def test_load_invalid_quantity(value):
+    unit_handler = stray_recipe_manager.units.UnitHandler()
+    with pytest.raises(stray_recipe_manager.units.InvalidData):
+        unit_handler.load_quantity(value)
@@ -0,0 +1,83 @@
+import gc
+import stray_recipe_manager.units
+import stray_recipe_manager.storage
+from stray_recipe_manager.interning import Interner
+from stray_recipe_manager.recipe import Recipe, Ingredient, RecipeStep
+
+
+ureg = stray_recipe_manager.units.default_unit_registry
+
+
+def make_recipe(name, quantity):
+    # Fresh strings, as a parser would create them
+    return Recipe(
+        name=name,
+        makes=Ingredient(
+            item="".join(["Boiling ", "water"]), quantity=quantity
+        ),
+        tags=["".join(["bas", "ic"])],
+        ingredients=[
+            Ingredient(
+                item="".join(["Wat", "er"]),
+                quantity=quantity,
+                identifier="water",
+            )
+        ],
+        steps=[RecipeStep(description="".join(["Bo", "il"]))],
+    )
+
+
+def test_interner():
+    interner = Interner()
+    first = interner.recipe(make_recipe("First", 1 * ureg.cup))
+    second = interner.recipe(make_recipe("Second", 1 * ureg.cup))
+    assert second == make_recipe("Second", 1 * ureg.cup)
+    assert second.ingredients[0] is first.ingredients[0]
+    assert second.steps[0] is first.steps[0]
+    assert second.tags[0] is first.tags[0]
+    stats = interner.stats()
+    assert stats.ingredients == 2 and stats.steps == 1
+    assert stats.hits >= 4
+    assert stats.bytes_saved > 0
+    # Nothing is shared by interning an interned recipe again
+    assert interner.recipe(second) == second
+    assert interner.stats().hits == stats.hits
+
+    # Equal quantities in other units or types are kept apart
+    for quantity in [16 * ureg.tbsp, 1.0 * ureg.cup]:
+        recipe = interner.recipe(make_recipe("Third", quantity))
+        assert recipe.ingredients[0] is not first.ingredients[0]
+        assert str(recipe.ingredients[0].quantity) == str(quantity)
+
+
+def test_storage_intern_stats(recipe_book):
+    storage = stray_recipe_manager.storage.get_storage(str(recipe_book))
+    list(storage.get_recipes())
+    stats = storage.intern_stats()
+    assert stats is not None
+    assert stats.hits > 0
+    boiling_water = storage.get_recipe("boiling_water")
+    plain_rice = storage.get_recipe("plain_rice")
+    assert boiling_water.tags[0] is plain_rice.tags[0]
+    assert boiling_water.tools[0] is plain_rice.tools[0]
+
+
+def test_storage_interns_cached_recipes(recipe_book):
+    storage = stray_recipe_manager.storage.DirectoryStorage(
+        recipe_book / "config.toml", recipe_book / "recipes", cache_size=0
+    )
+    list(storage.get_recipes())
+    stats = storage.intern_stats()
+    assert stats is not None
+    assert (stats.strings, stats.ingredients, stats.steps) == (0, 0, 0)
+
+
+def test_interner_drops_unused():
+    interner = Interner(max_strings=3)
+    recipe = interner.recipe(make_recipe("First", 1 * ureg.cup))
+    assert interner.stats().ingredients == 2
+    del recipe
+    gc.collect()
+    stats = interner.stats()
+    assert (stats.ingredients, stats.steps) == (0, 0)
+    assert stats.strings == 3
@@ -0,0 +1,84 @@
+import pytest
+import stray_recipe_manager.units
+import stray_recipe_manager.recipe
+from stray_recipe_manager.recipe import (
+    CommentedRecipe,
+    Recipe,
+    Ingredient,
+    RecipeStep,
+)
+
+
+ureg = stray_recipe_manager.units.default_unit_registry
+
+
+@pytest.fixture
+def prefs():
+    unit_handler = stray_recipe_manager.units.UnitHandler(ureg)
+    unit_handler.add_density("rice", 180 * ureg.g / ureg.cup)
+    prefs = stray_recipe_manager.units.UnitPreferences(unit_handler)
+    prefs.set_unit_preference("solid_bulk", ureg.gram)
+    prefs.set_unit_preference("seasoning", ureg.tsp)
+    return prefs
+
+
+RECIPES = [
+    Recipe(
+        name="Boiling Water",
+        makes=Ingredient(item="Boiling water", quantity=1.0 * ureg.cup),
+        tools=["Saucepan"],
+        ingredients=[
+            Ingredient(item="Water", quantity=1 * ureg.cup, category="water")
+        ],
+        steps=[RecipeStep(description="Place water on stove until boiling")],
+    ),
+    CommentedRecipe(
+        name="Plain Rice",
+        comments="Rinse the rice well",
+        makes=Ingredient(item="Cooked rice", quantity=3 * ureg.cup),
+        ingredients=[
+            Ingredient(
+                item="White rice",
+                quantity=1 * ureg.cup,
+                identifier="rice",
+                category="solid_bulk",
+            ),
+            Ingredient(
+                item="Salt", quantity=0.5 * ureg.tbsp, category="seasoning"
+            ),
+        ],
+        steps=[RecipeStep(description="Simmer", time=18 * ureg.min)],
+    ),
+]
+
+
+def test_present_recipe(prefs):
+    p_recipe = stray_recipe_manager.recipe.present_recipe(
+        RECIPES[1], prefs, 2.0
+    )
+    assert isinstance(p_recipe, CommentedRecipe)
+    assert p_recipe.makes.quantity == 6 * ureg.cup
+    assert p_recipe.ingredients[0].quantity == 360 * ureg.gram
+    assert str(p_recipe.ingredients[0].quantity.units) == "gram"
+    assert p_recipe.ingredients[1].quantity == 3 * ureg.tsp
+    assert p_recipe.steps == RECIPES[1].steps
+
+
+@pytest.mark.parametrize("use_numpy", [True, False])
+def test_present_recipes_matches_present_recipe(prefs, use_numpy, monkeypatch):
+    if use_numpy:
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(stray_recipe_manager.recipe, "numpy", None)
+    pairs = [(r, s) for s in (0.5, 1.0, 3.0) for r in RECIPES]
+    batch = stray_recipe_manager.recipe.present_recipes(pairs, prefs)
+    assert len(batch) == len(pairs)
+    for (recipe, scale), p_recipe in zip(pairs, batch):
+        expected = stray_recipe_manager.recipe.present_recipe(
+            recipe, prefs, scale
+        )
+        assert type(p_recipe) is type(expected)
+        assert p_recipe == expected
+        for a, b in zip(p_recipe.ingredients, expected.ingredients):
+            assert a.quantity.magnitude == b.quantity.magnitude
+            assert a.quantity.units == b.quantity.units
@@ -0,0 +1,160 @@
+import attr
+import json
+import stray_recipe_manager.units
+import stray_recipe_manager.search
+import stray_recipe_manager.storage
+from stray_recipe_manager.recipe import Recipe, Ingredient, RecipeStep
+
+
+ureg = stray_recipe_manager.units.default_unit_registry
+
+
+BUTTERED_NOODLES = Recipe(
+    name="Buttered Noodles",
+    makes=Ingredient(item="Noodles", quantity=2 * ureg.cup),
+    tools=["Dutch oven"],
+    tags=["Quick"],
+    ingredients=[
+        Ingredient(
+            item="Butter or neutral oil",
+            quantity=2 * ureg.tbsp,
+            identifier="butter",
+        ),
+        Ingredient(item="Egg noodles", quantity=200 * ureg.g),
+    ],
+    steps=[RecipeStep(description="Boil noodles, toss with butter")],
+)
+
+
+def test_recipe_index():
+    index = stray_recipe_manager.search.RecipeIndex()
+    index.add("noodles", BUTTERED_NOODLES)
+    assert index.find(ingredients=["butter"]) == ["noodles"]
+    assert index.find(ingredients=["Butter or neutral  oil"]) == ["noodles"]
+    assert index.find(ingredients=["noodles"], tags=["quick"]) == ["noodles"]
+    assert index.find(tools=["dutch oven"]) == ["noodles"]
+    assert index.find(tools=["dutch oven"], tags=["vegan"]) == []
+
+    loaded = stray_recipe_manager.search.RecipeIndex.from_dict(
+        json.loads(json.dumps(index.to_dict()))
+    )
+    assert loaded.find(ingredients=["butter"]) == ["noodles"]
+    loaded.remove("noodles")
+    assert len(loaded) == 0
+    assert loaded.postings == {"ingredient": {}, "tag": {}, "tool": {}}
+
+
+def test_recipe_index_copy():
+    index = stray_recipe_manager.search.RecipeIndex()
+    index.add("noodles", BUTTERED_NOODLES)
+    copy = index.copy()
+    copy.add(
+        "more_noodles", attr.evolve(BUTTERED_NOODLES, name="More Noodles")
+    )
+    copy.remove("noodles")
+    assert copy.find(ingredients=["butter"]) == ["more_noodles"]
+    assert [k for k, s in copy.search_text("noodles")] == ["more_noodles"]
+    # The original is untouched
+    assert index.find(ingredients=["butter"]) == ["noodles"]
+    assert [k for k, s in index.search_text("noodles")] == ["noodles"]
+
+    index.remove("noodles")
+    assert copy.find(tags=["quick"]) == ["more_noodles"]
+
+
+def test_directory_storage_index(recipe_book):
+    storage = stray_recipe_manager.storage.get_storage(str(recipe_book))
+    assert storage.find_recipes(tags=["basic"]) == [
+        "boiling_water",
+        "plain_rice",
+    ]
+    assert storage.find_recipes(ingredients=["rice"]) == ["plain_rice"]
+    assert (recipe_book / "index.json").exists()
+
+    storage.write_recipe("noodles", BUTTERED_NOODLES)
+    assert storage.find_recipes(ingredients=["butter"]) == ["noodles"]
+
+    # A fresh storage only re-indexes files that changed on disk
+    (recipe_book / "recipes" / "boiling_water.toml").unlink()
+    storage = stray_recipe_manager.storage.get_storage(str(recipe_book))
+    index = storage.load_index()
+    assert sorted(index.terms) == ["boiling_water", "noodles", "plain_rice"]
+    assert storage.find_recipes(tags=["basic"]) == ["plain_rice"]
+    assert storage.cache_stats().misses == 0
+
+
+def test_directory_storage_index_batch(recipe_book, monkeypatch):
+    storage = stray_recipe_manager.storage.get_storage(str(recipe_book))
+    storage.get_index()
+    saves = []
+    save = stray_recipe_manager.search.RecipeIndex.save
+    monkeypatch.setattr(
+        stray_recipe_manager.search.RecipeIndex,
+        "save",
+        lambda index, path: saves.append(path) or save(index, path),
+    )
+    storage.write_recipes(
+        [(f"noodles_{i}", BUTTERED_NOODLES) for i in range(5)]
+    )
+    assert saves == [recipe_book / "index.json"]
+    assert len(storage.find_recipes(ingredients=["butter"])) == 5
+    # Written atomically, without temporary files left behind
+    assert sorted(p.name for p in recipe_book.iterdir()) == [
+        "config.toml",
+        "index.json",
+        "recipes",
+    ]
+    index = stray_recipe_manager.search.RecipeIndex.load(
+        recipe_book / "index.json"
+    )
+    assert "noodles_4" in index
+
+
+def test_search_route(recipe_book):
+    from werkzeug.test import Client
+    from stray_recipe_manager.server import create_app
+
+    client = Client(create_app(str(recipe_book), "localhost"))
+    response = client.get("/search?tool=sieve&tag=")
+    assert response.status_code == 200
+    assert b"/recipe/plain_rice.html" in response.data
+    assert b"/recipe/boiling_water.html" not in response.data
+
+
+def test_text_search():
+    index = stray_recipe_manager.search.RecipeIndex()
+    index.add("noodles", BUTTERED_NOODLES)
+    index.add(
+        "boiled_noodles",
+        Recipe(
+            name="Boiled Noodles",
+            makes=Ingredient(item="Noodles", quantity=2 * ureg.cup),
+            ingredients=[Ingredient(item="Noodles", quantity=200 * ureg.g)],
+            steps=[
+                RecipeStep(description="Boil noodles until soft"),
+                RecipeStep(description="Drain the noodles"),
+            ],
+        ),
+    )
+    results = index.search_text("boiled noodles")
+    assert [key for key, score in results] == ["boiled_noodles", "noodles"]
+    assert results[0][1] > results[1][1] > 0
+    assert index.search_text("butter", within={"boiled_noodles"}) == []
+    assert index.search_text("the") == []
+
+    index.remove("boiled_noodles")
+    assert [k for k, s in index.search_text("noodles")] == ["noodles"]
+    assert index.total_text_length == sum(index.text_lengths.values())
+
+
+def test_directory_storage_text_search(recipe_book):
+    storage = stray_recipe_manager.storage.get_storage(str(recipe_book))
+    results = storage.search_text("rinse rice")
+    assert [key for key, score in results] == ["plain_rice"]
+    results = storage.search_text("water", tags=["basic"])
+    assert [key for key, score in results] == ["boiling_water", "plain_rice"]
+    assert [k for k, s in storage.search_text("water", tools=["sieve"])] == [
+        "plain_rice"
+    ]
+    storage.write_recipe("noodles", BUTTERED_NOODLES)
+    assert storage.search_text("toss")[0][0] == "noodles"
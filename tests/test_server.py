@@ -0,0 +1,169 @@
+import os
+import signal
+import pytest
+import urllib.request
+from functools import partial
+from werkzeug.test import Client
+
+from stray_recipe_manager.server import create_app
+from stray_recipe_manager.prefork import PreforkServer
+
+
+@pytest.fixture
+def client(recipe_book):
+    return Client(create_app(str(recipe_book), "localhost"))
+
+
+def test_view_recipe_conditional(client, recipe_book):
+    response = client.get("/recipe/plain_rice.html")
+    assert response.status_code == 200
+    assert b"Plain Rice" in response.data
+    etag, weak = response.get_etag()
+    assert etag and not weak
+    assert response.last_modified is not None
+    assert "must-revalidate" in response.headers["Cache-Control"]
+
+    response = client.get(
+        "/recipe/plain_rice.html", headers={"If-None-Match": f'"{etag}"'}
+    )
+    assert response.status_code == 304
+    assert response.data == b""
+
+    path = recipe_book / "recipes" / "plain_rice.toml"
+    path.write_text(path.read_text().replace("Plain Rice", "Better Rice"))
+    st = path.stat()
+    os.utime(str(path), ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    response = client.get(
+        "/recipe/plain_rice.html", headers={"If-None-Match": f'"{etag}"'}
+    )
+    assert response.status_code == 200
+    assert b"Better Rice" in response.data
+    assert response.get_etag()[0] != etag
+
+
+def test_view_recipe_page_cache(client):
+    first = client.get("/recipe/boiling_water.html")
+    second = client.get("/recipe/boiling_water.html")
+    assert first.data == second.data
+    assert first.get_etag() == second.get_etag()
+    app = client.application
+    assert app.page_cache.stats().hits >= 1
+
+
+def test_api_recipe(client):
+    response = client.get("/api/recipe/plain_rice.json")
+    assert response.status_code == 200
+    assert response.mimetype == "application/json"
+    data = response.get_json()
+    assert data["name"] == "Plain Rice"
+    assert set(data["makes"]["quantity"]) == {"magnitude", "unit"}
+    etag, _ = response.get_etag()
+    assert etag != client.get("/recipe/plain_rice.html").get_etag()[0]
+
+    response = client.get(
+        "/api/recipe/plain_rice.json", headers={"If-None-Match": f'"{etag}"'}
+    )
+    assert response.status_code == 304
+    assert client.get("/api/recipe/missing.json").status_code == 404
+
+    data = client.get("/api/recipes.json").get_json()
+    assert data["recipes"] == ["boiling_water", "plain_rice"]
+
+
+def test_view_missing_recipe(client):
+    assert client.get("/recipe/missing.html").status_code == 404
+
+
+def test_view_invalid_recipe(client, recipe_book):
+    # A recipe without makes is broken data, not a missing recipe
+    path = recipe_book / "recipes" / "no_makes.toml"
+    path.write_text(
+        (recipe_book / "recipes" / "boiling_water.toml")
+        .read_text()
+        .replace('[makes]\nitem = "Boiling water"\nquantity = "1 cup"\n', "")
+    )
+    assert "makes" not in path.read_text()
+    assert client.get("/recipe/no_makes.html").status_code == 500
+    assert client.get("/api/recipe/no_makes.json").status_code == 500
+
+
+def test_lazy_recipes(recipe_book):
+    path = recipe_book / "recipes" / "broken.toml"
+    path.write_text(
+        (recipe_book / "recipes" / "boiling_water.toml")
+        .read_text()
+        .replace('time = "10 min"', 'time = "10 cup"')
+    )
+    app = create_app(str(recipe_book), "localhost", lazy=True)
+    assert app.storage.lazy
+    client = Client(app)
+    response = client.get("/recipe/plain_rice.html")
+    assert response.status_code == 200
+    assert b"Plain Rice" in response.data
+    # Found on first use, instead of on loading
+    assert type(app.storage.get_recipe("broken")).__name__ == "LazyRecipe"
+    assert client.get("/recipe/broken.html").status_code == 500
+    assert client.get("/search?tag=basic").status_code == 200
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_index_pagination(recipe_book, stream):
+    for i in range(5):
+        (recipe_book / "recipes" / f"extra_{i}.toml").write_text(
+            (recipe_book / "recipes" / "boiling_water.toml").read_text()
+        )
+    client = Client(
+        create_app(str(recipe_book), "localhost", stream_templates=stream)
+    )
+    body = client.get("/?per_page=3").get_data(as_text=True)
+    assert "boiling_water.html" in body and "extra_1.html" in body
+    assert "extra_2.html" not in body
+    assert "Page 1 of 3" in body
+
+    body = client.get("/?per_page=3&page=3").get_data(as_text=True)
+    assert "plain_rice.html" in body and "extra_4.html" not in body
+
+    body = client.get("/?per_page=3&order=desc").get_data(as_text=True)
+    assert body.index("plain_rice.html") < body.index("extra_4.html")
+    assert "extra_2.html" not in body
+
+    (recipe_book / "recipes" / "extra_0.toml").unlink()
+    body = client.get("/?per_page=100").get_data(as_text=True)
+    assert "extra_0.html" not in body
+
+
+def test_preload(recipe_book):
+    app = create_app(str(recipe_book), "localhost")
+    assert app.preload() == 2
+    assert app.page_cache.stats().size == 2
+    response = Client(app).get("/recipe/plain_rice.html")
+    assert response.status_code == 200
+    assert app.page_cache.stats().hits == 1
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+def test_prefork_server(recipe_book):
+    server = PreforkServer(
+        partial(create_app, str(recipe_book), "localhost"),
+        "127.0.0.1",
+        0,
+        workers=2,
+    )
+    port = server.bind().getsockname()[1]
+    pid = os.fork()
+    if pid == 0:
+        try:
+            server.serve_forever()
+        finally:
+            os._exit(0)
+    server.sock.close()
+    try:
+        url = f"http://127.0.0.1:{port}/recipe/plain_rice.html"
+        for _ in range(4):
+            with urllib.request.urlopen(url, timeout=10) as response:
+                assert response.status == 200
+                assert b"Plain Rice" in response.read()
+    finally:
+        os.kill(pid, signal.SIGTERM)
+        _, status = os.waitpid(pid, 0)
+    assert status == 0
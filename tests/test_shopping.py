@@ -0,0 +1,64 @@
+import io
+import stray_recipe_manager.units
+import stray_recipe_manager.storage
+import stray_recipe_manager.shopping
+import stray_recipe_manager.recipe
+
+
+ureg = stray_recipe_manager.units.default_unit_registry
+
+
+def test_shopping_list(recipe_book):
+    storage = stray_recipe_manager.storage.get_storage(str(recipe_book))
+    prefs = stray_recipe_manager.units.UnitPreferences(
+        storage.get_unit_handler()
+    )
+    prefs.set_unit_preference("solid_bulk", ureg.gram)
+    prefs.set_unit_preference("liquid_bulk", ureg.ml)
+    selections = [("plain_rice", 2.0), ("boiling_water", 1.0)] + [
+        ("plain_rice", 0.5)
+    ] * 1000
+    items = stray_recipe_manager.shopping.build_shopping_list(
+        storage, selections, prefs
+    )
+    totals = {i.identifier: i.quantity for i in items}
+    assert set(totals) == {"rice", "water", "salt"}
+    assert abs(totals["rice"] - 502 * 180 * ureg.gram) < 1e-6 * ureg.gram
+    assert str(totals["water"].units) == "milliliter"
+    assert abs(totals["water"] - 754 * ureg.cup) < 1e-6 * ureg.cup
+    assert abs(totals["salt"] - 251 * ureg.tsp) < 1e-6 * ureg.tsp
+
+    fstream = io.StringIO()
+    stray_recipe_manager.shopping.write_shopping_list(fstream, items)
+    assert fstream.getvalue().startswith("#### liquid_bulk\n\n-    ")
+
+
+def test_shopping_list_canonical_units(recipe_book):
+    storage = stray_recipe_manager.storage.get_storage(str(recipe_book))
+    unit_handler = storage.get_unit_handler()
+    builder = stray_recipe_manager.shopping.ShoppingListBuilder(
+        stray_recipe_manager.units.UnitPreferences(unit_handler)
+    )
+    builder.add_recipe(storage.get_recipe("plain_rice"))
+    recipe = storage.get_recipe("boiling_water")
+    builder.add_recipe(
+        stray_recipe_manager.recipe.Recipe(
+            name="More water",
+            makes=recipe.makes,
+            ingredients=[
+                stray_recipe_manager.recipe.Ingredient(
+                    item="Water",
+                    quantity=240 * ureg.gram,
+                    identifier="water",
+                    category="liquid_bulk",
+                ),
+                stray_recipe_manager.recipe.Ingredient(
+                    item="Mystery", quantity=1 * ureg.kg, category="solid_bulk"
+                ),
+            ],
+            steps=[],
+        )
+    )
+    items = {i.item: i.quantity for i in builder.items()}
+    assert abs(items["Water"] - 2.5 * ureg.cup) < 1e-6 * ureg.cup
+    assert items["Mystery"] == 1 * ureg.kg
@@ -7,6 +7,8 @@ from stray_recipe_manager.recipe import (
     Recipe,
     Ingredient,
     RecipeStep,
+    present_recipe,
+    _UNPARSED,
 )
 
 
@@ -77,3 +79,207 @@ def test_recipe_round_trip(recipe, toml_coding):
     print(fstream.getvalue())
     n_recipe = toml_coding.load_recipe_from_toml_file(fstream)
     assert recipe == n_recipe
+
+
+@pytest.mark.parametrize("reader", stray_recipe_manager.storage.TOML_READERS)
+@pytest.mark.parametrize("writer", stray_recipe_manager.storage.TOML_WRITERS)
+def test_toml_codecs(recipe_book, reader, writer):
+    try:
+        codec = stray_recipe_manager.storage.TOMLCodec.create(reader, writer)
+    except ImportError:
+        pytest.skip(f"{reader} or {writer} not installed")
+    reference = stray_recipe_manager.storage.TOMLCodec.create("toml", "toml")
+    for path in sorted((recipe_book / "recipes").glob("*.toml")):
+        with path.open("r") as f:
+            data = codec.load(f)
+        with path.open("r") as f:
+            assert data == reference.load(f)
+
+        # Files written by either codec read back the same
+        written = []
+        for dump_codec in [codec, reference]:
+            unit_handler = stray_recipe_manager.units.UnitHandler(ureg)
+            coding = stray_recipe_manager.storage.TOMLCoding(
+                unit_handler, dump_codec
+            )
+            with path.open("r") as f:
+                recipe = coding.load_recipe_from_toml_file(f)
+            fstream = io.StringIO()
+            coding.write_recipe_to_toml_file(
+                fstream, recipe, include_densities=True
+            )
+            assert "None" not in fstream.getvalue()
+            fstream.seek(0)
+            written.append(reference.load(fstream))
+            fstream.seek(0)
+            assert coding.load_recipe_from_toml_file(fstream) == recipe
+        assert written[0] == written[1]
+
+
+def test_directory_storage_cache(recipe_book):
+    storage = stray_recipe_manager.storage.get_storage(str(recipe_book))
+    assert sorted(storage.recipe_keys()) == ["boiling_water", "plain_rice"]
+    recipe = storage.get_recipe("plain_rice")
+    assert isinstance(recipe, CommentedRecipe)
+    assert storage.get_unit_handler().get_density("rice") is not None
+    assert storage.get_recipe("plain_rice") is recipe
+    stats = storage.cache_stats()
+    assert (stats.hits, stats.misses, stats.size) == (1, 1, 1)
+
+    path = recipe_book / "recipes" / "plain_rice.toml"
+    path.write_text(path.read_text().replace("Plain Rice", "Better Rice"))
+    assert storage.get_recipe("plain_rice").name == "Better Rice"
+    assert storage.cache_stats().misses == 2
+
+    with pytest.raises(KeyError):
+        storage.get_recipe("missing")
+
+
+def test_directory_storage_cache_bound(recipe_book):
+    storage = stray_recipe_manager.storage.DirectoryStorage(
+        recipe_book / "config.toml", recipe_book / "recipes", cache_size=1
+    )
+    storage.get_recipe("plain_rice")
+    storage.get_recipe("boiling_water")
+    storage.get_recipe("plain_rice")
+    stats = storage.cache_stats()
+    assert (stats.hits, stats.misses, stats.size) == (0, 3, 1)
+
+
+def test_directory_storage_lazy(recipe_book):
+    eager = stray_recipe_manager.storage.get_storage(str(recipe_book))
+    storage = stray_recipe_manager.storage.DirectoryStorage(
+        recipe_book / "config.toml", recipe_book / "recipes", lazy=True
+    )
+    prefs = stray_recipe_manager.units.UnitPreferences(
+        storage.get_unit_handler()
+    )
+    for key in ["boiling_water", "plain_rice"]:
+        recipe = storage.get_recipe(key)
+        expected = eager.get_recipe(key)
+        assert isinstance(recipe, type(expected))
+        assert recipe.name == expected.name and recipe.tags == expected.tags
+        assert recipe._steps is _UNPARSED
+        assert recipe == expected and expected == recipe
+        assert recipe.to_dict() == expected.to_dict()
+        assert present_recipe(recipe, prefs, 2) == present_recipe(
+            expected, prefs, 2
+        )
+    assert storage.get_unit_handler().get_density("rice") is not None
+    assert storage.get_recipe("plain_rice") is recipe
+
+
+def test_snapshot_round_trip(recipe_book, tmp_path):
+    storage = stray_recipe_manager.storage.get_storage(str(recipe_book))
+    snapshot_path = tmp_path / "book.snapshot"
+    stray_recipe_manager.storage.write_snapshot(storage, snapshot_path)
+
+    snapshot = stray_recipe_manager.storage.get_storage(str(snapshot_path))
+    assert isinstance(snapshot, stray_recipe_manager.storage.SnapshotStorage)
+    assert list(snapshot.recipe_keys()) == sorted(storage.recipe_keys())
+    for key, recipe in snapshot.recipes():
+        assert recipe == storage.get_recipe(key)
+        assert type(recipe) is type(storage.get_recipe(key))
+    assert snapshot.get_unit_handler().densities == (
+        storage.get_unit_handler().densities
+    )
+    with pytest.raises(KeyError):
+        snapshot.get_recipe("missing")
+    snapshot.close()
+
+
+def test_sqlite_storage_migration(recipe_book, tmp_path):
+    storage = stray_recipe_manager.storage.get_storage(str(recipe_book))
+    db_path = tmp_path / "book.sqlite"
+    stray_recipe_manager.storage.copy_recipe_book(
+        storage, stray_recipe_manager.storage.create_storage(str(db_path))
+    )
+
+    sqlite = stray_recipe_manager.storage.get_storage(str(db_path))
+    assert isinstance(sqlite, stray_recipe_manager.storage.SqliteStorage)
+    assert list(sqlite.recipe_keys()) == sorted(storage.recipe_keys())
+    for key, recipe in sqlite.recipes():
+        assert recipe == storage.get_recipe(key)
+        assert type(recipe) is type(storage.get_recipe(key))
+    assert sqlite.get_unit_handler().densities == (
+        storage.get_unit_handler().densities
+    )
+    assert sqlite.find_recipes(tags=["basic"], tools=["sieve"]) == [
+        "plain_rice"
+    ]
+    assert sqlite.find_recipes(ingredients=["water"]) == [
+        "boiling_water",
+        "plain_rice",
+    ]
+    assert sqlite.search_text("rinse")[0][0] == "plain_rice"
+
+    with pytest.raises(KeyError):
+        sqlite.write_recipes(
+            [
+                ("new", storage.get_recipe("boiling_water")),
+                ("plain_rice", storage.get_recipe("boiling_water")),
+            ]
+        )
+    assert "new" not in list(sqlite.recipe_keys())
+    sqlite.write_recipe(
+        "plain_rice", storage.get_recipe("boiling_water"), overwrite=True
+    )
+    assert sqlite.get_recipe("plain_rice").name == "Boiling Water"
+    assert sqlite.find_recipes(tools=["sieve"]) == []
+    assert sqlite.search_text("rinse") == []
+
+    back_path = tmp_path / "back"
+    stray_recipe_manager.storage.copy_recipe_book(
+        sqlite, stray_recipe_manager.storage.create_storage(str(back_path))
+    )
+    back = stray_recipe_manager.storage.get_storage(str(back_path))
+    assert back.get_recipe("boiling_water") == storage.get_recipe(
+        "boiling_water"
+    )
+    assert back.get_unit_handler().densities == (
+        storage.get_unit_handler().densities
+    )
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_get_recipes(recipe_book, jobs):
+    recipes = recipe_book / "recipes"
+    rice = recipes / "plain_rice.toml"
+    for i in range(5):
+        (recipes / f"rice_{i}.toml").write_text(rice.read_text())
+    (recipes / "rice_3.toml").write_text(
+        rice.read_text().replace("180 grams/cup", "200 grams/cup")
+    )
+    serial = stray_recipe_manager.storage.get_storage(str(recipe_book))
+    storage = stray_recipe_manager.storage.get_storage(str(recipe_book))
+
+    errors = []
+    loaded = list(
+        storage.get_recipes(
+            jobs=jobs, on_error=lambda key, e: errors.append((key, e))
+        )
+    )
+    assert [key for key, _ in loaded] == [
+        "boiling_water",
+        "plain_rice",
+        "rice_0",
+        "rice_1",
+        "rice_2",
+        "rice_4",
+    ]
+    for key, recipe in loaded:
+        assert recipe == serial.get_recipe(key)
+        assert type(recipe) is type(serial.get_recipe(key))
+    # The first rice recipe sets the density, the conflicting one fails
+    assert [key for key, _ in errors] == ["rice_3"]
+    assert isinstance(errors[0][1], stray_recipe_manager.units.InvalidData)
+    assert storage.get_unit_handler().get_density("rice") == ureg.Quantity(
+        180, "grams/cup"
+    )
+
+    with pytest.raises(stray_recipe_manager.units.InvalidData):
+        list(
+            stray_recipe_manager.storage.get_storage(
+                str(recipe_book)
+            ).get_recipes(jobs=jobs)
+        )
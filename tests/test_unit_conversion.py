@@ -1,4 +1,5 @@
 import pytest
+import pint
 
 import stray_recipe_manager.units
 
@@ -93,3 +94,77 @@ def test_fail_conversion(
 
     assert exc_str in str(excinfo.value)
     unit_handler.clear_densities()
+
+
+def test_unit_handler_parse_cache():
+    unit_handler = stray_recipe_manager.units.UnitHandler(ureg)
+    q = unit_handler.parse_quantity("250 g", "[mass]")
+    assert unit_handler.parse_quantity("250 g", "[mass]") is q
+    assert unit_handler.parse_unit("cup") is unit_handler.parse_unit("cup")
+    with pytest.raises(stray_recipe_manager.units.InvalidData):
+        unit_handler.parse_quantity("250 g", "[length]**3")
+    stats = unit_handler.parse_cache_stats()
+    assert (stats.hits, stats.misses, stats.size) == (2, 3, 2)
+
+    uncached = stray_recipe_manager.units.UnitHandler(ureg, parse_cache_size=0)
+    assert uncached.parse_quantity("250 g") == q
+    assert uncached.parse_cache_stats().size == 0
+
+
+def test_conversion_plan_invalidation():
+    unit_handler = stray_recipe_manager.units.UnitHandler(ureg)
+    prefs = stray_recipe_manager.units.UnitPreferences(unit_handler)
+    prefs.set_unit_preference("solid_bulk", ureg.gram)
+    plan = prefs.conversion_plan()
+    assert plan.convert(2 * ureg.cup, None, "rice") == 2 * ureg.cup
+    assert plan.convert(1 * ureg.kg, "solid_bulk", None, 2.0) == (
+        2000 * ureg.gram
+    )
+    with pytest.raises(stray_recipe_manager.units.InvalidConversion):
+        plan.convert(2 * ureg.cup, "solid_bulk", "rice")
+    assert prefs.conversion_plan() is plan
+
+    unit_handler.add_density("rice", 180 * ureg.g / ureg.cup)
+    plan = prefs.conversion_plan()
+    assert plan.convert(2 * ureg.cup, "solid_bulk", "rice") == 360 * ureg.g
+    assert plan.lookup(ureg.cup, "solid_bulk", "rice") == (ureg.gram, 180.0)
+
+    prefs.set_unit_preference("solid_bulk", ureg.kg)
+    assert prefs.conversion_plan() is not plan
+    assert prefs.conversion_plan().convert(
+        2 * ureg.cup, "solid_bulk", "rice"
+    ) == (0.36 * ureg.kg)
+
+
+def test_recipe_unit_definitions(tmp_path):
+    full = stray_recipe_manager.units.build_unit_registry(None, None)
+    for cache in [tmp_path, tmp_path]:
+        trimmed = stray_recipe_manager.units.build_unit_registry(
+            stray_recipe_manager.units.UNIT_DEFINITIONS, str(cache)
+        )
+        for text, unit in [
+            ("1/2 tsp", "cup"),
+            ("2 tbsp", "ml"),
+            ("250 g", "oz"),
+            ("240 grams/cup", "kg/l"),
+            ("10 min", "hour"),
+            ("4 count", "count"),
+            ("3 lb", "g"),
+        ]:
+            quantity = trimmed.parse_expression(text)
+            expected = full.parse_expression(text)
+            assert str(quantity) == str(expected)
+            assert quantity.to(unit).magnitude == pytest.approx(
+                expected.to(unit).magnitude
+            )
+        assert trimmed.parse_expression("2 pinch").to("tsp").magnitude == (
+            pytest.approx(1 / 8)
+        )
+        assert trimmed.parse_expression("1 stick").to("cup").magnitude == (
+            pytest.approx(1 / 2)
+        )
+        with pytest.raises(pint.errors.UndefinedUnitError):
+            trimmed.parse_units("furlong")
+    # Only used when asked for, the default registry has all of pint's units
+    default = stray_recipe_manager.units.get_default_unit_registry()
+    assert str(default.parse_units("furlong")) == "furlong"
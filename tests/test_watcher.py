@@ -0,0 +1,163 @@
+import os
+import time
+import pytest
+from werkzeug.test import Client
+
+import stray_recipe_manager.storage
+from stray_recipe_manager.server import create_app
+from stray_recipe_manager.watcher import (
+    Changes,
+    InotifyWatcher,
+    WatchedStorage,
+    watch_storage,
+)
+
+
+def touch(path, text):
+    path.write_text(text)
+    # Make sure the signature changes on coarse mtime filesystems
+    st = path.stat()
+    os.utime(str(path), ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+
+
+@pytest.fixture
+def watched(recipe_book):
+    storage = watch_storage(
+        stray_recipe_manager.storage.get_storage(str(recipe_book))
+    )
+    # Refreshed by hand, without a watcher thread
+    storage.closed = True
+    return storage
+
+
+def test_watched_storage_refresh(watched, recipe_book):
+    recipes = recipe_book / "recipes"
+    view = watched.view
+    assert watched.sorted_recipe_keys() == ("boiling_water", "plain_rice")
+    assert str(watched.get_unit_handler().get_density("rice")) == (
+        "180.0 gram / cup"
+    )
+    assert not watched.refresh()
+
+    touch(
+        recipes / "plain_rice.toml",
+        (recipes / "plain_rice.toml")
+        .read_text()
+        .replace("Plain Rice", "Better Rice"),
+    )
+    (recipes / "noodles.toml").write_text(
+        (recipes / "boiling_water.toml")
+        .read_text()
+        .replace("Boiling Water", "Noodles")
+        .replace('"basic"', '"quick"')
+    )
+    (recipes / "boiling_water.toml").unlink()
+    assert watched.refresh(
+        Changes(recipes=frozenset(["plain_rice", "noodles", "boiling_water"]))
+    )
+    assert watched.sorted_recipe_keys() == ("noodles", "plain_rice")
+    assert watched.get_recipe("plain_rice").name == "Better Rice"
+    assert watched.find_recipes(tags=["quick"]) == ["noodles"]
+    with pytest.raises(KeyError):
+        watched.get_recipe("boiling_water")
+
+    # The old view is unchanged
+    assert view.keys == ("boiling_water", "plain_rice")
+    assert view.recipes["plain_rice"][1].name == "Plain Rice"
+    assert view.index.find(tags=["quick"]) == []
+
+
+def test_watched_storage_densities(watched, recipe_book):
+    snapshot = watched.snapshot()
+    touch(
+        recipe_book / "config.toml",
+        '[densities]\nwater = "250 grams/cup"\nsalt = "290 grams/cup"\n',
+    )
+    assert watched.refresh(Changes(config=True))
+    unit_handler = watched.get_unit_handler()
+    assert str(unit_handler.get_density("water")) == "250.0 gram / cup"
+    assert unit_handler.get_density("salt") is not None
+    assert unit_handler.get_density("rice") is not None
+
+    (recipe_book / "recipes" / "plain_rice.toml").unlink()
+    watched.refresh()
+    assert watched.get_unit_handler().get_density("rice") is None
+    assert unit_handler.get_density("rice") is not None
+
+    # Densities are published with their view, a snapshot keeps its own
+    old_handler = snapshot.get_unit_handler()
+    assert str(old_handler.get_density("water")) == "240.0 gram / cup"
+    assert old_handler.get_density("salt") is None
+    assert snapshot.get_recipe("plain_rice").name == "Plain Rice"
+    assert "plain_rice" not in watched.sorted_recipe_keys()
+
+
+def test_watched_storage_errors(watched, recipe_book):
+    path = recipe_book / "recipes" / "broken.toml"
+    path.write_text("name = ")
+    watched.refresh()
+    assert "broken" in watched.load_errors()
+    assert "broken" not in watched.sorted_recipe_keys()
+    # Not loaded again until the file changes
+    assert not watched.refresh()
+
+    touch(path, (recipe_book / "recipes" / "boiling_water.toml").read_text())
+    assert watched.refresh()
+    assert watched.load_errors() == {}
+    assert watched.get_recipe("broken").name == "Boiling Water"
+
+
+def test_watched_server(recipe_book):
+    client = Client(create_app(str(recipe_book), "localhost", watch=True))
+    storage = client.application.storage
+    assert isinstance(storage, WatchedStorage)
+    try:
+        response = client.get("/recipe/plain_rice.html")
+        etag, _ = response.get_etag()
+        path = recipe_book / "recipes" / "plain_rice.toml"
+        touch(path, path.read_text().replace("Plain Rice", "Better Rice"))
+        # Whichever of the watcher thread and this refresh gets there first
+        storage.refresh()
+        response = client.get(
+            "/recipe/plain_rice.html", headers={"If-None-Match": f'"{etag}"'}
+        )
+        assert response.status_code == 200
+        assert b"Better Rice" in response.data
+
+        # Config densities are part of the page validators
+        etag, _ = response.get_etag()
+        touch(
+            recipe_book / "config.toml",
+            '[densities]\nwater = "250 grams/cup"\n',
+        )
+        storage.refresh()
+        response = client.get(
+            "/recipe/plain_rice.html", headers={"If-None-Match": f'"{etag}"'}
+        )
+        assert response.status_code == 200
+    finally:
+        storage.close()
+
+
+def test_watcher_thread(recipe_book):
+    try:
+        InotifyWatcher(
+            recipe_book / "config.toml", recipe_book / "recipes"
+        ).close()
+    except (OSError, AttributeError):
+        pytest.skip("No inotify support")
+    storage = watch_storage(
+        stray_recipe_manager.storage.get_storage(str(recipe_book))
+    )
+    try:
+        # The watch is set up before this returns
+        storage.current_view()
+        (recipe_book / "recipes" / "noodles.toml").write_text(
+            (recipe_book / "recipes" / "boiling_water.toml").read_text()
+        )
+        deadline = time.monotonic() + 10
+        while "noodles" not in storage.sorted_recipe_keys():
+            assert time.monotonic() < deadline
+            time.sleep(0.02)
+    finally:
+        storage.close()